@@ -0,0 +1,104 @@
+import math
+import time
+from collections import OrderedDict
+
+
+def _unit(vector: list[float]) -> list[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else list(vector)
+
+
+class SemanticAnswerCache:
+    """
+    Caches LLM answers for near-duplicate questions.
+
+    A cached answer is reused only when the retrieved article set is exactly
+    the same, it was generated the same way (`variant`, e.g. the model and
+    answer length) and the query embeddings are at least `similarity_threshold`
+    cosine-similar, so a paraphrase never gets an answer built from different
+    sources or cut to another length. Entries expire after `ttl_seconds`, the oldest are evicted past
+    `max_entries`, and everything is dropped when the index version changes.
+
+    Only touched from the event loop, so it needs no locking.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, ttl_seconds: float = 86400,
+                 max_entries: int = 512):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.index_version = None
+        self._entries = OrderedDict()  # entry id -> entry dict, oldest first
+        self._by_articles = {}  # (frozenset of article ids, variant) -> set of entry ids
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def ensure_version(self, index_version):
+        """Drop every entry if the collection was re-ingested since they were stored"""
+        if index_version != self.index_version:
+            if self._entries:
+                self.invalidations += 1
+            self.clear()
+            self.index_version = index_version
+
+    def clear(self):
+        self._entries.clear()
+        self._by_articles.clear()
+
+    def lookup(self, query_embedding: list[float], article_ids, variant=None) -> str | None:
+        key = (frozenset(article_ids), variant)
+        now = time.time()
+        best_answer, best_similarity = None, self.similarity_threshold
+        query_unit = None
+        for entry_id in list(self._by_articles.get(key, ())):
+            entry = self._entries[entry_id]
+            if now - entry["created_at"] > self.ttl_seconds:
+                self._remove(entry_id)
+                continue
+            if query_unit is None:
+                query_unit = _unit(query_embedding)
+            similarity = sum(a * b for a, b in zip(query_unit, entry["embedding"]))
+            if similarity >= best_similarity:
+                best_answer, best_similarity = entry["answer"], similarity
+
+        if best_answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return best_answer
+
+    def store(self, query_embedding: list[float], article_ids, answer: str, variant=None):
+        key = (frozenset(article_ids), variant)
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = {
+            "embedding": _unit(query_embedding),
+            "articles": key,
+            "answer": answer,
+            "created_at": time.time()
+        }
+        self._by_articles.setdefault(key, set()).add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        bucket = self._by_articles.get(entry["articles"])
+        if bucket is not None:
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._by_articles[entry["articles"]]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "similarity_threshold": self.similarity_threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -3,11 +3,133 @@ import requests
 import json
 import os
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # --- Configuration ---
 load_dotenv()  # Load environment variables from .env file
 FASTAPI_URL = os.getenv("FASTAPI_URL", "http://127.0.0.1:8000/query")  # URL of your FastAPI backend
+# Streaming (server-sent events) variant of the query endpoint
+FASTAPI_STREAM_URL = os.getenv("FASTAPI_STREAM_URL", FASTAPI_URL.rstrip("/") + "/stream")
+# Conversation sessions on the backend (DELETE <url>/<session_id> forgets one)
+FASTAPI_SESSIONS_URL = os.getenv("FASTAPI_SESSIONS_URL", FASTAPI_URL.rstrip("/").rsplit("/", 1)[0] + "/sessions")
 API_SECRET_KEY = os.getenv("API_SECRET_KEY")
+# Keep-alive connections to the backend, shared by every browser session
+HTTP_POOL_SIZE = int(os.getenv("UI_HTTP_POOL_SIZE", "10"))
+# Messages rendered on each rerun; older ones are shown a page at a time on request
+HISTORY_PAGE_SIZE = int(os.getenv("UI_HISTORY_PAGE_SIZE", "20"))
+SOURCE_PREVIEW_CHARS = 300
+
+
+def iter_sse_events(response):
+    """Parse a text/event-stream response into (event, data) pairs as they arrive"""
+    event_name, data_lines = "message", []
+    # chunk_size=None hands lines over as soon as they are received instead of buffering
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        if not line:
+            if data_lines:
+                yield event_name, json.loads("\n".join(data_lines))
+            event_name, data_lines = "message", []
+        elif line.startswith("event:"):
+            event_name = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """
+    One pooled keep-alive session for every browser session and rerun, so a
+    question reuses an open connection instead of paying a TCP/TLS handshake.
+    """
+    session = requests.Session()
+    # Only failed connection attempts are retried: the request never reached the API
+    retries = Retry(total=2, connect=2, read=0, status=0, other=0, backoff_factor=0.2)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"X-API-Key": API_SECRET_KEY or ""})
+    return session
+
+
+def compact_sources(retrieved_sources: list[dict]) -> list[dict]:
+    """What the chat history keeps of each source: article, header and a short preview"""
+    compact = []
+    for source in retrieved_sources:
+        text = " ".join(source.get("document", "").split())
+        compact.append({
+            "article_number": source.get("metadata", {}).get("article_number", "Bilinmeyen Madde"),
+            "article_header": source.get("metadata", {}).get("article_header", "Başlık Yok"),
+            "preview": text[:SOURCE_PREVIEW_CHARS] + ("…" if len(text) > SOURCE_PREVIEW_CHARS else "")
+        })
+    return compact
+
+
+def sources_markdown(sources: list[dict]) -> str:
+    """All sources of a message as one markdown block, built once when the message is stored"""
+    return "\n\n".join(
+        f"**Kaynak {i + 1}: {source['article_number']} - {source['article_header']}**  \n> {source['preview']}"
+        for i, source in enumerate(sources)
+    )
+
+
+def render_message(message: dict):
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+        if message.get("sources"):
+            with st.expander(f"Bilgi Alınan Kaynaklar ({len(message['sources'])})", expanded=False):
+                st.markdown(message["sources_markdown"])
+
+
+def end_session():
+    """Forget the backend conversation; the next question starts a new one"""
+    if st.session_state.session_id:
+        try:
+            get_http_session().delete(f"{FASTAPI_SESSIONS_URL}/{st.session_state.session_id}", timeout=5)
+        except requests.exceptions.RequestException:
+            pass  # it expires on its own
+    st.session_state.session_id = None
+
+
+def assistant_message(answer: str, sources: list[dict]) -> dict:
+    return {
+        "role": "assistant",
+        "content": answer,
+        "sources": sources,  # Store compact sources with the message
+        "sources_markdown": sources_markdown(sources)
+    }
+
+
+def stream_answer(user_query: str) -> tuple[str, list[dict], list[str]]:
+    """
+    Stream an answer into the current chat message, continuing the backend
+    conversation session; returns (answer, sources, errors)
+    """
+    payload = {"query_text": user_query, "session_id": st.session_state.session_id, "start_session": True}
+    headers = {"Accept": "text/event-stream"}
+    retrieved_sources = []
+    stream_errors = []
+    # Increased timeout for LLM; with streaming it applies between received chunks
+    with get_http_session().post(FASTAPI_STREAM_URL, json=payload, headers=headers,
+                                 timeout=(5, 120), stream=True) as response:
+        response.raise_for_status()  # Raise an exception for HTTP errors
+        response.encoding = "utf-8"
+
+        def answer_tokens():
+            # Read to the end of the stream (the server closes it after "done" or
+            # "error") so the connection goes back to the pool
+            for event_name, data in iter_sse_events(response):
+                if event_name == "sources":
+                    retrieved_sources.extend(data.get("retrieved_sources", []))
+                    st.session_state.session_id = data.get("session_id")
+                elif event_name == "token":
+                    yield data.get("text", "")
+                elif event_name == "error":
+                    stream_errors.append(data.get("detail", "Bilinmeyen hata"))
+
+        streamed = st.write_stream(answer_tokens())
+    answer = (streamed if isinstance(streamed, str) else "".join(streamed)).strip()
+    return answer, retrieved_sources, stream_errors
 
 
 # --- Streamlit App UI ---
@@ -26,20 +148,19 @@ st.caption("Konut ve Çatılı İşyeri Kiraları maddeleri hakkında soruların
 # Initialize chat history in session state
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "history_limit" not in st.session_state:
+    st.session_state.history_limit = HISTORY_PAGE_SIZE
+if "session_id" not in st.session_state:
+    st.session_state.session_id = None
 
-# Display chat messages from history on app rerun
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
-        if "sources" in message and message["sources"]:
-            with st.expander("Bilgi Alınan Kaynaklar", expanded=False):
-                for i, source in enumerate(message["sources"]):
-                    st.markdown(f"""
-                    **Kaynak {i+1}: {source['metadata'].get('article_number', 'Bilinmeyen Madde')} - {source['metadata'].get('article_header', 'Başlık Yok')}**
-                    ```
-                    {source['document'][:500]}... 
-                    ```
-                    """)  # Show a preview of the source
+# Display the most recent chat messages on app rerun; older ones on request
+hidden_messages = max(0, len(st.session_state.messages) - st.session_state.history_limit)
+if hidden_messages:
+    if st.button(f"Önceki mesajları göster ({hidden_messages} gizli)"):
+        st.session_state.history_limit += HISTORY_PAGE_SIZE
+        st.rerun()
+for message in st.session_state.messages[hidden_messages:]:
+    render_message(message)
 
 # React to user input
 if user_query := st.chat_input("Sorunuzu buraya yazın..."):
@@ -51,56 +172,37 @@ if user_query := st.chat_input("Sorunuzu buraya yazın..."):
 
     # Call FastAPI backend
     try:
-        payload = {"query_text": user_query}
-        headers = {
-            "X-API-Key": API_SECRET_KEY,
-            "Content-Type": "application/json"
-        }
-        # Increased timeout for LLM
-        response = requests.post(FASTAPI_URL, json=payload, headers=headers, timeout=120)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-
-        response_data = response.json()
-        answer = response_data.get(
-            "answer", "Bir hata oluştu, cevap alınamadı.")
-        retrieved_sources = response_data.get("retrieved_sources", [])
-
-        # Display assistant response in chat message container
+        # Display assistant response in chat message container as tokens arrive
         with st.chat_message("assistant"):
-            st.markdown(answer)
-            if retrieved_sources:
+            answer, retrieved_sources, stream_errors = stream_answer(user_query)
+            if stream_errors:
+                st.error(f"Yanıt oluşturulurken bir hata oluştu: {stream_errors[0]}")
+                if not answer:
+                    answer = f"Yanıt oluşturulurken bir hata oluştu: {stream_errors[0]}"
+            elif not answer:
+                answer = "Bir hata oluştu, cevap alınamadı."
+            message = assistant_message(answer, compact_sources(retrieved_sources))
+            if message["sources"]:
                 with st.expander("Yanıt Oluşturulurken Kullanılan Kaynaklar", expanded=False):
-                    for i, source in enumerate(retrieved_sources):
-                        st.markdown(f"""
-                        **Kaynak {i+1}: {source['metadata'].get('article_number', 'Bilinmeyen Madde')} - {source['metadata'].get('article_header', 'Başlık Yok')}**
-                        <details>
-                            <summary>Metni Göster</summary>
-                            <div style="white-space: pre-wrap; font-family: monospace; background-color: #f0f0f0; padding: 10px; border-radius: 5px; max-height: 200px; overflow-y: auto;">{source['document']}</div>
-                        </details>
-                        <hr style="margin: 5px 0;">
-                        """, unsafe_allow_html=True)
+                    st.markdown(message["sources_markdown"])
 
         # Add assistant response to chat history
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": answer,
-            "sources": retrieved_sources  # Store sources with the message
-        })
+        st.session_state.messages.append(message)
 
     except requests.exceptions.RequestException as e:
         error_message = f"API'ye bağlanırken bir hata oluştu: {e}"
         st.error(error_message)
-        st.session_state.messages.append(
-            {"role": "assistant", "content": error_message, "sources": []})
+        st.session_state.messages.append(assistant_message(error_message, []))
     except Exception as e:
         error_message = f"Beklenmedik bir hata oluştu: {e}"
         st.error(error_message)
-        st.session_state.messages.append(
-            {"role": "assistant", "content": error_message, "sources": []})
+        st.session_state.messages.append(assistant_message(error_message, []))
 
 # Add a button to clear chat history
 if st.sidebar.button("Sohbet Geçmişini Temizle"):
+    end_session()
     st.session_state.messages = []
+    st.session_state.history_limit = HISTORY_PAGE_SIZE
     st.rerun()
 
 st.sidebar.markdown("---")
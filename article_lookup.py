@@ -0,0 +1,41 @@
+import re
+
+from embedding_cache import turkish_casefold
+
+
+# "madde 344", "maddesi 344", "md. 344", "m. 344", "tbk 344", "tbk m. 344", "tbk madde 344"
+_PREFIX_REFERENCE = re.compile(
+    r"\b(?:tbk\s*(?:madde\w*|md\.?|m\.)?|madde\w*|md\.?|m\.)\s*(\d{1,4})\b"
+)
+# "344. madde", "344 üncü maddesi", "344'üncü madde". The ordinal is required:
+# "3 madde var mı" counts articles, it does not name one
+_SUFFIX_REFERENCE = re.compile(
+    r"\b(\d{1,4})(?:\.|\s*'?\s*(?:inci|ıncı|uncu|üncü|nci|ncı|ncu|ncü)\b)\s*madde\w*"
+)
+
+
+def extract_article_references(query_text: str) -> list[str]:
+    """Return the article numbers ("MADDE <n>") a query names explicitly, in order of appearance"""
+    text = turkish_casefold(query_text)
+    matches = [
+        (match.start(), match.group(1))
+        for pattern in (_PREFIX_REFERENCE, _SUFFIX_REFERENCE)
+        for match in pattern.finditer(text)
+    ]
+    references = []
+    for _, number in sorted(matches):
+        article_id = f"MADDE {int(number)}"
+        if article_id not in references:
+            references.append(article_id)
+    return references
+
+
+def format_extractive_answer(documents: list[dict]) -> str:
+    """Quote the referenced articles verbatim, header first"""
+    sections = []
+    for doc in documents:
+        article_num = doc['metadata'].get('article_number', 'Bilinmeyen Madde')
+        article_header = doc['metadata'].get('article_header', '')
+        title = f"**{article_num} - {article_header}**" if article_header else f"**{article_num}**"
+        sections.append(f"{title}\n\n{doc['document']}")
+    return "\n\n---\n\n".join(sections)
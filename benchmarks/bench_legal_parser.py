@@ -0,0 +1,142 @@
+"""
+Benchmark legal_parser on a synthetic multi-megabyte corpus.
+
+The corpus is the bundled source text repeated with renumbered articles.
+The streaming parser (plain reads and mmap) is timed against the previous
+whole-file implementation, kept below for comparison, and all of them must
+produce the same articles.
+
+Usage: python benchmarks/bench_legal_parser.py [--size-mb 16] [--repeat 3] [--memory]
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from legal_parser import HEADER_LINE_PATTERN, MADDE_PATTERN, iter_legal_articles, parse_legal_text
+
+SOURCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source_data",
+                           "TBK_Konut_ve_Catili_Isyeri_Kiralari.txt")
+
+
+def legacy_parse_legal_text(file_path):
+    """The pre-streaming parser: whole file in memory, each block scanned twice"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    matches = list(MADDE_PATTERN.finditer(content))
+    articles = []
+    for i, current_match in enumerate(matches):
+        block_start = matches[i - 1].end() if i > 0 else 0
+        current_article_header = ""
+        for line in reversed(content[block_start:current_match.start()].strip().split('\n')):
+            line = line.strip()
+            if line and HEADER_LINE_PATTERN.match(line) and "MADDE" not in line.upper():
+                current_article_header = line
+                break
+
+        start_of_body_content = current_match.end()
+        end_of_body_content = len(content)
+        if i + 1 < len(matches):
+            end_of_body_content = matches[i + 1].start()
+            inter_article_text_block = content[start_of_body_content:end_of_body_content]
+            next_header = ""
+            for line in reversed(inter_article_text_block.strip().split('\n')):
+                line = line.strip()
+                if line and HEADER_LINE_PATTERN.match(line) and "MADDE" not in line.upper():
+                    next_header = line
+                    break
+            if next_header:
+                offset = 0
+                for line in inter_article_text_block.splitlines(True):
+                    if line.strip() == next_header:
+                        end_of_body_content = start_of_body_content + offset
+                        break
+                    offset += len(line)
+
+        body = content[start_of_body_content:end_of_body_content].strip()
+        parts = [part for part in (current_match.group(3).strip(), body) if part]
+        articles.append({
+            'article_number': current_match.group(1).strip(),
+            'article_header': current_article_header,
+            'text': "\n".join(parts).strip()
+        })
+    return articles
+
+
+def build_corpus(path, size_mb):
+    """Repeat the source text, renumbering MADDE lines so every article is distinct"""
+    with open(SOURCE_FILE, 'r', encoding='utf-8') as f:
+        template = f.read().rstrip() + "\n\n"
+    target = size_mb * 1024 * 1024
+    written, number = 0, 1
+
+    def renumber(match):
+        nonlocal number
+        number += 1
+        return f"MADDE {number}"
+
+    with open(path, 'w', encoding='utf-8') as f:
+        while written < target:
+            chunk = re.sub(r"^MADDE \d+", renumber, template, flags=re.MULTILINE)
+            f.write(chunk)
+            written += len(chunk.encode('utf-8'))
+    return written
+
+
+def run(label, parse, path, repeat, size_bytes, measure_memory):
+    best = float("inf")
+    articles = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        articles = parse(path)
+        best = min(best, time.perf_counter() - started)
+    line = f"{label:<24} {best * 1000:9.1f} ms  {size_bytes / best / 1e6:8.1f} MB/s  {len(articles):7d} articles"
+    if measure_memory:
+        tracemalloc.start()
+        parse(path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        line += f"  peak {peak / 1e6:7.1f} MB"
+    print(line)
+    return articles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=16, help="Synthetic corpus size")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per parser (best is reported)")
+    parser.add_argument("--memory", action="store_true", help="Also report peak traced memory")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "corpus.txt")
+        size_bytes = build_corpus(path, args.size_mb)
+        print(f"Corpus: {size_bytes / 1e6:.1f} MB\n")
+
+        def count_streamed(use_mmap):
+            # Consume the generator without holding the articles, as ingestion would
+            return lambda file_path: [None] * sum(1 for _ in iter_legal_articles(file_path, use_mmap=use_mmap))
+
+        expected = run("legacy (read + split)", legacy_parse_legal_text, path, args.repeat, size_bytes, args.memory)
+        results = {
+            "parse_legal_text": run("parse_legal_text", parse_legal_text, path, args.repeat, size_bytes, args.memory),
+            "parse_legal_text mmap": run("parse_legal_text mmap",
+                                         lambda p: parse_legal_text(p, use_mmap=True),
+                                         path, args.repeat, size_bytes, args.memory)
+        }
+        run("iter_legal_articles", count_streamed(False), path, args.repeat, size_bytes, args.memory)
+        run("iter_legal_articles mmap", count_streamed(True), path, args.repeat, size_bytes, args.memory)
+
+        for label, articles in results.items():
+            if articles != expected:
+                raise SystemExit(f"{label} output differs from the legacy parser")
+        print("\nAll parsers produced identical articles.")
+
+
+if __name__ == "__main__":
+    main()
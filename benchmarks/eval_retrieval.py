@@ -0,0 +1,192 @@
+"""
+Evaluate retrieval configurations offline: quality (recall@k, MRR) and per-query latency.
+
+Every combination of chunking, retrieval mode, top-k, reranking (over 20
+candidates, with the built-in weights) and query-embedding cache is run over a gold set of questions labelled with the articles that answer
+them (benchmarks/retrieval_gold.jsonl). Retrieval goes through the same
+retrieval.retrieve_batch the API uses, over indexes built in memory from
+source_data, so nothing on disk is touched.
+
+Embeddings come from the deterministic hash embedder of the fake OpenAI
+server by default (no network; it behaves like a lexical model, so use it
+to compare pipelines, not to judge vector quality). With --embedder openai
+the real embedding model is used, and with --embedder local the TF-IDF + SVD
+model ingest_data.py fits when EMBEDDING_PROVIDER=local. --embedding-latency-ms
+simulates the API round trip for the hash embedder, which is what the cache saves.
+
+Usage: python benchmarks/eval_retrieval.py [--top-k 1 3 5] [--mode lexical vector hybrid]
+                                           [--chunking paragraph article] [--rerank off on] [--cache on off]
+                                           [--embedder hash openai local] [--json out.json]
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import ingest_data
+from embedding_cache import CachedQueryEmbedder, EmbeddingCache
+from embedding_providers import LocalEmbeddingProvider, OpenAIEmbeddingProvider
+from fake_openai import hash_embedding
+from lexical_index import BM25Index, document_search_text
+from reranker import LinearReranker
+from retrieval import NumpyRetriever, retrieve_batch
+from vector_index import VectorIndex
+
+GOLD_FILE = os.path.join(BENCHMARK_DIR, "retrieval_gold.jsonl")
+
+
+class HashEmbeddingClient:
+    """Just enough of the OpenAI client for embeddings, backed by hash_embedding"""
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.embeddings = self
+        self.requests = 0
+
+    def create(self, model: str, input: list[str]):
+        self.requests += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=hash_embedding(text)) for i, text in enumerate(input)
+        ])
+
+
+def load_gold(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def create_provider(embedder: str, latency_seconds: float, documents: list[str]):
+    """The embedding provider to evaluate; the local one is fitted on this chunking's documents, as ingest does"""
+    if embedder == "local":
+        return LocalEmbeddingProvider.fit(documents, dimension=ingest_data.LOCAL_EMBEDDING_DIMENSION)
+    if embedder == "openai":
+        from openai import OpenAI
+        return OpenAIEmbeddingProvider(OpenAI(), ingest_data.EMBEDDING_MODEL_NAME)
+    return OpenAIEmbeddingProvider(HashEmbeddingClient(latency_seconds), ingest_data.EMBEDDING_MODEL_NAME)
+
+
+def build_indexes(embedder: str, latency_seconds: float, chunking_mode: str):
+    """The embedding provider, numpy retriever and BM25 index ingest would build for this chunking mode"""
+    documents, metadatas, ids = ingest_data.load_documents(chunking_mode)
+    provider = create_provider(embedder, latency_seconds, documents)
+    vector_index = VectorIndex.build(provider.embed_documents(documents), ids, documents, metadatas)
+    lexical_index = BM25Index.build(ids, [
+        document_search_text(document, metadata) for document, metadata in zip(documents, metadatas)
+    ])
+    return provider, NumpyRetriever(vector_index), lexical_index
+
+
+def ranked_articles(docs: list[dict]) -> list[str]:
+    """Article numbers in rank order, each once (uncollapsed chunks can repeat an article)"""
+    articles = []
+    for doc in docs:
+        article_number = doc["metadata"].get("article_number")
+        if article_number not in articles:
+            articles.append(article_number)
+    return articles
+
+
+def score(articles: list[str], expected: list[str], k: int) -> tuple[float, float]:
+    """(recall@k, reciprocal rank of the first relevant article)"""
+    recall = len(set(articles[:k]) & set(expected)) / len(expected)
+    reciprocal_rank = next((1.0 / rank for rank, article in enumerate(articles, 1) if article in expected), 0.0)
+    return recall, reciprocal_rank
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def evaluate(retriever, lexical_index, embed_many, gold: list[dict], top_k: int, mode: str,
+             chunking_mode: str, passes: int, reranker=None) -> dict:
+    """Run every gold question `passes` times, one query per call as the API does"""
+    recalls, reciprocal_ranks, latencies = [], [], []
+    for pass_number in range(passes):
+        for item in gold:
+            start = time.perf_counter()
+            docs, _ = retrieve_batch(
+                retriever, lexical_index, embed_many, [item["question"]], top_k=top_k, mode=mode,
+                collapse=chunking_mode == "paragraph", reranker=reranker)[0]
+            latencies.append((time.perf_counter() - start) * 1000)
+            if pass_number == 0:
+                recall, reciprocal_rank = score(ranked_articles(docs), item["articles"], top_k)
+                recalls.append(recall)
+                reciprocal_ranks.append(reciprocal_rank)
+    latencies.sort()
+    return {
+        "recall@k": round(sum(recalls) / len(recalls), 4),
+        "mrr": round(sum(reciprocal_ranks) / len(reciprocal_ranks), 4),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 2),
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "max": round(latencies[-1], 2)
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--gold", default=GOLD_FILE, help="JSONL of {question, articles}")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--mode", nargs="+", choices=["lexical", "vector", "hybrid"],
+                        default=["lexical", "vector", "hybrid"])
+    parser.add_argument("--chunking", nargs="+", choices=["paragraph", "article"], default=["paragraph", "article"])
+    parser.add_argument("--rerank", nargs="+", choices=["off", "on"], default=["off", "on"])
+    parser.add_argument("--cache", nargs="+", choices=["on", "off"], default=["on", "off"],
+                        help="Query embedding cache (in memory)")
+    parser.add_argument("--passes", type=int, default=2,
+                        help="Times each question is asked; later passes hit a warm cache")
+    parser.add_argument("--embedder", choices=["hash", "openai", "local"], default="hash")
+    parser.add_argument("--embedding-latency-ms", type=float, default=50,
+                        help="Simulated embedding API latency for the hash embedder")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    gold = load_gold(args.gold)
+
+    results = []
+    for chunking_mode in args.chunking:
+        provider, retriever, lexical_index = build_indexes(
+            args.embedder, args.embedding_latency_ms / 1000, chunking_mode)
+        for mode, top_k, rerank, cache in itertools.product(args.mode, args.top_k, args.rerank, args.cache):
+            if mode == "lexical" and cache == "on" and "off" in args.cache:
+                continue  # no embeddings, so the cache makes no difference
+            if cache == "on":
+                embed_many = CachedQueryEmbedder(
+                    provider, EmbeddingCache(model_name=provider.identity, max_entries=4096)).embed_many
+            else:
+                embed_many = provider.embed
+            config = {"chunking": chunking_mode, "mode": mode, "top_k": top_k, "rerank": rerank,
+                      "cache": "-" if mode == "lexical" else cache}
+            results.append({**config, **evaluate(
+                retriever, lexical_index, embed_many, gold, top_k, mode, chunking_mode, args.passes,
+                reranker=LinearReranker.from_file() if rerank == "on" else None)})
+
+    print(f"\n{len(gold)} gold questions, {args.embedder} embeddings, {args.passes} passes\n")
+    print(f"{'chunking':<10}{'mode':<8}{'k':>3}{'rerank':>8}{'cache':>7}{'recall@k':>10}{'MRR':>8}"
+          f"{'mean ms':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for result in results:
+        latency = result["latency_ms"]
+        print(f"{result['chunking']:<10}{result['mode']:<8}{result['top_k']:>3}{result['rerank']:>8}{result['cache']:>7}"
+              f"{result['recall@k']:>10.3f}{result['mrr']:>8.3f}"
+              f"{latency['mean']:>10.2f}{latency['p50']:>9.2f}{latency['p95']:>9.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"embedder": args.embedder, "gold": args.gold, "passes": args.passes, "results": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
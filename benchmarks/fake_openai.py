@@ -0,0 +1,165 @@
+"""
+Local stand-in for the OpenAI API, for benchmarks that must not touch the network.
+
+Serves /v1/embeddings and /v1/chat/completions (plain and streamed) after a
+configurable latency with jitter. Embeddings are deterministic: hashed word
+and character-trigram features, so the same text always gets the same vector
+and texts that share words get similar ones. Chat answers echo the first
+source label from the prompt so they look like real answers.
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+Usage: python benchmarks/fake_openai.py [--port 9100] [--embedding-latency-ms 50] [--chat-latency-ms 800]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+# Same width as text-embedding-ada-002, so artifacts built against it have the real shape
+EMBEDDING_DIMENSION = 1536
+WORD_PATTERN = re.compile(r"\w+")
+SOURCE_LABEL_PATTERN = re.compile(r"METİN \d+ \(([^)]*?) -")
+
+
+def hash_embedding(text: str, dimension: int = EMBEDDING_DIMENSION) -> list[float]:
+    """Unit vector of signed, hashed word and character-trigram features of `text`"""
+    vector = np.zeros(dimension, dtype=np.float32)
+    words = WORD_PATTERN.findall(text.casefold())
+    features = words + [word[i:i + 3] for word in words for i in range(max(1, len(word) - 2))]
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimension
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+def create_app(embedding_latency: float, chat_latency: float, jitter: float, token_delay: float,
+               answer_words: int, error_rate: float, seed: int) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI API")
+    rng = random.Random(seed)
+
+    async def simulate_latency(mean_seconds: float):
+        if error_rate and rng.random() < error_rate:
+            raise HTTPException(status_code=500, detail="Injected failure")
+        await asyncio.sleep(max(0.0, rng.gauss(mean_seconds, mean_seconds * jitter)))
+
+    def usage(prompt_tokens: int, completion_tokens: int = 0) -> dict:
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": []}
+
+    @app.post("/v1/embeddings")
+    async def create_embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await simulate_latency(embedding_latency)
+        return {
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": hash_embedding(str(text))}
+                for i, text in enumerate(inputs)
+            ],
+            "model": body["model"],
+            "usage": usage(sum(len(str(text).split()) for text in inputs))
+        }
+
+    @app.post("/v1/chat/completions")
+    async def create_chat_completion(request: Request):
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        source = SOURCE_LABEL_PATTERN.search(prompt)
+        words = (
+            f"Sağlanan metinlere göre (Kaynak: METİN 1, {source.group(1)}) " if source
+            else "Sağlanan bilgiler arasında bu soruya kesin bir cevap bulamadım. "
+        ).split()
+        words += ["kira"] * max(0, answer_words - len(words))
+        prompt_tokens = sum(len(message["content"].split()) for message in body["messages"])
+        completion_id = f"chatcmpl-{int(time.time() * 1000)}"
+
+        if body.get("stream"):
+            # The latency is time to first token; the rest arrives token_delay apart
+            await simulate_latency(chat_latency)
+
+            async def chunks():
+                for i, word in enumerate(words):
+                    if i:
+                        await asyncio.sleep(token_delay)
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": 0,
+                             "model": body["model"],
+                             "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                final = {"id": completion_id, "object": "chat.completion.chunk", "created": 0,
+                         "model": body["model"],
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                yield f"data: {json.dumps(final)}\n\n"
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    usage_chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": 0,
+                                   "model": body["model"], "choices": [],
+                                   "usage": usage(prompt_tokens, len(words))}
+                    yield f"data: {json.dumps(usage_chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+
+        await simulate_latency(chat_latency + token_delay * len(words))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)},
+                         "finish_reason": "stop"}],
+            "usage": usage(prompt_tokens, len(words))
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--embedding-latency-ms", type=float, default=50, help="Mean embedding request latency")
+    parser.add_argument("--chat-latency-ms", type=float, default=800,
+                        help="Mean chat latency (time to first token when streaming)")
+    parser.add_argument("--jitter", type=float, default=0.2,
+                        help="Standard deviation of the latency, as a fraction of the mean")
+    parser.add_argument("--token-delay-ms", type=float, default=5, help="Time per generated token")
+    parser.add_argument("--answer-words", type=int, default=60, help="Tokens per chat answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail with 500")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for jitter and injected errors")
+    args = parser.parse_args()
+
+    app = create_app(
+        embedding_latency=args.embedding_latency_ms / 1000,
+        chat_latency=args.chat_latency_ms / 1000,
+        jitter=args.jitter,
+        token_delay=args.token_delay_ms / 1000,
+        answer_words=args.answer_words,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+Offline load test: replay Turkish rental-law questions against the API at a target rate.
+
+By default both servers are booted locally, with no network access needed:
+benchmarks/fake_openai.py stands in for OpenAI (configurable latency and
+jitter, deterministic hash embeddings), and the API runs under uvicorn in a
+scratch directory, so its index, caches and rate-limit state start empty and
+never touch ./chroma_db_store. Requests are sent open-loop (on a fixed or
+Poisson schedule, whether or not earlier ones have finished), so queueing
+shows up in the tail.
+
+The report gives throughput, error rate, p50/p95/p99 latency end to end
+and per stage (from the Server-Timing header), and errors by the stage
+that failed. Save it with --json and pass it to a later run with --compare
+for a before/after table.
+
+Usage: python benchmarks/load_test.py [--qps 5] [--duration 30] [--endpoint query] [--env KEY=VALUE ...]
+       python benchmarks/load_test.py --url http://127.0.0.1:8000 --api-key KEY   (an already running server)
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+QUESTIONS_FILE = os.path.join(BENCHMARK_DIR, "questions_tr.txt")
+PERCENTILES = (50, 95, 99)
+
+
+def load_questions(path: str) -> list[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return float("nan")
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(url: str, timeout: float, process: subprocess.Popen, log_path: str):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode}; see {log_path}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s; see {log_path}")
+
+
+def start_process(command: list[str], log_path: str, cwd: str, env: dict | None = None) -> subprocess.Popen:
+    log_file = open(log_path, "w")
+    return subprocess.Popen(command, cwd=cwd, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def stop_process(process: subprocess.Popen):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def boot_servers(args, workdir: str) -> tuple[str, list[subprocess.Popen]]:
+    """Start the fake OpenAI server and the API; returns the API base URL and both processes"""
+    processes = []
+    fake_port = free_port()
+    fake_log = os.path.join(workdir, "fake_openai.log")
+    processes.append(start_process([
+        sys.executable, os.path.join(BENCHMARK_DIR, "fake_openai.py"),
+        "--port", str(fake_port),
+        "--embedding-latency-ms", str(args.embedding_latency_ms),
+        "--chat-latency-ms", str(args.chat_latency_ms),
+        "--jitter", str(args.jitter),
+        "--seed", str(args.seed)
+    ], fake_log, cwd=workdir))
+    wait_until_ready(f"http://127.0.0.1:{fake_port}/v1/models", 30, processes[0], fake_log)
+
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "sk-load-test",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "API_SECRET_KEY": args.api_key,
+        "SOURCE_DATA_DIR": os.path.join(REPO_ROOT, "source_data"),
+        "RETRIEVAL_BACKEND": "numpy",
+        # The load generator is a single client; limits would only measure themselves
+        "RATE_LIMIT_REQUESTS": "1000000000",
+        "RATE_LIMIT_KEY_REQUESTS": "1000000000"
+    })
+    for assignment in args.env:
+        key, _, value = assignment.partition("=")
+        env[key] = value
+
+    api_port = free_port()
+    api_log = os.path.join(workdir, "api.log")
+    processes.append(start_process([
+        sys.executable, "-m", "uvicorn", "main:app", "--app-dir", REPO_ROOT,
+        "--host", "127.0.0.1", "--port", str(api_port),
+        "--workers", str(args.workers), "--log-level", "warning"
+    ], api_log, cwd=workdir, env=env))
+    base_url = f"http://127.0.0.1:{api_port}"
+    wait_until_ready(f"{base_url}/readyz", args.boot_timeout, processes[1], api_log)
+    return base_url, processes
+
+
+def parse_server_timing(header: str | None) -> dict:
+    stages = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if name and key == "dur":
+                stages[name] = float(value)
+    return stages
+
+
+def failed_stage(status: int | None, detail: str) -> str:
+    """Which stage an error came from, judged by its message and status"""
+    detail = detail.lower()
+    if "retrieval" in detail:
+        return "retrieve"
+    if "language model" in detail:
+        return "llm"
+    if "index not ready" in detail:
+        return "index"
+    return {401: "auth", 413: "request", 429: "rate_limit", 503: "unavailable"}.get(status, "internal")
+
+
+async def send_query(client: httpx.AsyncClient, endpoint: str, question: str, extractive: bool | None) -> dict:
+    """One request; returns its latency, status, stage timings and, if it failed, the failing stage"""
+    payload = {"query_text": question}
+    if extractive is not None:
+        payload["extractive"] = extractive
+    result = {"status": None, "error_stage": None, "stages": {}, "ttft_ms": None}
+    start = time.perf_counter()
+    try:
+        if endpoint == "stream":
+            async with client.stream("POST", "/query/stream", json=payload) as response:
+                result["status"] = response.status_code
+                result["stages"] = parse_server_timing(response.headers.get("server-timing"))
+                if response.status_code != 200:
+                    result["error_stage"] = failed_stage(response.status_code, (await response.aread()).decode())
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                    elif line.startswith("data: ") and event == "token" and result["ttft_ms"] is None:
+                        result["ttft_ms"] = (time.perf_counter() - start) * 1000
+                    elif line.startswith("data: ") and event == "error":
+                        result["error_stage"] = failed_stage(None, json.loads(line[len("data: "):])["detail"])
+        else:
+            response = await client.post("/query", json=payload)
+            result["status"] = response.status_code
+            result["stages"] = parse_server_timing(response.headers.get("server-timing"))
+            if response.status_code != 200:
+                result["error_stage"] = failed_stage(response.status_code, response.text)
+    except httpx.HTTPError as e:
+        result["error_stage"] = f"transport ({type(e).__name__})"
+    result["latency_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+async def replay(args, base_url: str, questions: list[str]) -> tuple[list[dict], float]:
+    """Send `args.requests` queries open-loop at `args.qps`; returns the results and the wall time"""
+    rng = random.Random(args.seed)
+    order = list(questions)
+    rng.shuffle(order)
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=base_url, headers={"X-API-Key": args.api_key},
+                                 timeout=args.timeout, limits=limits) as client:
+        for question in order[:args.warmup]:
+            await send_query(client, args.endpoint, question, args.extractive)
+
+        tasks = []
+        start = time.perf_counter()
+        send_at = 0.0
+        for i in range(args.requests):
+            delay = start + send_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            question = order[i % len(order)]
+            tasks.append(asyncio.create_task(send_query(client, args.endpoint, question, args.extractive)))
+            send_at += rng.expovariate(args.qps) if args.arrival == "poisson" else 1.0 / args.qps
+        results = await asyncio.gather(*tasks)
+        return results, time.perf_counter() - start
+
+
+def summarize(results: list[dict], elapsed: float, args) -> dict:
+    def distribution(values: list[float]) -> dict:
+        values = sorted(values)
+        summary = {f"p{q}": round(percentile(values, q), 1) for q in PERCENTILES}
+        summary["max"] = round(values[-1], 1) if values else float("nan")
+        summary["count"] = len(values)
+        return summary
+
+    ok = [result for result in results if result["error_stage"] is None]
+    errors = {}
+    for result in results:
+        if result["error_stage"] is not None:
+            key = f"{result['status'] or '-'} {result['error_stage']}"
+            errors[key] = errors.get(key, 0) + 1
+    stage_names = []
+    for result in ok:
+        stage_names.extend(name for name in result["stages"] if name not in stage_names)
+
+    report = {
+        "config": {
+            "endpoint": args.endpoint, "qps": args.qps, "requests": args.requests, "arrival": args.arrival,
+            "workers": args.workers, "env": args.env, "seed": args.seed, "url": args.url,
+            "embedding_latency_ms": args.embedding_latency_ms, "chat_latency_ms": args.chat_latency_ms,
+            "jitter": args.jitter
+        },
+        "sent": len(results),
+        "ok": len(ok),
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": distribution([result["latency_ms"] for result in ok]),
+        "stages_ms": {
+            name: distribution([result["stages"][name] for result in ok if name in result["stages"]])
+            for name in stage_names
+        }
+    }
+    ttfts = [result["ttft_ms"] for result in ok if result["ttft_ms"] is not None]
+    if ttfts:
+        report["ttft_ms"] = distribution(ttfts)
+    return report
+
+
+def print_report(report: dict, baseline: dict | None = None):
+    print(f"\n{report['sent']} requests, {report['ok']} ok, error rate {report['error_rate']:.2%}, "
+          f"in {report['elapsed_seconds']}s: {report['throughput_rps']} req/s "
+          f"(target {report['config']['qps']} req/s)")
+    rows = [("total", report["latency_ms"])]
+    if "ttft_ms" in report:
+        rows.append(("first token", report["ttft_ms"]))
+    rows.extend((f"  {name}", summary) for name, summary in report["stages_ms"].items())
+
+    header = f"{'latency (ms)':<16}" + "".join(f"{f'p{q}':>10}" for q in PERCENTILES) + f"{'max':>10}{'n':>7}"
+    print(header)
+    for name, summary in rows:
+        line = f"{name:<16}" + "".join(f"{summary[f'p{q}']:>10.1f}" for q in PERCENTILES)
+        print(line + f"{summary['max']:>10.1f}{summary['count']:>7}")
+
+    if report["errors"]:
+        print("errors by status and stage:")
+        for key, count in sorted(report["errors"].items(), key=lambda item: -item[1]):
+            print(f"  {key}: {count}")
+
+    if baseline:
+        print("\nchange vs baseline:")
+        print(f"  throughput {baseline['throughput_rps']} -> {report['throughput_rps']} req/s, "
+              f"error rate {baseline['error_rate']:.2%} -> {report['error_rate']:.2%}")
+        compared = [("total", baseline["latency_ms"], report["latency_ms"])] + [
+            (name, baseline["stages_ms"][name], summary)
+            for name, summary in report["stages_ms"].items() if name in baseline["stages_ms"]
+        ]
+        for name, before, after in compared:
+            changes = ", ".join(
+                f"p{q} {before[f'p{q}']:.1f} -> {after[f'p{q}']:.1f}"
+                f" ({(after[f'p{q}'] - before[f'p{q}']) / before[f'p{q}']:+.0%})" if before[f'p{q}'] else
+                f"p{q} {before[f'p{q}']:.1f} -> {after[f'p{q}']:.1f}"
+                for q in PERCENTILES
+            )
+            print(f"  {name}: {changes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="Test a running server instead of booting one")
+    parser.add_argument("--api-key", default="load-test-key", help="X-API-Key to send (and to boot the API with)")
+    parser.add_argument("--endpoint", choices=["query", "stream"], default="query")
+    parser.add_argument("--extractive", action=argparse.BooleanOptionalAction, default=None,
+                        help="Per-request extractive override (default: server setting)")
+    parser.add_argument("--qps", type=float, default=5.0, help="Target request rate")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load (sets --requests)")
+    parser.add_argument("--requests", type=int, help="Requests to send (default: qps x duration)")
+    parser.add_argument("--arrival", choices=["uniform", "poisson"], default="poisson")
+    parser.add_argument("--warmup", type=int, default=5, help="Sequential requests before measuring")
+    parser.add_argument("--questions", default=QUESTIONS_FILE, help="One question per line")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for question order, arrivals and fake latency")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per request")
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the booted API")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the booted API, e.g. RETRIEVAL_MODE=vector")
+    parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    parser.add_argument("--chat-latency-ms", type=float, default=800)
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency standard deviation / mean")
+    parser.add_argument("--boot-timeout", type=float, default=120.0)
+    parser.add_argument("--workdir", help="Directory for the booted API's index, caches and logs "
+                                          "(default: a fresh temporary directory, removed afterwards)")
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--compare", help="Report from an earlier run (--json) to compare against")
+    args = parser.parse_args()
+    if args.requests is None:
+        args.requests = max(1, round(args.qps * args.duration))
+
+    questions = load_questions(args.questions)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    processes = []
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-load-test-")
+    os.makedirs(workdir, exist_ok=True)
+    finished = False
+    try:
+        base_url = args.url
+        if not base_url:
+            print(f"Booting the fake OpenAI server and the API in {workdir} ...")
+            boot_start = time.perf_counter()
+            base_url, processes = boot_servers(args, workdir)
+            print(f"API ready at {base_url} after {time.perf_counter() - boot_start:.1f}s")
+        print(f"Sending {args.requests} requests to /{args.endpoint} at {args.qps} req/s ({args.arrival}) ...")
+        results, elapsed = asyncio.run(replay(args, base_url, questions))
+        finished = True
+    finally:
+        for process in reversed(processes):
+            stop_process(process)
+        # Keep the logs of a failed run
+        if not args.workdir and finished:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = summarize(results, elapsed, args)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
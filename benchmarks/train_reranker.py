@@ -0,0 +1,129 @@
+"""
+Learn the reranker weights from the gold set and measure what reranking buys.
+
+Every gold question in benchmarks/retrieval_gold.jsonl runs through the
+candidate stage as in the API (hybrid retrieval, --candidates chunks deep),
+and each candidate is labelled relevant when its article is one the question
+expects. A logistic regression over reranker.FEATURES is fitted on those
+labels. Quality is measured by k-fold cross-validation (each question is
+scored by a model fitted on the other folds), so it is not flattered by
+training on the questions it scores.
+
+Reported for the plain top-k and for the reranker keeping at most --keep
+documents: recall, hit@1, MRR, documents and tokens per prompt, and the
+rerank latency. Paste the final weights into reranker.DEFAULT_WEIGHTS or
+save them with --output and point RERANK_WEIGHTS_PATH at the file.
+
+Usage: python benchmarks/train_reranker.py [--embedder hash|local] [--folds 6] [--output weights.json]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from eval_retrieval import GOLD_FILE, build_indexes, load_gold, percentile, ranked_articles, score
+import ingest_data
+from context_packing import document_tokens
+from reranker import FEATURES, LinearReranker, fit_logistic, select_documents
+from retrieval import collapse_chunks, retrieve_batch
+
+
+def summarize(selections: list[list[dict]], rankings: list[list[str]], gold: list[dict]) -> dict:
+    """Metrics of the documents that would go into each prompt, and of the full article ranking"""
+    recalls, hits, reciprocal_ranks = [], [], []
+    for docs, articles, item in zip(selections, rankings, gold):
+        recalls.append(score(ranked_articles(docs), item["articles"], len(docs))[0])
+        hits.append(1.0 if articles[:1] and articles[0] in item["articles"] else 0.0)
+        reciprocal_ranks.append(score(articles, item["articles"], 1)[1])
+    return {
+        "recall": round(float(np.mean(recalls)), 4),
+        "hit@1": round(float(np.mean(hits)), 4),
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+        "documents": round(float(np.mean([len(docs) for docs in selections])), 2),
+        "tokens": round(float(np.mean([sum(document_tokens(doc) for doc in docs) for docs in selections])), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--gold", default=GOLD_FILE)
+    parser.add_argument("--embedder", choices=["hash", "openai", "local"], default="hash")
+    parser.add_argument("--chunking", choices=["paragraph", "article"], default=ingest_data.CHUNKING_MODE)
+    parser.add_argument("--candidates", type=int, default=20, help="Candidate chunks per question")
+    parser.add_argument("--top-k", type=int, default=3, help="Documents per prompt without reranking")
+    parser.add_argument("--keep", type=int, default=2, help="Documents per prompt with reranking, at most")
+    parser.add_argument("--min-score", type=float, default=0.5,
+                        help="Reranker score documents after the first need to be kept")
+    parser.add_argument("--folds", type=int, default=6)
+    parser.add_argument("--l2", type=float, default=0.01)
+    parser.add_argument("--output", help="Write the weights fitted on the whole gold set to this file")
+    args = parser.parse_args()
+
+    gold = load_gold(args.gold)
+    provider, retriever, lexical_index = build_indexes(args.embedder, 0.0, args.chunking)
+    collapse = args.chunking == "paragraph"
+
+    def candidate_stage(question: str, top_k: int, collapse_chunks_: bool) -> list[dict]:
+        return retrieve_batch(retriever, lexical_index, provider.embed, [question], top_k=top_k,
+                              mode="hybrid", candidates=args.candidates, collapse=collapse_chunks_)[0][0]
+
+    baseline = [candidate_stage(item["question"], args.top_k, collapse) for item in gold]
+    baseline_rankings = [
+        ranked_articles(candidate_stage(item["question"], args.candidates, collapse)) for item in gold
+    ]
+    candidates = [candidate_stage(item["question"], args.candidates, False) for item in gold]
+    features = [LinearReranker.features(item["question"], docs, lexical_index) for item, docs in zip(gold, candidates)]
+    labels = [
+        np.array([doc["metadata"].get("article_number") in item["articles"] for doc in docs], dtype=np.float64)
+        for item, docs in zip(gold, candidates)
+    ]
+
+    def rerank(reranker: LinearReranker, position: int) -> tuple[list[dict], list[str]]:
+        reranked = reranker.rerank(gold[position]["question"], candidates[position], lexical_index)
+        articles = collapse_chunks(reranked, len(reranked)) if collapse else reranked
+        return select_documents(articles[:args.keep], args.keep, args.min_score), ranked_articles(articles)
+
+    selections, rankings = [None] * len(gold), [None] * len(gold)
+    for fold in range(args.folds):
+        train = [i for i in range(len(gold)) if i % args.folds != fold]
+        weights, bias = fit_logistic(
+            np.vstack([features[i] for i in train]), np.concatenate([labels[i] for i in train]), l2=args.l2)
+        reranker = LinearReranker(weights, bias)
+        for position in range(fold, len(gold), args.folds):
+            selections[position], rankings[position] = rerank(reranker, position)
+
+    weights, bias = fit_logistic(np.vstack(features), np.concatenate(labels), l2=args.l2)
+    final = LinearReranker(weights, bias)
+    latencies = []
+    for item, docs in zip(gold, candidates):
+        start = time.perf_counter()
+        final.rerank(item["question"], docs, lexical_index)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    results = {
+        f"top-{args.top_k}": summarize(baseline, baseline_rankings, gold),
+        f"rerank (<= {args.keep}, cv)": summarize(selections, rankings, gold)
+    }
+    print(f"\n{len(gold)} gold questions, {args.embedder} embeddings, {args.chunking} chunks, "
+          f"{args.candidates} candidates, {args.folds}-fold cross-validation\n")
+    print(f"{'':<20}{'recall':>8}{'hit@1':>8}{'MRR':>8}{'docs':>7}{'tokens':>9}")
+    for name, result in results.items():
+        print(f"{name:<20}{result['recall']:>8.3f}{result['hit@1']:>8.3f}{result['mrr']:>8.3f}"
+              f"{result['documents']:>7.2f}{result['tokens']:>9.1f}")
+    print(f"\nRerank latency per query ({args.candidates} candidates): mean "
+          f"{np.mean(latencies):.3f} ms, p95 {percentile(latencies, 95):.3f} ms, max {latencies[-1]:.3f} ms")
+    print("\nWeights fitted on every question:")
+    for name, weight in zip(FEATURES, final.weights):
+        print(f"  {name:<14}{weight:>8.3f}")
+    print(f"  {'bias':<14}{final.bias:>8.3f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(final.to_dict(), f, indent=2)
+        print(f"\nWeights written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
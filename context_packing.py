@@ -0,0 +1,126 @@
+import math
+import re
+
+try:
+    import tiktoken
+except ImportError:  # token counts fall back to a character heuristic
+    tiktoken = None
+
+
+# Encoding used by gpt-3.5-turbo / gpt-4 and text-embedding-ada-002
+TOKENIZER_ENCODING = "cl100k_base"
+# Heuristic fallback: cl100k splits Turkish words into roughly one token per 3.5 characters
+CHARS_PER_TOKEN = 3.5
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Trimming keeps whole sentences; a single sentence over budget falls back to whole words
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"(?<=[.!?;:])\s+")
+WORD_BOUNDARY_PATTERN = re.compile(r"\s+")
+TRIM_MARKER = "[...]"
+
+_encoding = None
+
+
+def _get_encoding():
+    """The tiktoken encoding, loaded once; False if tiktoken is missing or its data cannot be loaded"""
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING) if tiktoken else False
+        except Exception:  # the BPE file is downloaded on first use
+            _encoding = False
+    return _encoding
+
+
+def token_counter_name() -> str:
+    return f"tiktoken:{TOKENIZER_ENCODING}" if _get_encoding() else "heuristic"
+
+
+def count_tokens(text: str) -> int:
+    """Exact count with tiktoken when available, otherwise a slightly pessimistic estimate"""
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(math.ceil(len(word) / CHARS_PER_TOKEN) for word in WORD_PATTERN.findall(text))
+
+
+def document_tokens(doc: dict) -> int:
+    """Token count precomputed at ingest (metadata "token_count"), or counted now for older indexes"""
+    token_count = doc['metadata'].get('token_count')
+    return token_count if token_count is not None else count_tokens(doc['document'])
+
+
+def _take_segments(text: str, boundary_pattern: re.Pattern, token_budget: int) -> str:
+    """Longest prefix of `text` ending at a boundary whose segments fit in the budget"""
+    end = 0
+    used = 0
+    for boundary in [match.start() for match in boundary_pattern.finditer(text)] + [len(text)]:
+        used += count_tokens(text[end:boundary])
+        if used > token_budget:
+            break
+        end = boundary
+    return text[:end]
+
+
+def trim_to_budget(text: str, token_budget: int) -> str:
+    """Cut `text` at the last sentence boundary that fits, marking the cut; "" if nothing fits"""
+    budget = token_budget - count_tokens(TRIM_MARKER) - 1
+    if budget <= 0:
+        return ""
+    trimmed = _take_segments(text, SENTENCE_BOUNDARY_PATTERN, budget) or \
+        _take_segments(text, WORD_BOUNDARY_PATTERN, budget)
+    return f"{trimmed} {TRIM_MARKER}" if trimmed else ""
+
+
+def _coverage(doc: dict) -> tuple[tuple, set | None]:
+    """(source, article) key and the chunk indices a document covers (None: the whole article)"""
+    metadata = doc['metadata']
+    key = (metadata.get('source', ''), metadata.get('article_number', doc['id']))
+    if 'chunk_indices' in metadata:
+        return key, set(metadata['chunk_indices'])
+    if 'chunk_index' in metadata:
+        return key, {metadata['chunk_index']}
+    return key, None
+
+
+def pack_context(docs: list[dict], token_budget: int, format_header, min_trim_tokens: int = 40) -> list[tuple[int, dict]]:
+    """
+    Choose what goes into the prompt: documents in relevance order while they
+    fit in `token_budget` (each costing its header, formatted by
+    `format_header(position, doc)`, plus its text). Documents whose chunks or
+    text are already included are skipped. The first document that does not
+    fit is trimmed at a sentence boundary if at least `min_trim_tokens` remain,
+    and packing stops there.
+
+    Returns (position in `docs`, document) pairs, so prompt labels keep
+    matching the sources returned to the client.
+    """
+    packed = []
+    covered = {}  # (source, article) -> chunk indices included, None for the whole article
+    packed_texts = []
+    remaining = token_budget
+    for position, doc in enumerate(docs):
+        key, chunks = _coverage(doc)
+        if key in covered and (covered[key] is None or (chunks is not None and chunks <= covered[key])):
+            continue
+        text = doc['document'].strip()
+        if any(text in packed_text for packed_text in packed_texts):
+            continue
+
+        header_tokens = count_tokens(format_header(position, doc))
+        cost = header_tokens + document_tokens(doc)
+        if cost <= remaining:
+            packed.append((position, doc))
+            remaining -= cost
+        else:
+            text_budget = remaining - header_tokens
+            trimmed = trim_to_budget(text, text_budget) if text_budget >= min_trim_tokens else ""
+            # The most relevant document is always sent, trimmed if need be
+            if not trimmed and not packed:
+                trimmed = trim_to_budget(text, max(text_budget, min_trim_tokens))
+            if trimmed:
+                packed.append((position, {**doc, 'document': trimmed}))
+            break
+
+        covered[key] = None if chunks is None else covered.get(key, set()) | chunks
+        packed_texts.append(text)
+    return packed
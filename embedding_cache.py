@@ -0,0 +1,173 @@
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+
+# Punctuation and symbols are dropped; "Kira artışı?" and "kira artışı" are the same question.
+_PUNCTUATION_CATEGORIES = ("P", "S")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def turkish_casefold(text: str) -> str:
+    """
+    Lowercase text with Turkish dotted/dotless i rules.
+    str.lower() maps "I" to "i" and "İ" to "i̇" (i + combining dot), both wrong for Turkish.
+    """
+    return text.replace("I", "ı").replace("İ", "i").lower()
+
+
+def normalize_query(text: str) -> str:
+    """Normalize a user query into a cache key: NFC, Turkish casefold, no punctuation, single spaces"""
+    text = unicodedata.normalize("NFC", text)
+    text = turkish_casefold(text)
+    text = "".join(
+        " " if unicodedata.category(ch)[0] in _PUNCTUATION_CATEGORIES else ch
+        for ch in text
+    )
+    return _WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of query embeddings keyed on (model, normalized query).
+
+    The first tier is an in-memory LRU bounded by `max_entries`. The optional
+    second tier is a SQLite file (bounded by `max_disk_entries`) so warm
+    entries survive restarts. Lookups are thread-safe because retrieval runs
+    on a thread pool.
+    """
+
+    def __init__(self, model_name: str, max_entries: int = 1024,
+                 db_path: str | None = None, max_disk_entries: int = 100_000):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, query TEXT NOT NULL, vector BLOB NOT NULL, "
+                "last_used REAL NOT NULL, PRIMARY KEY (model, query))"
+            )
+            self._db.commit()
+
+    def get(self, normalized_query: str) -> list[float] | None:
+        with self._lock:
+            vector = self._entries.get(normalized_query)
+            if vector is not None:
+                self._entries.move_to_end(normalized_query)
+                self.hits += 1
+                return vector
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM query_embeddings WHERE model = ? AND query = ?",
+                    (self.model_name, normalized_query)
+                ).fetchone()
+                if row is not None:
+                    vector = array("f", row[0]).tolist()
+                    self._db.execute(
+                        "UPDATE query_embeddings SET last_used = ? WHERE model = ? AND query = ?",
+                        (time.time(), self.model_name, normalized_query)
+                    )
+                    self._db.commit()
+                    self._remember(normalized_query, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, normalized_query: str, vector: list[float]):
+        with self._lock:
+            self._remember(normalized_query, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, query, vector, last_used) VALUES (?, ?, ?, ?)",
+                    (self.model_name, normalized_query, array("f", vector).tobytes(), time.time())
+                )
+                self._prune_disk()
+                self._db.commit()
+
+    def _remember(self, normalized_query: str, vector: list[float]):
+        self._entries[normalized_query] = vector
+        self._entries.move_to_end(normalized_query)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _prune_disk(self):
+        # Only runs when the table overflows, and then trims 10% so it is not re-run on every insert
+        (count,) = self._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()
+        if count <= self.max_disk_entries:
+            return
+        excess = count - int(self.max_disk_entries * 0.9)
+        self._db.execute(
+            "DELETE FROM query_embeddings WHERE rowid IN ("
+            "SELECT rowid FROM query_embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,)
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "persistent": self._db is not None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class CachedQueryEmbedder:
+    """Embeds query texts through an embedding provider, calling it only for cache misses"""
+
+    def __init__(self, provider, cache: EmbeddingCache):
+        self.provider = provider
+        self.cache = cache
+
+    def __call__(self, query_text: str) -> list[float]:
+        return self.embed_many([query_text])[0]
+
+    def embed_many(self, query_texts: list[str]) -> list[list[float]]:
+        """Embed several queries, sending all cache misses to the provider in one call"""
+        keys = [normalize_query(query_text) for query_text in query_texts]
+        vectors = {}
+        missing = {}  # key -> one query text with that key
+        for key, query_text in zip(keys, query_texts):
+            if key in vectors or key in missing:
+                continue
+            vector = self.cache.get(key)
+            if vector is not None:
+                vectors[key] = vector
+            else:
+                missing[key] = query_text
+
+        if missing:
+            missing_keys = list(missing)
+            # The key only deduplicates; the provider gets the user's own text, embedded
+            # the same way as the documents were
+            embeddings = self.provider.embed([missing[key] for key in missing_keys])
+            for key, embedding in zip(missing_keys, embeddings):
+                vectors[key] = embedding
+                self.cache.put(key, embedding)
+        return [vectors[key] for key in keys]
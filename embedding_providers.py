@@ -0,0 +1,311 @@
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import openai
+
+from embedding_cache import turkish_casefold
+from lexical_index import TURKISH_STOPWORDS, stem
+
+
+# Files of a fitted local model, written under <artifact version>/embedding/
+LOCAL_VOCABULARY_FILE = "vocabulary.json"
+LOCAL_IDF_FILE = "idf.npy"
+LOCAL_COMPONENTS_FILE = "components.npy"
+
+_WORD_PATTERN = re.compile(r"\w+")
+_FOLD_CIRCUMFLEX = str.maketrans("âîû", "aiu")
+
+
+class EmbeddingProvider(ABC):
+    """
+    Turns texts into unit-length vectors, for ingestion and for queries alike.
+
+    `identity` names the vector space: two providers with the same identity
+    give the same vector for the same text, so it is recorded in the index
+    artifact and an index is only ever queried with a matching provider.
+    """
+
+    name = "base"
+    model_name = ""
+    batch_size = 100
+
+    @property
+    @abstractmethod
+    def identity(self) -> str:
+        """Name of the vector space this provider embeds into"""
+
+    @abstractmethod
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """One unit-length vector per text"""
+
+    def embed_documents(self, texts: list[str], progress=None) -> list[list[float]]:
+        """Embed a corpus in batches, calling progress(batches_done, batches_total) after each"""
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        embeddings = []
+        for done, batch in enumerate(batches, start=1):
+            embeddings.extend(self.embed(batch))
+            if progress:
+                progress(done, len(batches))
+        return embeddings
+
+    def save(self, path: str):
+        """Write whatever is needed to rebuild this provider; remote models need nothing"""
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the OpenAI API. The identity is the model name (what older indexes recorded)."""
+
+    name = "openai"
+
+    def __init__(self, client, model_name: str, batch_size: int = 100, max_concurrency: int = 1,
+                 max_retries: int = 0, retry_base_seconds: float = 1.0):
+        self.client = client
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+
+    @property
+    def identity(self) -> str:
+        return self.model_name
+
+    def embed_batch(self, batch: list[str]) -> list[list[float]]:
+        """One embeddings request, retried with exponential backoff and jitter on transient errors"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.embeddings.create(model=self.model_name, input=batch)
+                return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+            except (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError,
+                    openai.InternalServerError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_base_seconds * (2 ** attempt) * (1 + random.random())
+                print(f"Embedding request failed ({type(e).__name__}); retrying in {delay:.1f}s...")
+                time.sleep(delay)
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            embeddings.extend(self.embed_batch(texts[start:start + self.batch_size]))
+        return embeddings
+
+    def embed_documents(self, texts: list[str], progress=None) -> list[list[float]]:
+        """Embed texts in batches with bounded concurrency, preserving order"""
+        if not texts:
+            return []
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            embeddings = []
+            for done, batch_embeddings in enumerate(executor.map(self.embed_batch, batches), start=1):
+                embeddings.extend(batch_embeddings)
+                if progress:
+                    progress(done, len(batches))
+            return embeddings
+
+
+def text_features(text: str, ngram_range: tuple[int, int] = (3, 5)) -> list[str]:
+    """
+    Sparse features of a text: stemmed words ("w:") plus character n-grams of
+    each word padded with spaces ("c:"), which catch the suffixes and
+    compounds a light stemmer misses.
+    """
+    words = [
+        word for word in _WORD_PATTERN.findall(
+            turkish_casefold(unicodedata.normalize("NFC", text)).translate(_FOLD_CIRCUMFLEX))
+        if word not in TURKISH_STOPWORDS
+    ]
+    features = [f"w:{stem(word)}" for word in words]
+    min_n, max_n = ngram_range
+    for word in words:
+        padded = f" {word} "
+        for n in range(min_n, max_n + 1):
+            features.extend(f"c:{padded[i:i + n]}" for i in range(max(1, len(padded) - n + 1)))
+    return features
+
+
+def _segment_sums(values: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+    """Sum of values[indptr[i]:indptr[i + 1]] for every i; empty segments sum to zero"""
+    sums = np.zeros((len(indptr) - 1,) + values.shape[1:], dtype=values.dtype)
+    nonempty = indptr[:-1] < indptr[1:]
+    if len(values):
+        sums[nonempty] = np.add.reduceat(values, indptr[:-1][nonempty], axis=0)
+    return sums
+
+
+def _sparse_matmul(indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, dense: np.ndarray,
+                   max_block_values: int = 1 << 24) -> np.ndarray:
+    """CSR matrix times a dense matrix, in row blocks so the gathered rows stay under max_block_values"""
+    rows = len(indptr) - 1
+    result = np.zeros((rows, dense.shape[1]), dtype=dense.dtype)
+    average_row = max(1, len(indices) // max(1, rows))
+    block_rows = max(1, max_block_values // (average_row * dense.shape[1]))
+    for start in range(0, rows, block_rows):
+        stop = min(rows, start + block_rows)
+        lo, hi = indptr[start], indptr[stop]
+        gathered = data[lo:hi, None] * dense[indices[lo:hi]]
+        result[start:stop] = _segment_sums(gathered, indptr[start:stop + 1] - lo)
+    return result
+
+
+def truncated_svd_components(indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, n_columns: int,
+                             dimension: int, oversample: int = 10, power_iterations: int = 4,
+                             seed: int = 0) -> np.ndarray:
+    """
+    Top right singular vectors (n_columns x dimension) of a sparse CSR matrix,
+    by randomized SVD with power iterations. The seed is fixed so refitting
+    the same corpus gives the same model.
+    """
+    rows = len(indptr) - 1
+    row_ids = np.repeat(np.arange(rows), np.diff(indptr))
+    order = np.argsort(indices, kind="stable")
+    t_indptr = np.concatenate([[0], np.cumsum(np.bincount(indices, minlength=n_columns))])
+    t_indices, t_data = row_ids[order], data[order]
+
+    width = min(dimension + oversample, rows, n_columns)
+    rng = np.random.default_rng(seed)
+    basis, _ = np.linalg.qr(_sparse_matmul(indptr, indices, data, rng.standard_normal((n_columns, width))))
+    for _ in range(power_iterations):
+        projected, _ = np.linalg.qr(_sparse_matmul(t_indptr, t_indices, t_data, basis))
+        basis, _ = np.linalg.qr(_sparse_matmul(indptr, indices, data, projected))
+    # basis^T X, as (X^T basis)^T; its right singular vectors are those of X
+    _, _, vt = np.linalg.svd(_sparse_matmul(t_indptr, t_indices, t_data, basis).T, full_matrices=False)
+    components = vt[:dimension].T
+    # Singular vectors are only defined up to sign; pin it so refits compare equal
+    signs = np.sign(components[np.abs(components).argmax(axis=0), np.arange(components.shape[1])])
+    signs[signs == 0] = 1.0
+    return components * signs
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    Latent semantic embeddings fitted on our own corpus: TF-IDF over stemmed
+    words and character n-grams, projected onto the top singular vectors.
+
+    Runs on the CPU with NumPy only and needs no downloads. Embedding a query
+    is a dictionary lookup per feature plus one small matrix product, well
+    under a millisecond. The identity is a hash of the fitted model, so an
+    index is never queried with a model fitted on a different corpus.
+    """
+
+    name = "local"
+    model_name = "local-lsa"
+    batch_size = 1000
+
+    def __init__(self, features: list[str], idf: np.ndarray, components: np.ndarray,
+                 ngram_range: tuple[int, int] = (3, 5)):
+        self.features = features
+        self.vocabulary = {feature: column for column, feature in enumerate(features)}
+        self.idf = idf
+        self.components = components
+        self.ngram_range = tuple(ngram_range)
+        self._identity = None
+
+    @property
+    def dimension(self) -> int:
+        return self.components.shape[1]
+
+    @property
+    def identity(self) -> str:
+        if self._identity is None:
+            digest = hashlib.sha256(json.dumps(
+                {"model": self.model_name, "ngram_range": self.ngram_range, "features": self.features},
+                ensure_ascii=False).encode("utf-8"))
+            digest.update(np.ascontiguousarray(self.idf, dtype=np.float32).tobytes())
+            digest.update(np.ascontiguousarray(self.components, dtype=np.float32).tobytes())
+            self._identity = f"{self.model_name}:{digest.hexdigest()[:16]}"
+        return self._identity
+
+    def weights(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        """(columns, L2-normalized sublinear TF-IDF weights) of the known features of a text"""
+        counts = Counter(
+            self.vocabulary[feature] for feature in text_features(text, self.ngram_range)
+            if feature in self.vocabulary
+        )
+        columns = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        values = np.fromiter((1.0 + math.log(count) for count in counts.values()), dtype=np.float32,
+                             count=len(counts)) * self.idf[columns]
+        norm = np.linalg.norm(values)
+        return columns, values / norm if norm else values
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            columns, values = self.weights(text)
+            if len(columns):
+                vectors[row] = values @ self.components[columns]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).tolist()
+
+    @classmethod
+    def fit(cls, texts: list[str], dimension: int = 256, max_features: int = 50_000,
+            ngram_range: tuple[int, int] = (3, 5)):
+        """Fit the vocabulary, IDF weights and projection on a corpus"""
+        if not texts:
+            raise ValueError("Cannot fit a local embedding model on an empty corpus")
+        document_counts = [Counter(text_features(text, ngram_range)) for text in texts]
+        document_frequency = Counter()
+        for counts in document_counts:
+            document_frequency.update(counts.keys())
+        # Most widespread features first, ties in a fixed order, so fits are reproducible
+        features = sorted(document_frequency, key=lambda feature: (-document_frequency[feature], feature))
+        features = features[:max_features]
+        vocabulary = {feature: column for column, feature in enumerate(features)}
+        frequencies = np.array([document_frequency[feature] for feature in features], dtype=np.float64)
+        idf = (np.log((1 + len(texts)) / (1 + frequencies)) + 1.0).astype(np.float32)
+
+        indptr, indices, data = [0], [], []
+        for counts in document_counts:
+            row = sorted((vocabulary[feature], 1.0 + math.log(count))
+                         for feature, count in counts.items() if feature in vocabulary)
+            columns = np.array([column for column, _ in row], dtype=np.int64)
+            values = np.array([value for _, value in row], dtype=np.float64) * idf[columns]
+            norm = np.linalg.norm(values)
+            indices.append(columns)
+            data.append(values / norm if norm else values)
+            indptr.append(indptr[-1] + len(columns))
+        components = truncated_svd_components(
+            np.array(indptr, dtype=np.int64), np.concatenate(indices), np.concatenate(data),
+            len(features), dimension)
+        return cls(features, idf, components.astype(np.float32), ngram_range)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, LOCAL_VOCABULARY_FILE), "w", encoding="utf-8") as f:
+            json.dump({"identity": self.identity, "ngram_range": list(self.ngram_range),
+                       "features": self.features}, f, ensure_ascii=False)
+        np.save(os.path.join(path, LOCAL_IDF_FILE), self.idf)
+        np.save(os.path.join(path, LOCAL_COMPONENTS_FILE), np.ascontiguousarray(self.components))
+
+    @classmethod
+    def load(cls, path: str):
+        """Load a fitted model; ValueError if its files do not hash to the identity they were saved with"""
+        with open(os.path.join(path, LOCAL_VOCABULARY_FILE), "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        provider = cls(
+            saved["features"],
+            np.load(os.path.join(path, LOCAL_IDF_FILE)),
+            np.load(os.path.join(path, LOCAL_COMPONENTS_FILE)),
+            saved["ngram_range"]
+        )
+        if provider.identity != saved["identity"]:
+            raise ValueError(f"Local embedding model in '{path}' is corrupt ({provider.identity} != {saved['identity']})")
+        return provider
+
+
+def matches_configuration(identity: str, provider_name: str, model_name: str) -> bool:
+    """Whether vectors with this identity are what the configured provider would produce"""
+    if provider_name == "local":
+        return identity.startswith(f"{LocalEmbeddingProvider.model_name}:")
+    return identity == model_name
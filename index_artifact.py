@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds are not serialized across processes
+    fcntl = None
+
+from lexical_index import BM25Index
+from vector_index import VectorIndex
+
+
+# 2: records and BM25 postings are memory-mappable files instead of JSON
+ARTIFACT_FORMAT = 2
+MANIFEST_FILE = "manifest.json"
+LEXICAL_DIR = "lexical"
+# Files a local embedding provider needs to embed queries into this artifact's space
+EMBEDDING_DIR = "embedding"
+# Names the version directory to serve; replaced atomically after a build
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".build.lock"
+
+
+class IncompatibleArtifactError(ValueError):
+    """The artifact was written in a format this code cannot read; rebuild it"""
+
+
+def artifact_version(document_hashes: dict, embedding_identity: str, metadatas=(), build_id: str | None = None) -> str:
+    """
+    Deterministic version: the same documents with the same metadata, embedded
+    by the same provider, give the same version. A `build_id` (full rebuilds)
+    makes it unique, so freshly embedded vectors never land on an existing version.
+    """
+    digest = hashlib.sha256(f"{ARTIFACT_FORMAT}\0{embedding_identity}\n".encode("utf-8"))
+    if build_id:
+        digest.update(f"build\0{build_id}\n".encode("utf-8"))
+    for doc_id in sorted(document_hashes):
+        digest.update(f"{doc_id}\0{document_hashes[doc_id]}\n".encode("utf-8"))
+    for metadata in metadatas:
+        digest.update(json.dumps(metadata, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+@contextmanager
+def build_lock(root: str):
+    """
+    Exclusive lock across processes on the artifact root. Held while building
+    or syncing from an artifact, so concurrent workers (or a CLI run) do the
+    work once and the others wait, then find the index up to date.
+    """
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_FILE), "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def current_version(root: str) -> str | None:
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_current_version(root: str, version: str):
+    """Point CURRENT at a complete version directory; readers see the old or the new name, never a partial one"""
+    if not os.path.isfile(os.path.join(root, version, MANIFEST_FILE)):
+        raise FileNotFoundError(f"No index artifact version '{version}' under '{root}'")
+    current_path = os.path.join(root, CURRENT_FILE)
+    with open(current_path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(f"{version}\n")
+    os.replace(current_path + ".tmp", current_path)
+
+
+def list_versions(root: str) -> list[dict]:
+    """Manifests of the complete versions under root (without document hashes), newest first"""
+    versions = []
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return versions
+    for name in names:
+        try:
+            with open(os.path.join(root, name, MANIFEST_FILE), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, NotADirectoryError, ValueError):
+            continue  # lock file, CURRENT, or a build still in its scratch directory
+        manifest.pop("documents", None)
+        versions.append(manifest)
+    return sorted(versions, key=lambda manifest: manifest.get("created_at", 0), reverse=True)
+
+
+def prune_versions(root: str, keep: int, protect=()) -> list[str]:
+    """
+    Delete all but the `keep` newest versions, never the current one or those
+    in `protect`. Call it under build_lock. Keep at least 2, and protect the
+    version that was current before a build, so workers still finishing on it
+    are not pulled from under them (memory-mapped files stay readable after
+    deletion, Chroma collections do not).
+    """
+    current = current_version(root)
+    kept = {version for version in (current, *protect) if version}
+    removed = []
+    for manifest in list_versions(root):
+        version = manifest["version"]
+        if version in kept:
+            continue
+        if len(kept) < keep:
+            kept.add(version)
+            continue
+        shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+        removed.append(version)
+    return removed
+
+
+class IndexArtifact:
+    """
+    A self-contained, versioned search index: the embedding matrix and records
+    (VectorIndex files), the BM25 postings, a fitted local embedding model if
+    one made the embeddings, and a manifest, all in <root>/<version>/.
+
+    A version directory is never modified once written, so it can be baked
+    into an image or mounted read-only. Loading it memory-maps the embeddings,
+    documents, metadata and postings, with no parsing or network calls, so any
+    number of worker processes share one copy through the page cache.
+    """
+
+    def __init__(self, path: str, manifest: dict, vector_index: VectorIndex, lexical_index: BM25Index):
+        self.path = path
+        self.manifest = manifest
+        self.vector_index = vector_index
+        self.lexical_index = lexical_index
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+    @property
+    def embedding_model(self) -> str:
+        return self.manifest["embedding_model"]
+
+    @property
+    def embedding_provider(self) -> str:
+        """Identity of the provider that made the embeddings (older artifacts only recorded the model)"""
+        return self.manifest.get("embedding_provider", self.manifest["embedding_model"])
+
+    @property
+    def embedding_path(self) -> str:
+        return os.path.join(self.path, EMBEDDING_DIR)
+
+    @property
+    def document_hashes(self) -> dict:
+        return self.manifest.get("documents", {})
+
+    def count(self) -> int:
+        return self.vector_index.count()
+
+    @classmethod
+    def load(cls, root: str, version: str | None = None, mmap: bool = True):
+        """Load the given version, or the current one; FileNotFoundError if there is none"""
+        version = version or current_version(root)
+        if not version:
+            raise FileNotFoundError(f"No index artifact under '{root}'")
+        path = os.path.join(root, version)
+        with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != ARTIFACT_FORMAT:
+            raise IncompatibleArtifactError(
+                f"Index artifact '{path}' has format {manifest.get('format')}, expected {ARTIFACT_FORMAT}")
+        return cls(
+            path,
+            manifest,
+            VectorIndex.load(path, mmap=mmap),
+            BM25Index.load(os.path.join(path, LEXICAL_DIR), mmap=mmap)
+        )
+
+    @classmethod
+    def write(cls, root: str, vector_index: VectorIndex, lexical_index: BM25Index,
+              document_hashes: dict, embedding_provider, build_id: str | None = None):
+        """
+        Write a new version next to the existing ones and make it current. An
+        identical version that already exists is reused; pass a `build_id` to
+        always write a new one.
+        """
+        version = artifact_version(document_hashes, embedding_provider.identity, vector_index.metadatas, build_id)
+        path = os.path.join(root, version)
+        manifest = {
+            "format": ARTIFACT_FORMAT,
+            "version": version,
+            "created_at": time.time(),
+            "embedding_model": embedding_provider.model_name,
+            "embedding_provider": embedding_provider.identity,
+            "dimension": vector_index.dimension,
+            "document_count": vector_index.count(),
+            "documents": document_hashes
+        }
+        if build_id:
+            manifest["build_id"] = build_id
+
+        if not os.path.isdir(path):
+            # Build in a scratch directory and rename it into place, so a
+            # version directory is either complete or absent
+            temp_path = os.path.join(root, f".{version}.tmp-{os.getpid()}")
+            shutil.rmtree(temp_path, ignore_errors=True)
+            vector_index.save(temp_path)
+            lexical_index.save(os.path.join(temp_path, LEXICAL_DIR))
+            embedding_provider.save(os.path.join(temp_path, EMBEDDING_DIR))
+            with open(os.path.join(temp_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.rename(temp_path, path)
+
+        set_current_version(root, version)
+        return cls.load(root, version)
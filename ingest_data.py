@@ -1,128 +1,394 @@
 import os
 import json
+import hashlib
+import argparse
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
-import chromadb
 from openai import OpenAI
 
 # Assuming legal_parser.py is in the same directory or accessible
-from legal_parser import parse_legal_text
+from legal_parser import parse_legal_text, chunk_article
+from context_packing import count_tokens
+from embedding_providers import LocalEmbeddingProvider, OpenAIEmbeddingProvider
 
 # --- Configuration ---
 load_dotenv()  # Load environment variables from .env file
 
-TEXT_FILE_PATH = "source_data/TBK_Konut_ve_Catili_Isyeri_Kiralari.txt"
+# Every .txt file under this directory (recursively) is parsed and indexed
+SOURCE_DATA_DIR = os.getenv("SOURCE_DATA_DIR", "source_data")
+# Source files are parsed in a process pool with this many workers
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+# "paragraph" stores each fıkra-level chunk as a document, "article" stores whole articles
+CHUNKING_MODE = os.getenv("CHUNKING_MODE", "paragraph").lower()
+MIN_CHUNK_CHARS = int(os.getenv("MIN_CHUNK_CHARS", "200"))
 # PARSED_ARTICLES_JSON_PATH = "parsed_articles.json" # Output of parser, not directly used by ingest if parsing on the fly
 # Directory where ChromaDB will store its data
 CHROMA_DB_PATH = "./chroma_db_store"
 CHROMA_COLLECTION_NAME = "tbk_kira_articles"
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# "openai" (EMBEDDING_MODEL_NAME through the API) or "local" (a TF-IDF + SVD model
+# fitted on the corpus at ingestion time and stored in the index artifact)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
 # Standard OpenAI embedding model
-EMBEDDING_MODEL_NAME = "text-embedding-ada-002"
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "text-embedding-ada-002")
+# Width of local embeddings (capped by the number of documents)
+LOCAL_EMBEDDING_DIMENSION = int(os.getenv("LOCAL_EMBEDDING_DIMENSION", "256"))
+# Which backend to serve: "chroma" (persistent collection) or "numpy" (in-process VectorIndex)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma").lower()
+# Versioned index artifacts (embeddings, records, BM25 postings, manifest) are
+# written here for every backend, next to the version being served; each version
+# gets its own Chroma collection, filled from the artifact
+INDEX_PATH = os.getenv("INDEX_PATH", os.path.join(CHROMA_DB_PATH, "index"))
+# Versions (artifacts and Chroma collections) kept after an ingestion: the new one and
+# the previous one, which running servers finish in-flight requests on
+INDEX_KEEP_VERSIONS = max(2, int(os.getenv("INDEX_KEEP_VERSIONS", "2")))
+# Embedding requests: inputs per request, requests in flight, retries with exponential backoff
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+EMBEDDING_RETRY_BASE_SECONDS = 1.0
 
 # --- Main Ingestion Logic ---
 
 
-def main():
-    print("Starting data ingestion process...")
+def report_progress(progress, stage: str, **detail):
+    """Forward a progress update to an optional callback (the API's readiness probe uses it)"""
+    if progress:
+        progress(stage, detail)
 
-    # 1. Check API Key
-    if not OPENAI_API_KEY:
-        raise ValueError(
-            "OPENAI_API_KEY not found in environment variables. Please set it in Coolify.")
 
-    # 2. Parse legal text
-    print(f"Parsing legal text from: {TEXT_FILE_PATH}")
-    articles_data = parse_legal_text(TEXT_FILE_PATH)
-    if not articles_data:
-        print("No articles parsed from the text file. Exiting.")
+def content_hash(doc_id: str, document: str, metadata: dict, embedding_identity: str) -> str:
+    """Hash of everything that affects a stored embedding, including the provider that made it"""
+    payload = json.dumps([
+        doc_id,
+        metadata.get("article_number", ""),
+        metadata.get("article_header", ""),
+        document,
+        embedding_identity
+    ], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def plan_changes(hashes: dict, manifest: dict, indexed_ids: set) -> tuple[list[str], list[str]]:
+    """Return (ids to embed and upsert, ids to delete)"""
+    changed = [
+        doc_id for doc_id, digest in hashes.items()
+        if doc_id not in indexed_ids or manifest.get(doc_id) != digest
+    ]
+    removed = sorted(indexed_ids - hashes.keys())
+    return changed, removed
+
+
+def create_embedding_provider(documents: list[str]):
+    """The configured embedding provider; the local one is fitted on the documents being indexed"""
+    if EMBEDDING_PROVIDER == "local":
+        print(f"Fitting local embedding model on {len(documents)} documents ({LOCAL_EMBEDDING_DIMENSION} dims)...")
+        provider = LocalEmbeddingProvider.fit(documents, dimension=LOCAL_EMBEDDING_DIMENSION)
+        print(f"Local embedding model {provider.identity}: {len(provider.features)} features, "
+              f"{provider.dimension} dims")
+        return provider
+    # Retries are handled by the provider, so the client itself should not retry too
+    return OpenAIEmbeddingProvider(
+        OpenAI(api_key=OPENAI_API_KEY, max_retries=0),
+        EMBEDDING_MODEL_NAME,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+        max_retries=EMBEDDING_MAX_RETRIES,
+        retry_base_seconds=EMBEDDING_RETRY_BASE_SECONDS
+    )
+
+
+def embed_documents(provider, texts: list[str], progress=None) -> list[list[float]]:
+    """Embed texts in batches, preserving order and reporting progress per batch"""
+    if not texts:
+        return []
+    batches_total = -(-len(texts) // provider.batch_size)
+    print(f"Embedding {len(texts)} documents with '{provider.identity}' in {batches_total} batches...")
+    return provider.embed_documents(texts, progress=lambda done, total: report_progress(
+        progress, "embedding", batches_done=done, batches_total=total))
+
+
+def chroma_collection_name(version: str) -> str:
+    return f"{CHROMA_COLLECTION_NAME}_{version}"
+
+
+def open_chroma_collection(artifact):
+    """
+    Open the collection of an artifact version. Every write and query passes
+    its own vectors, so the collection has no embedding function. Versions
+    are content-addressed, so a collection only ever holds one version's
+    records, and a new version never touches the collection being served.
+    """
+    import chromadb
+
+    print(f"Setting up ChromaDB persistent client at: {CHROMA_DB_PATH}")
+    chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+    name = chroma_collection_name(artifact.version)
+    print(f"Attempting to get or create ChromaDB collection: '{name}'")
+    return chroma_client.get_or_create_collection(
+        name=name,
+        embedding_function=None,
+        metadata={"index_version": artifact.version, "embedding_provider": artifact.embedding_provider}
+    )
+
+
+def sync_chroma_collection(collection, artifact, full_rebuild: bool = False) -> bool:
+    """
+    Fill a version's collection with the artifact's records and embeddings
+    (no embedding calls). Only records that are missing are written, so an
+    interrupted fill resumes and a complete collection costs one id listing;
+    a full rebuild rewrites them all in place, so the collection stays
+    queryable if it is the one being served.
+    """
+    index = artifact.vector_index
+    indexed_ids = set() if full_rebuild else set(collection.get(include=[])["ids"])
+    missing = [doc_id for doc_id in index.ids if doc_id not in indexed_ids]
+    print(f"Collection '{collection.name}' has {len(indexed_ids)} documents: {len(missing)} to add.")
+
+    positions = {doc_id: i for i, doc_id in enumerate(index.ids)}
+    for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+        batch_positions = [positions[doc_id] for doc_id in missing[start:start + EMBEDDING_BATCH_SIZE]]
+        collection.upsert(
+            ids=[index.ids[i] for i in batch_positions],
+            embeddings=[index.embeddings[i].tolist() for i in batch_positions],
+            documents=[index.documents[i] for i in batch_positions],
+            metadatas=[index.metadatas[i] for i in batch_positions]
+        )
+
+    # Verification (optional but recommended)
+    count = collection.count()
+    print(f"Verification: Collection '{collection.name}' now contains {count} documents.")
+    if count != index.count():
+        print(f"Error: Expected {index.count()} documents in the collection but found {count}.")
+    return bool(missing)
+
+
+def prune_old_versions(protect=()):
+    """Delete index artifact versions and Chroma collections beyond INDEX_KEEP_VERSIONS; call under the build lock"""
+    from index_artifact import list_versions, prune_versions
+
+    removed = prune_versions(INDEX_PATH, INDEX_KEEP_VERSIONS, protect)
+    if removed:
+        print(f"Removed old index artifact versions: {', '.join(removed)}")
+    if RETRIEVAL_BACKEND != "chroma":
         return
-    print(f"Successfully parsed {len(articles_data)} articles.")
+    import chromadb
+
+    chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+    kept = {chroma_collection_name(manifest["version"]) for manifest in list_versions(INDEX_PATH)}
+    for collection in chroma_client.list_collections():
+        name = collection if isinstance(collection, str) else collection.name
+        # The unversioned collection is what older releases synced in place
+        if (name == CHROMA_COLLECTION_NAME or name.startswith(f"{CHROMA_COLLECTION_NAME}_")) and name not in kept:
+            chroma_client.delete_collection(name)
+            print(f"Removed old ChromaDB collection '{name}'")
+
+
+def load_current_artifact():
+    """The artifact currently served from INDEX_PATH, or None if there is none (usable) yet"""
+    from index_artifact import IncompatibleArtifactError, IndexArtifact
+
+    try:
+        return IndexArtifact.load(INDEX_PATH)
+    except FileNotFoundError:
+        return None
+    except IncompatibleArtifactError as e:
+        print(f"{e}; rebuilding it.")
+        return None
+
+
+def build_index_artifact(documents_to_store, metadatas_to_store, ids_to_store, hashes, provider,
+                         full_rebuild=False, progress=None):
+    """
+    Write a new index artifact version, reusing the current artifact's embeddings
+    for unchanged documents. A full rebuild re-embeds everything into a version
+    of its own, even if the documents are unchanged. Returns (artifact, whether
+    a new version was written).
+    """
+    from index_artifact import IndexArtifact
+    from lexical_index import BM25Index, document_search_text
+    from vector_index import VectorIndex
+
+    previous = None if full_rebuild else load_current_artifact()
+    previous_index = previous.vector_index if previous else None
+    indexed_ids = set(previous_index.ids) if previous else set()
+    changed, removed = plan_changes(hashes, previous.document_hashes if previous else {}, indexed_ids)
+    print(
+        f"Index artifact {previous.version if previous else '(none)'} has {len(indexed_ids)} documents: "
+        f"{len(changed)} to embed, {len(removed)} to delete.")
+    if previous and not changed and not removed and previous_index.ids == ids_to_store \
+            and list(previous_index.metadatas) == metadatas_to_store:
+        return previous, False
+
+    report_progress(progress, "embedding", batches_done=0,
+                    batches_total=-(-len(changed) // provider.batch_size))
+    positions = {doc_id: i for i, doc_id in enumerate(ids_to_store)}
+    fresh = dict(zip(changed, embed_documents(
+        provider, [documents_to_store[positions[doc_id]] for doc_id in changed], progress=progress)))
+    previous_positions = {doc_id: i for i, doc_id in enumerate(previous_index.ids)} if previous else {}
+    embeddings = [
+        fresh[doc_id] if doc_id in fresh else previous_index.embeddings[previous_positions[doc_id]]
+        for doc_id in ids_to_store
+    ]
+
+    report_progress(progress, "writing")
+    vector_index = VectorIndex.build(embeddings, ids_to_store, documents_to_store, metadatas_to_store)
+    # BM25 over article number, header and text (the lexical path needs no embeddings)
+    lexical_index = BM25Index.build(ids_to_store, [
+        document_search_text(document, metadata)
+        for document, metadata in zip(documents_to_store, metadatas_to_store)
+    ])
+    artifact = IndexArtifact.write(INDEX_PATH, vector_index, lexical_index, hashes, provider,
+                                   build_id=uuid.uuid4().hex if full_rebuild else None)
+    print(
+        f"Index artifact {artifact.version} with {artifact.count()} documents ({vector_index.dimension} dims) "
+        f"and {lexical_index.term_count()} terms written to {artifact.path}")
+    return artifact, True
+
+
+def list_source_files() -> list[str]:
+    """All .txt files under SOURCE_DATA_DIR, in a stable order"""
+    source_files = []
+    for root, _, file_names in os.walk(SOURCE_DATA_DIR):
+        source_files.extend(os.path.join(root, name) for name in file_names if name.endswith(".txt"))
+    return sorted(source_files)
+
+
+def source_id_for(file_path: str) -> str:
+    """Stable source name for a file: its path under SOURCE_DATA_DIR without the extension"""
+    relative_path = os.path.relpath(file_path, SOURCE_DATA_DIR)
+    return os.path.splitext(relative_path)[0].replace(os.sep, "/")
+
+
+def prepare_source(file_path: str, chunking_mode: str | None = None) -> tuple[list[str], list[dict], list[str]]:
+    """Parse and chunk one source file; runs in a worker process"""
+    chunking_mode = chunking_mode or CHUNKING_MODE
+    source_id = source_id_for(file_path)
+    articles_data = parse_legal_text(file_path)
 
-    # Prepare data for ChromaDB
     documents_to_store = []
     metadatas_to_store = []
     ids_to_store = []
 
-    for i, article in enumerate(articles_data):
+    for article in articles_data:
         if not article.get('text') or not article.get('text').strip():
             print(
-                f"Warning: Article {article.get('article_number', 'Unknown')} has empty text. Skipping.")
+                f"Warning: Article {article.get('article_number', 'Unknown')} in {source_id} has empty text. Skipping.")
             continue
 
-        documents_to_store.append(article['text'])
-        metadatas_to_store.append({
-            "article_number": str(article['article_number']),  # Ensure string
-            "article_header": str(article['article_header'])  # Ensure string
-        })
-        # Use article number as a unique ID. Ensure it's a string.
-        ids_to_store.append(str(article['article_number']))
+        if chunking_mode == "paragraph":
+            chunks = chunk_article(article['text'], min_chunk_chars=MIN_CHUNK_CHARS)
+        else:
+            chunks = [{'text': article['text'], 'char_start': 0, 'char_end': len(article['text'])}]
 
-    if not documents_to_store:
-        print("No valid documents to add to ChromaDB after filtering. Exiting.")
-        return
+        for chunk_index, chunk in enumerate(chunks):
+            documents_to_store.append(chunk['text'])
+            metadatas_to_store.append({
+                "article_number": str(article['article_number']),  # Ensure string
+                "article_header": str(article['article_header']),  # Ensure string
+                "source": source_id,
+                "chunk_index": chunk_index,
+                "chunk_count": len(chunks),
+                # Character offsets of the chunk within the article text
+                "char_start": chunk['char_start'],
+                "char_end": chunk['char_end'],
+                # Precomputed so the API can pack prompts to a token budget without tokenizing
+                "token_count": count_tokens(chunk['text'])
+            })
+            # Source, article number and chunk index make a unique, stable ID
+            ids_to_store.append(f"{source_id}:{article['article_number']}#{chunk_index}")
 
-    # 3. Setup ChromaDB client and collection
-    print(f"Setting up ChromaDB persistent client at: {CHROMA_DB_PATH}")
-    chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+    print(f"Parsed {len(articles_data)} articles into {len(ids_to_store)} documents from {file_path}")
+    return documents_to_store, metadatas_to_store, ids_to_store
 
-    # Embedding function using standard OpenAI API
-    from chromadb.utils import embedding_functions
 
-    # Configure OpenAI embedding function with standard settings
-    openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-        api_key=OPENAI_API_KEY,
-        model_name=EMBEDDING_MODEL_NAME
-    )
+def load_documents(chunking_mode: str | None = None):
+    """Parse every source file into (documents, metadatas, ids) ready for indexing"""
+    chunking_mode = chunking_mode or CHUNKING_MODE
+    source_files = list_source_files()
+    if not source_files:
+        print(f"No .txt source files found under {SOURCE_DATA_DIR}.")
+        return [], [], []
+    print(f"Parsing {len(source_files)} source files from: {SOURCE_DATA_DIR} ({chunking_mode} chunks)")
 
-    print(
-        f"Attempting to get or create ChromaDB collection: '{CHROMA_COLLECTION_NAME}'")
+    workers = max(1, min(INGEST_WORKERS, len(source_files)))
+    if workers == 1:
+        prepared = [prepare_source(file_path, chunking_mode) for file_path in source_files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            prepared = list(executor.map(prepare_source, source_files, [chunking_mode] * len(source_files)))
 
-    # To ensure the collection uses the correct embedding function,
-    # it's often safer to delete and recreate if it exists
-    try:
-        print(
-            f"Checking if collection '{CHROMA_COLLECTION_NAME}' already exists...")
-        chroma_client.delete_collection(name=CHROMA_COLLECTION_NAME)
-        print(
-            f"Collection '{CHROMA_COLLECTION_NAME}' existed and was deleted to ensure a fresh start with the correct embedding function.")
-    except Exception as e:
-        print(
-            f"Collection '{CHROMA_COLLECTION_NAME}' either did not exist or another error occurred during deletion attempt: {e}. Proceeding to create.")
-        pass
-
-    collection = chroma_client.get_or_create_collection(
-        name=CHROMA_COLLECTION_NAME,
-        embedding_function=openai_ef
-    )
-    print(f"Collection '{CHROMA_COLLECTION_NAME}' is ready.")
+    documents_to_store = []
+    metadatas_to_store = []
+    ids_to_store = []
+    for documents, metadatas, ids in prepared:
+        documents_to_store.extend(documents)
+        metadatas_to_store.extend(metadatas)
+        ids_to_store.extend(ids)
+    print(f"Prepared {len(ids_to_store)} documents for indexing.")
+    return documents_to_store, metadatas_to_store, ids_to_store
 
-    # 4. Add documents to ChromaDB
-    print(
-        f"Adding {len(documents_to_store)} documents to collection '{CHROMA_COLLECTION_NAME}'...")
 
-    collection.add(
-        documents=documents_to_store,
-        metadatas=metadatas_to_store,
-        ids=ids_to_store
-    )
-    print("Documents added to ChromaDB successfully.")
+def main(full_rebuild: bool = False, progress=None):
+    """Parse the sources, write an up-to-date index artifact and, for Chroma, sync the collection"""
+    print("Starting data ingestion process...")
 
-    # 5. Verification (optional but recommended)
-    count = collection.count()
-    print(
-        f"Verification: Collection '{CHROMA_COLLECTION_NAME}' now contains {count} documents.")
-    if count > 0 and count <= 5:  # Peek if few documents, to see structure
-        print("Sample of first few documents in the collection (structure check):")
-        sample_results = collection.peek(limit=5)  # Peek a few items
-        print(json.dumps(sample_results, indent=2, ensure_ascii=False))
-    elif count == 0 and len(documents_to_store) > 0:
-        print("Error: Documents were prepared but the collection count is 0. Check for issues during add.")
+    # 1. Check API Key
+    if EMBEDDING_PROVIDER == "openai" and not OPENAI_API_KEY:
+        raise ValueError(
+            "OPENAI_API_KEY not found in environment variables. Please set it in Coolify.")
+
+    # 2. Parse legal text
+    report_progress(progress, "parsing")
+    documents_to_store, metadatas_to_store, ids_to_store = load_documents()
+    if not documents_to_store:
+        print("No valid documents to index after parsing and filtering. Exiting.")
+        return None
+
+    # 3. Work out what changed since the last ingestion. A local model is refitted
+    # first: it is deterministic, so an unchanged corpus gives the same identity and
+    # nothing is re-embedded, while any change re-embeds everything in the new space.
+    provider = create_embedding_provider(documents_to_store)
+    hashes = {
+        doc_id: content_hash(doc_id, document, metadata, provider.identity)
+        for doc_id, document, metadata in zip(ids_to_store, documents_to_store, metadatas_to_store)
+    }
+    if full_rebuild:
+        print("Full rebuild requested: every document will be re-embedded.")
+
+    # 4. Write the index artifact, then bring the configured backend up to date.
+    # Under the build lock, a concurrent build (another worker or a CLI run)
+    # finishes first and this one then finds nothing left to do.
+    from index_artifact import build_lock, current_version
+
+    report_progress(progress, "waiting for build lock")
+    with build_lock(INDEX_PATH):
+        previous_version = current_version(INDEX_PATH)
+        artifact, changed = build_index_artifact(
+            documents_to_store, metadatas_to_store, ids_to_store, hashes, provider,
+            full_rebuild=full_rebuild, progress=progress)
+        if RETRIEVAL_BACKEND == "chroma":
+            report_progress(progress, "syncing")
+            sync_chroma_collection(open_chroma_collection(artifact), artifact, full_rebuild)
+
+        if changed:
+            # Running servers pick the new CURRENT version up and swap to it (see main.py)
+            print(f"Index version {artifact.version} is now current.")
+            prune_old_versions(protect=[previous_version])
+        else:
+            print("Index already up to date; nothing was re-embedded.")
 
     print("Data ingestion process complete.")
+    return artifact
 
 
 if __name__ == "__main__":
     # This ensures that .env is loaded when the script is run directly
     # and get_OPENAI_API_KEY() can access the environment variables.
     load_dotenv()
-    main()
+    parser = argparse.ArgumentParser(description="Parse the source text and update the search index.")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the current index artifact and re-embed every document")
+    args = parser.parse_args()
+    main(full_rebuild=args.full)
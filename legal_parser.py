@@ -1,15 +1,166 @@
+import io
 import re
 import json
-
-
-def parse_legal_text(file_path):
+import mmap
+import codecs
+
+
+# Regex to find MADDE lines.
+# Group 1: Full "MADDE <number>" (e.g., "MADDE 339")
+# Group 2: Just the number (e.g., "339")
+# Group 3: Text on the MADDE line after "MADDE <number> - " (e.g., "Konut ve...")
+MADDE_PATTERN = re.compile(r"^(MADDE\s(\d+))\s*-?\s*(.*)", re.MULTILINE)
+
+# Regex for identifying header lines.
+# Matches lines like:
+# "A. Some Text"
+# "I. Some Roman Numeral Text"
+# "1. Some Numbered Text"
+# "a. Some Lowercase Letter Text"
+# It's designed to pick specific, structured headers.
+HEADER_LINE_PATTERN = re.compile(
+    r"^\s*(?:[A-ZİÖÜÇŞĞ]\.|[IVXLCDM]+\.|[a-z]\.|\d+\.)\s+[a-zA-Z0-9ğüşıöçĞÜŞİÖÇ\s\(\),'/.:-]+$",
+    re.IGNORECASE
+)
+
+READ_BLOCK_SIZE = 1 << 20
+
+
+def _iter_text_blocks(file_path, use_mmap=False, block_size=READ_BLOCK_SIZE):
+    """Yield the decoded file contents in blocks, with universal newlines like open()"""
+    if not use_mmap:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    return
+                yield block
+
+    with open(file_path, 'rb') as f:
+        if not f.seek(0, io.SEEK_END):
+            return  # Empty files cannot be mapped
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            decoder = io.IncrementalNewlineDecoder(
+                codecs.getincrementaldecoder('utf-8')(), translate=True)
+            for offset in range(0, len(mapped), block_size):
+                block = decoder.decode(mapped[offset:offset + block_size])
+                if block:
+                    yield block
+            block = decoder.decode(b'', final=True)
+            if block:
+                yield block
+
+
+def _find_header(text, start, end):
+    """
+    Returns (header, header_start) for text[start:end]: the last line that looks
+    like a section header, and the offset of the first line with that same text,
+    where the preceding article's body ends. Headers sit right above the next
+    MADDE line, so lines are scanned backwards and the scan stops early.
+    """
+    line_end = end
+    while line_end > start:
+        line_start = text.rfind('\n', start, line_end) + 1 or start
+        line = text[line_start:line_end].strip()
+        if line and HEADER_LINE_PATTERN.match(line) and "MADDE" not in line.upper():
+            break
+        line_end = line_start - 1
+    else:
+        return "", end
+
+    # The same header text may appear on an earlier line of the block
+    position = text.find(line, start, line_start)
+    while position != -1:
+        first_start = text.rfind('\n', start, position) + 1 or start
+        first_end = text.find('\n', position, line_start)
+        if text[first_start:first_end if first_end != -1 else line_start].strip() == line:
+            return line, first_start
+        position = text.find(line, position + 1, line_start)
+    return line, line_start
+
+
+def _build_article(text, base, pending, body_end, include_offsets):
+    start, body_start, article_num_full, text_on_madde_line, article_header = pending
+    body_block = text[body_start:body_end]
+    actual_article_body_text = body_block.strip()
+
+    article_text_parts = []
+    if text_on_madde_line:
+        article_text_parts.append(text_on_madde_line)
+    if actual_article_body_text:  # Add body text only if it's not empty
+        article_text_parts.append(actual_article_body_text)
+
+    article = {
+        'article_number': article_num_full,
+        'article_header': article_header,
+        'text': "\n".join(article_text_parts).strip()
+    }
+    if include_offsets:
+        # Character offsets into the source text: from the MADDE line to the end of the body
+        article['char_start'] = base + start
+        article['char_end'] = base + body_start + len(body_block.rstrip())
+    return article
+
+
+def iter_legal_articles(file_path, use_mmap=False, include_offsets=True, block_size=READ_BLOCK_SIZE):
+    """
+    Streams the articles of a legal text file in a single pass, yielding one
+    dictionary per article (number, header, text and, with include_offsets,
+    its char_start/char_end in the source). The file is read block by block,
+    optionally through mmap, and only the text since the last MADDE line is
+    kept in memory.
+    """
+    blocks = _iter_text_blocks(file_path, use_mmap=use_mmap, block_size=block_size)
+    text, base = "", 0
+    # (start, end, article number, text on the MADDE line, header) of the last MADDE
+    # line seen; its body runs until the next one, so it is emitted one match late.
+    pending = None
+    scan_from = 0
+    at_eof = False
+
+    while not at_eof:
+        block = next(blocks, None)
+        if block is None:
+            at_eof = True
+        else:
+            # Drop everything before the pending article (or keep the preamble,
+            # which holds the first article's header)
+            keep_from = pending[0] if pending else 0
+            if keep_from:
+                text = text[keep_from:]
+                base += keep_from
+                scan_from -= keep_from
+                pending = (0, pending[1] - keep_from) + pending[2:]
+            text += block
+
+        for match in MADDE_PATTERN.finditer(text, scan_from):
+            if match.end() == len(text) and not at_eof:
+                # The MADDE line may continue in the next block
+                scan_from = match.start()
+                break
+            header_block_start = pending[1] if pending else 0
+            article_header, header_start = _find_header(text, header_block_start, match.start())
+            if pending:
+                body_end = header_start if article_header else match.start()
+                yield _build_article(text, base, pending, body_end, include_offsets)
+            pending = (match.start(), match.end(), match.group(1).strip(),
+                       match.group(3).strip(), article_header)
+            scan_from = match.end()
+        else:
+            # No MADDE line can start before the last, possibly incomplete, line
+            scan_from = max(scan_from, text.rfind('\n') + 1)
+
+    if pending:
+        yield _build_article(text, base, pending, len(text), include_offsets)
+
+
+def parse_legal_text(file_path, use_mmap=False):
     """
     Parses a legal text file into a list of dictionaries, where each dictionary
     represents an article with its number, header, and text.
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        return list(iter_legal_articles(file_path, use_mmap=use_mmap, include_offsets=False))
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
         return []
@@ -17,112 +168,41 @@ def parse_legal_text(file_path):
         print(f"Error reading file {file_path}: {e}")
         return []
 
-    articles = []
-
-    # Regex to find MADDE lines.
-    # Group 1: Full "MADDE <number>" (e.g., "MADDE 339")
-    # Group 2: Just the number (e.g., "339")
-    # Group 3: Text on the MADDE line after "MADDE <number> - " (e.g., "Konut ve...")
-    madde_pattern = re.compile(r"^(MADDE\s(\d+))\s*-?\s*(.*)", re.MULTILINE)
-    matches = list(madde_pattern.finditer(content))
-
-    # Regex for identifying header lines.
-    # Matches lines like:
-    # "A. Some Text"
-    # "I. Some Roman Numeral Text"
-    # "1. Some Numbered Text"
-    # "a. Some Lowercase Letter Text"
-    # It's designed to pick specific, structured headers.
-    header_line_pattern = re.compile(
-        r"^\s*(?:[A-ZİÖÜÇŞĞ]\.|[IVXLCDM]+\.|[a-z]\.|\d+\.)\s+[a-zA-Z0-9ğüşıöçĞÜŞİÖÇ\s\(\),'/.:-]+$",
-        re.IGNORECASE
-    )
-
-    for i, current_match in enumerate(matches):
-        article_num_full = current_match.group(1).strip()  # e.g., "MADDE 339"
-        text_on_madde_line = current_match.group(3).strip()
-
-        # Determine header for the CURRENT article
-        # (Logic for current_article_header remains the same)
-        header_search_block_start = 0
-        if i > 0:
-            header_search_block_start = matches[i-1].end()
-        header_search_block_end = current_match.start()
-        potential_header_text_block = content[header_search_block_start: header_search_block_end]
-        lines_in_header_block = potential_header_text_block.strip().split('\n')
-        current_article_header = ""
-        for line_idx in range(len(lines_in_header_block) - 1, -1, -1):
-            line = lines_in_header_block[line_idx].strip()
-            if line:
-                if header_line_pattern.match(line) and "MADDE" not in line.upper():
-                    current_article_header = line
-                    break
-
-        # Determine the actual body text for the CURRENT article
-        start_of_body_content = current_match.end()
-        end_of_body_content = len(content)  # Default for the last article
-
-        if i + 1 < len(matches):  # If there is a next article
-            next_match = matches[i+1]
-            next_madde_start_index = next_match.start()
-
-            # Default end for current article's body is the start of the next MADDE line
-            end_of_body_content = next_madde_start_index
-
-            # The block of text between the end of the current MADDE line's content
-            # and the start of the next MADDE line. This is where the next article's header might be.
-            inter_article_text_block = content[start_of_body_content: next_madde_start_index]
-
-            lines_in_inter_block_for_next_header_search = inter_article_text_block.strip().split('\n')
-            identified_next_article_header_text = ""
-
-            # Scan backwards from the end of this inter-article block to find the
-            # last line that matches the header pattern. This would be the header for the next article.
-            for line_idx_next_h in range(len(lines_in_inter_block_for_next_header_search) - 1, -1, -1):
-                line_next_h = lines_in_inter_block_for_next_header_search[line_idx_next_h].strip(
-                )
-                if line_next_h and header_line_pattern.match(line_next_h) and "MADDE" not in line_next_h.upper():
-                    identified_next_article_header_text = line_next_h
-                    break
-
-            if identified_next_article_header_text:
-                # If a header for the next article is found within the inter_article_text_block,
-                # the current article's body must end just before this header.
-                # We need to find the precise start position of this header text within the original content slice.
-
-                # Iterate through the inter_article_text_block keeping track of char offsets
-                # to find the exact start of the identified_next_article_header_text.
-                current_offset_in_block = 0
-                precise_offset_found = False
-                for line_in_block_orig_newlines in inter_article_text_block.splitlines(True):
-                    if line_in_block_orig_newlines.strip() == identified_next_article_header_text:
-                        # Found the line. The current article's body ends here.
-                        end_of_body_content = start_of_body_content + current_offset_in_block
-                        precise_offset_found = True
-                        break
-                    current_offset_in_block += len(line_in_block_orig_newlines)
-
-                # If, for some reason, the precise offset wasn't found (e.g., empty inter_article_text_block after strip for search),
-                # the end_of_body_content remains next_madde_start_index, which is a safe fallback.
-
-        actual_article_body_text = content[start_of_body_content:end_of_body_content].strip(
-        )
-
-        article_text_parts = []
-        if text_on_madde_line:
-            article_text_parts.append(text_on_madde_line)
-        if actual_article_body_text:  # Add body text only if it's not empty
-            article_text_parts.append(actual_article_body_text)
-
-        full_article_text = "\n".join(article_text_parts).strip()
-
-        articles.append({
-            'article_number': article_num_full,
-            'article_header': current_article_header,
-            'text': full_article_text
-        })
-
-    return articles
+
+# A fıkra (paragraph) ends with a sentence terminator at the end of a line and the
+# next line starts with a capital letter or an enumeration marker ("1. ", "a) ").
+PARAGRAPH_BREAK_PATTERN = re.compile(r"(?<=[.:])\n(?=[A-ZÇĞİÖŞÜ]|\d+\.\s|[a-zçğıöşü]\)\s)")
+
+
+def chunk_article(text, min_chunk_chars=200):
+    """
+    Splits an article's text into paragraph-level chunks. Paragraphs shorter than
+    min_chunk_chars are merged into their neighbour so chunks stay meaningful.
+    Returns a list of dictionaries with the chunk text and its character offsets
+    (char_start, char_end) within the article text.
+    """
+    spans = []
+    start = 0
+    for paragraph_break in PARAGRAPH_BREAK_PATTERN.finditer(text):
+        spans.append((start, paragraph_break.start()))
+        start = paragraph_break.end()
+    spans.append((start, len(text)))
+
+    merged_spans = []
+    for span_start, span_end in spans:
+        if merged_spans and merged_spans[-1][1] - merged_spans[-1][0] < min_chunk_chars:
+            merged_spans[-1] = (merged_spans[-1][0], span_end)
+        else:
+            merged_spans.append((span_start, span_end))
+    # A short trailing paragraph joins the previous chunk
+    if len(merged_spans) > 1 and merged_spans[-1][1] - merged_spans[-1][0] < min_chunk_chars:
+        last_start, last_end = merged_spans.pop()
+        merged_spans[-1] = (merged_spans[-1][0], last_end)
+
+    return [
+        {'text': text[span_start:span_end].strip(), 'char_start': span_start, 'char_end': span_end}
+        for span_start, span_end in merged_spans
+    ]
 
 
 if __name__ == '__main__':
@@ -0,0 +1,191 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from embedding_cache import turkish_casefold
+
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+# Circumflex spellings are optional in Turkish ("hâlinde" / "halinde")
+_FOLD_CIRCUMFLEX = str.maketrans("âîû", "aiu")
+
+# High-frequency function words that carry no signal for legal retrieval
+TURKISH_STOPWORDS = frozenset("""
+acaba ama ancak bir biri birkaç bu bunlar bunu bunun da daha de değil diye en gibi göre hem hep
+her hangi için ile ise ki kadar mi mı mu mü nasıl ne neden o olan olarak olur sonra şu ve veya
+ya yani dahi ayrıca halde halinde
+""".split())
+
+# Inflectional suffixes stripped from the end of a token, longest first.
+# Deliberately light: case markers, plural and possessive endings only, so
+# "kiracının", "kiracıya" and "kiracı" share a stem but derivations are kept.
+_SUFFIXES = sorted("""
+lerinden larından lerinde larında lerine larına lerini larını lerin ların leri ları ler lar
+sından sinden sundan sünden sında sinde sunda sünde sına sine suna süne
+sını sini sunu sünü sının sinin sunun sünün
+ından inden undan ünden ında inde unda ünde ına ine una üne
+ını ini unu ünü ının inin unun ünün
+nın nin nun nün dan den tan ten da de ta te yla yle la le
+ya ye yı yi yu yü sı si su sü
+""".split(), key=len, reverse=True)
+_MIN_STEM_LENGTH = 4
+# After suffix stripping, stems are cut to a fixed prefix; the first five
+# characters are a well-known, robust stem approximation for Turkish.
+_PREFIX_LENGTH = 5
+# Final consonant softening (kitap -> kitabı): map back to the hard form
+_HARDEN_FINAL = str.maketrans({"b": "p", "c": "ç", "d": "t", "ğ": "k"})
+
+
+def stem(token: str) -> str:
+    """Strip one inflectional suffix, cut to a fixed prefix, undo consonant softening"""
+    if token.isdigit():
+        return token
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= _MIN_STEM_LENGTH:
+            token = token[:-len(suffix)]
+            break
+    token = token[:_PREFIX_LENGTH]
+    return token[:-1] + token[-1].translate(_HARDEN_FINAL)
+
+
+def tokenize(text: str) -> list[str]:
+    """Turkish-aware casefold, split on non-word characters, drop stopwords, stem"""
+    return [
+        stem(token)
+        for token in _TOKEN_PATTERN.findall(turkish_casefold(text).translate(_FOLD_CIRCUMFLEX))
+        if token not in TURKISH_STOPWORDS
+    ]
+
+
+def document_search_text(document: str, metadata: dict) -> str:
+    """Text indexed for a document: article number and header are searchable too"""
+    return f"{metadata.get('article_number', '')} {metadata.get('article_header', '')}\n{document}"
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """Fuse several best-first id rankings; each list contributes 1 / (k + rank)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    Okapi BM25 over precomputed postings.
+
+    BM25 term weights do not depend on the query, so each posting stores the
+    final weight of the term in that document. Postings are kept in CSR form
+    (per-term slices of one positions array and one weights array), which can
+    be memory-mapped and shared between processes. A search is then one numpy
+    scatter-add per query term plus a top-k selection.
+    """
+
+    def __init__(self, ids: list[str], terms: list[str], offsets: np.ndarray, positions: np.ndarray,
+                 weights: np.ndarray, k1: float = 1.5, b: float = 0.75):
+        self.ids = ids
+        self.terms = terms
+        self.k1 = k1
+        self.b = b
+        self.offsets = offsets
+        self.positions = positions
+        self.weights = weights
+        self._term_rows = {term: row for row, term in enumerate(terms)}
+        self._id_positions = None
+
+    @classmethod
+    def build(cls, ids: list[str], texts: list[str], k1: float = 1.5, b: float = 0.75):
+        term_counts = [Counter(tokenize(text)) for text in texts]
+        doc_lengths = [sum(counts.values()) for counts in term_counts]
+        avg_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+        document_frequency = Counter(term for counts in term_counts for term in counts)
+        n_docs = len(texts)
+
+        postings = {}
+        for position, counts in enumerate(term_counts):
+            length_norm = k1 * (1 - b + b * doc_lengths[position] / avg_length) if avg_length else k1
+            for term, tf in counts.items():
+                df = document_frequency[term]
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                weight = idf * tf * (k1 + 1) / (tf + length_norm)
+                entry = postings.setdefault(term, ([], []))
+                entry[0].append(position)
+                entry[1].append(weight)
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(postings[term][0]) for term in terms])
+        positions = np.fromiter((p for term in terms for p in postings[term][0]), dtype=np.int32, count=offsets[-1])
+        weights = np.fromiter((w for term in terms for w in postings[term][1]), dtype=np.float32, count=offsets[-1])
+        return cls(ids, terms, offsets, positions, weights, k1=k1, b=b)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        with open(os.path.join(path, "terms.json"), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        mmap_mode = "r" if mmap else None
+        return cls(
+            data["ids"],
+            data["terms"],
+            np.load(os.path.join(path, "offsets.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, "positions.npy"), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, "weights.npy"), mmap_mode=mmap_mode),
+            k1=data["k1"],
+            b=data["b"]
+        )
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "ids": self.ids, "terms": self.terms}, f, ensure_ascii=False)
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+        np.save(os.path.join(path, "positions.npy"), self.positions)
+        np.save(os.path.join(path, "weights.npy"), self.weights)
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def term_count(self) -> int:
+        return len(self.terms)
+
+    def idf(self, term: str) -> float:
+        """BM25 inverse document frequency (terms that occur nowhere get the maximum)"""
+        row = self._term_rows.get(term)
+        df = int(self.offsets[row + 1] - self.offsets[row]) if row is not None else 0
+        n_docs = len(self.ids)
+        return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+    def term_matches(self, terms: list[str], ids: list[str]) -> np.ndarray:
+        """Boolean matrix: does document ids[i] contain terms[j]? Unknown ids contain nothing."""
+        if self._id_positions is None:
+            self._id_positions = {doc_id: position for position, doc_id in enumerate(self.ids)}
+        positions = np.array([self._id_positions.get(doc_id, -1) for doc_id in ids], dtype=np.int64)
+        matches = np.zeros((len(ids), len(terms)), dtype=bool)
+        for column, term in enumerate(terms):
+            row = self._term_rows.get(term)
+            if row is not None:
+                # Postings are in ascending position order
+                postings = self.positions[self.offsets[row]:self.offsets[row + 1]]
+                found = np.searchsorted(postings, positions).clip(max=len(postings) - 1)
+                matches[:, column] = postings[found] == positions
+        return matches
+
+    def search(self, query_text: str, top_k: int) -> list[tuple[str, float]]:
+        """Return up to top_k (id, score) pairs with a positive score, best first"""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query_text)):
+            row = self._term_rows.get(term)
+            if row is not None:
+                start, end = self.offsets[row], self.offsets[row + 1]
+                scores[self.positions[start:end]] += self.weights[start:end]
+
+        matched = np.flatnonzero(scores)
+        if matched.size > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [(self.ids[i], float(scores[i])) for i in matched]
@@ -1,13 +1,36 @@
 import os
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Header, Request
-from pydantic import BaseModel
-import chromadb
-from openai import OpenAI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from openai import AsyncOpenAI, OpenAI
 import uvicorn
+import asyncio
+import contextlib
+import uuid
+import json
 import time
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import logging
+import sqlite3
+from embedding_cache import EmbeddingCache, CachedQueryEmbedder, normalize_query
+from embedding_providers import LocalEmbeddingProvider, OpenAIEmbeddingProvider, matches_configuration
+from answer_cache import SemanticAnswerCache
+from retrieval import ChromaRetriever, NumpyRetriever, collapse_chunks, retrieve_batch
+from lexical_index import BM25Index
+from reranker import LinearReranker
+from routing import RoutingPolicy
+from context_packing import pack_context, token_counter_name
+from article_lookup import extract_article_references, format_extractive_answer
+from index_artifact import (IncompatibleArtifactError, IndexArtifact, build_lock, current_version,
+                            list_versions, set_current_version)
+from rate_limiter import MemoryRateLimitStore, RateLimiter, SQLiteRateLimitStore
+from sessions import ConversationMemory, MemorySessionStore, SQLiteSessionStore
+from single_flight import SingleFlight, StreamingSingleFlight
+from metrics import CONTENT_TYPE, MULTIPROCESS, REGISTRY, Counter, Gauge, Histogram
+from tracing import STAGE_SECONDS, bind_context, span, start_trace
 
 # --- Configuration ---
 load_dotenv()  # Load environment variables from .env file
@@ -16,15 +39,148 @@ CHROMA_DB_PATH = "./chroma_db_store"
 CHROMA_COLLECTION_NAME = "tbk_kira_articles"
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 API_SECRET_KEY = os.getenv("API_SECRET_KEY")
-# Used by Chroma's OpenAIEmbeddingFunction
-EMBEDDING_MODEL_NAME = "text-embedding-ada-002"
-LLM_MODEL_NAME = "gpt-3.5-turbo"  # Or "gpt-4o"
-TOP_K_RESULTS = 3
+# Query embeddings: "openai" (EMBEDDING_MODEL_NAME, one API call per cache miss) or
+# "local" (the model fitted by ingest_data.py and stored in the index artifact; no
+# network calls). Must match the provider the index was built with.
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "text-embedding-ada-002")
+LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "gpt-3.5-turbo")  # Or "gpt-4o"
+TOP_K_RESULTS = int(os.getenv("TOP_K_RESULTS", "3"))
 
-# Rate limiting configuration
-RATE_LIMIT_REQUESTS = 10  # requests per minute
-RATE_LIMIT_WINDOW = 60   # seconds
-rate_limiter = defaultdict(list)
+# Routing: after retrieval, each question is classified by cheap signals (its length,
+# the score gap between the best two sources, how many articles compete, articles it
+# names) and the first matching tier of the policy table sets its top-k, max answer
+# tokens and model ("fast", "default" = LLM_MODEL_NAME, "strong", or a model name).
+# Tiers come from ROUTING_POLICY_PATH (JSON) or routing.DEFAULT_POLICY; when routing is
+# on, the tier's top-k replaces TOP_K_RESULTS and RERANK_TOP_K. Decisions are logged.
+ROUTING_ENABLED = os.getenv("ROUTING_ENABLED", "true").lower() == "true"
+ROUTING_POLICY_PATH = os.getenv("ROUTING_POLICY_PATH")
+LLM_FAST_MODEL_NAME = os.getenv("LLM_FAST_MODEL_NAME", LLM_MODEL_NAME)
+LLM_STRONG_MODEL_NAME = os.getenv("LLM_STRONG_MODEL_NAME", LLM_MODEL_NAME)
+
+# Retrieval backend: "chroma" (persistent Chroma collection) or "numpy"
+# (in-process exact search over a memory-mapped embedding matrix, no Chroma import)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma").lower()
+# Versioned index artifacts written by ingest_data.py (bake into the image or mount).
+# Without one, the server starts anyway and builds it in the background if allowed;
+# /readyz reports 503 with build progress until the index is attached.
+INDEX_PATH = os.getenv("INDEX_PATH", os.path.join(CHROMA_DB_PATH, "index"))
+INDEX_BUILD_ON_STARTUP = os.getenv("INDEX_BUILD_ON_STARTUP", "true").lower() == "true"
+# New index versions are swapped in while serving: every worker checks which version
+# is CURRENT under INDEX_PATH every INDEX_WATCH_INTERVAL_SECONDS (0 disables) and swaps
+# to it once it is loaded; requests already running finish on the version they started on
+INDEX_WATCH_INTERVAL_SECONDS = float(os.getenv("INDEX_WATCH_INTERVAL_SECONDS", "10"))
+# Enables /admin/index/* (list versions, swap, rebuild) for requests sending it as
+# X-Admin-Key; the endpoints do not exist while it is unset
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
+# Retrieval mode: "vector", "hybrid" (BM25 + vector with reciprocal rank fusion)
+# or "lexical" (BM25 only, no embedding call at all). Hybrid falls back to
+# lexical results when the query embedding fails or times out.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))  # per-retriever depth fed into fusion
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Documents are paragraph-level chunks; retrieval fetches CHUNK_OVERFETCH x top-k
+# chunks and merges chunks of the same article into one source
+COLLAPSE_CHUNKS = os.getenv("COLLAPSE_CHUNKS", "true").lower() == "true"
+CHUNK_OVERFETCH = int(os.getenv("CHUNK_OVERFETCH", "3"))
+
+# Rerank RERANK_CANDIDATES retrieved chunks with a linear model over cheap features
+# (ranks, query term coverage, header and article-number matches) and send at most
+# RERANK_TOP_K articles to the LLM (instead of TOP_K_RESULTS); articles after the
+# first need a reranker score of RERANK_MIN_SCORE. Weights come from
+# benchmarks/train_reranker.py (RERANK_WEIGHTS_PATH, or the built-in ones).
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "true").lower() == "true"
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "2"))
+RERANK_MIN_SCORE = float(os.getenv("RERANK_MIN_SCORE", "0.2"))
+RERANK_WEIGHTS_PATH = os.getenv("RERANK_WEIGHTS_PATH")
+
+# Concurrency and per-stage timeout configuration
+# Chroma's query (and the embedding HTTP call it makes) is synchronous, so it runs
+# on a bounded thread pool instead of the event loop.
+RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", "8"))
+RETRIEVAL_TIMEOUT_SECONDS = float(os.getenv("RETRIEVAL_TIMEOUT_SECONDS", "20"))
+EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_TIMEOUT_SECONDS", "8"))
+
+# Queries that name an article ("Madde 344 ne diyor?", "TBK 347") fetch it by ID and
+# skip embedding and vector search. In extractive mode the article text itself is
+# returned and the LLM is not called; requests can override this per call.
+ARTICLE_LOOKUP_ENABLED = os.getenv("ARTICLE_LOOKUP_ENABLED", "true").lower() == "true"
+ARTICLE_LOOKUP_EXTRACTIVE = os.getenv("ARTICLE_LOOKUP_EXTRACTIVE", "false").lower() == "true"
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "90"))
+# Tokens of retrieved text per prompt: documents are packed by relevance until the
+# budget is spent, and the one that overflows is trimmed at a sentence boundary
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+# /query/batch: queries per request, and LLM completions in flight per batch
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "200"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# Conversation sessions for /query and /query/stream: requests carrying a session_id
+# get the conversation so far in the prompt, compacted into a rolling summary plus the
+# last SESSION_RECENT_TURNS turns within SESSION_HISTORY_TOKEN_BUDGET tokens. A
+# follow-up question ("peki işyeri için de geçerli mi?") reuses the articles of the
+# previous answer instead of running retrieval again. Sessions expire after
+# SESSION_TTL_SECONDS idle; "sqlite" shares them between workers on the same host.
+SESSIONS_ENABLED = os.getenv("SESSIONS_ENABLED", "true").lower() == "true"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(CHROMA_DB_PATH, "sessions.sqlite3"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))  # memory backend bound
+SESSION_RECENT_TURNS = int(os.getenv("SESSION_RECENT_TURNS", "3"))
+SESSION_HISTORY_TOKEN_BUDGET = int(os.getenv("SESSION_HISTORY_TOKEN_BUDGET", "600"))
+SESSION_SUMMARY_TOKEN_BUDGET = int(os.getenv("SESSION_SUMMARY_TOKEN_BUDGET", "200"))
+SESSION_REUSE_SOURCES = os.getenv("SESSION_REUSE_SOURCES", "true").lower() == "true"
+
+# Identical questions in flight at the same time (same normalized text, options and
+# index version, no conversation history) share one retrieval and LLM call; streams
+# fan out to every waiting client. Per worker process.
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+
+# Query embedding cache: in-memory LRU plus an optional SQLite tier ("" disables it)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_DB_PATH = os.getenv(
+    "EMBEDDING_CACHE_DB_PATH", os.path.join(CHROMA_DB_PATH, "query_embedding_cache.sqlite3"))
+
+# Semantic answer cache: reuse an answer when the retrieved articles are identical
+# and the query embeddings are at least this similar
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+
+# Rate limiting configuration (GCRA: up to RATE_LIMIT_REQUESTS at once, refilling evenly over the window)
+RATE_LIMIT_REQUESTS = int(os.getenv("RATE_LIMIT_REQUESTS", "10"))  # requests per window, per client IP
+RATE_LIMIT_KEY_REQUESTS = int(os.getenv("RATE_LIMIT_KEY_REQUESTS", "60"))  # requests per window, per API key
+RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))   # seconds
+# /query/batch has its own per-API-key quota of queries, so offline jobs neither
+# need the interactive limits raised nor eat into them (a batch call itself
+# spends one interactive request)
+RATE_LIMIT_BATCH_QUERIES = int(os.getenv("RATE_LIMIT_BATCH_QUERIES", "1000"))  # queries per batch window, per API key
+RATE_LIMIT_BATCH_WINDOW = int(os.getenv("RATE_LIMIT_BATCH_WINDOW", "3600"))  # seconds
+# "memory" (per process) or "sqlite" (one table shared by every worker on the host)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", os.path.join(CHROMA_DB_PATH, "rate_limits.sqlite3"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))  # memory backend bound
+# How long a check waits for the SQLite lock (on a thread, off the event loop). A
+# request whose check times out is rejected with 503, unless RATE_LIMIT_FAIL_OPEN
+# lets it through; either way it is counted in rag_rate_limit_decisions_total.
+RATE_LIMIT_BUSY_TIMEOUT_SECONDS = float(os.getenv("RATE_LIMIT_BUSY_TIMEOUT_SECONDS", "1.0"))
+RATE_LIMIT_FAIL_OPEN = os.getenv("RATE_LIMIT_FAIL_OPEN", "false").lower() == "true"
+
+# Requests with a valid API key and "X-Profile: 1" are run under cProfile and the
+# profile is written to PROFILE_DIR (name returned in X-Profile-File). Debugging only:
+# profiling slows the whole event loop while it runs.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+# /metrics requires "Authorization: Bearer <METRICS_TOKEN>" (Prometheus' authorization
+# setting) or a valid X-API-Key; without METRICS_TOKEN only the API key is accepted
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# With PROMETHEUS_MULTIPROC_DIR set (several workers), each worker copies the counts
+# its caches and limiters keep into the shared metrics this often
+METRICS_COLLECT_INTERVAL_SECONDS = float(os.getenv("METRICS_COLLECT_INTERVAL_SECONDS", "5"))
 
 # --- Logging Configuration ---
 logging.basicConfig(
@@ -33,6 +189,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# --- Metrics (exposed at /metrics; summed over workers with PROMETHEUS_MULTIPROC_DIR) ---
+HTTP_REQUESTS = Counter(
+    "rag_http_requests_total", "HTTP requests by route and status", ["method", "route", "status"])
+HTTP_REQUEST_SECONDS = Histogram(
+    "rag_http_request_duration_seconds", "Time until the response body is fully sent", ["route"])
+HTTP_IN_FLIGHT = Gauge("rag_http_requests_in_flight", "Requests being handled", multiprocess_mode="livesum")
+LLM_TOKENS = Counter("rag_llm_tokens_total", "Tokens reported by the LLM API", ["kind"])
+CACHE_LOOKUPS = Counter(
+    "rag_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+RATE_LIMIT_DECISIONS = Counter(
+    "rag_rate_limit_decisions_total", "Rate limit checks by limiter and outcome", ["limiter", "outcome"])
+INDEX_DOCUMENTS = Gauge("rag_index_documents", "Documents in the attached search index", multiprocess_mode="livemax")
+INDEX_READY = Gauge("rag_index_ready", "1 once every worker has attached the search index", multiprocess_mode="livemin")
+INDEX_SWAPS = Counter("rag_index_swaps_total", "Index versions swapped in while serving")
+ROUTE_DECISIONS = Counter("rag_route_decisions_total", "Questions by routing tier", ["tier"])
+COALESCED_REQUESTS = Counter(
+    "rag_coalesced_requests_total", "Requests that joined an identical in-flight request", ["endpoint"])
+
 # --- Security Functions ---
 def validate_api_key(api_key: str) -> bool:
     """Validate API key against the configured secret"""
@@ -41,23 +215,63 @@ def validate_api_key(api_key: str) -> bool:
         return False
     return api_key == API_SECRET_KEY
 
-def check_rate_limit(client_ip: str) -> bool:
-    """Check if client IP is within rate limits"""
-    current_time = time.time()
-    
-    # Clean old requests outside the window
-    rate_limiter[client_ip] = [
-        req_time for req_time in rate_limiter[client_ip] 
-        if current_time - req_time < RATE_LIMIT_WINDOW
-    ]
-    
-    # Check if within limit
-    if len(rate_limiter[client_ip]) >= RATE_LIMIT_REQUESTS:
-        return False
-    
-    # Add current request
-    rate_limiter[client_ip].append(current_time)
-    return True
+def create_rate_limit_store():
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteRateLimitStore(RATE_LIMIT_DB_PATH, busy_timeout=RATE_LIMIT_BUSY_TIMEOUT_SECONDS)
+    return MemoryRateLimitStore(max_keys=RATE_LIMIT_MAX_KEYS)
+
+
+# Both limiters share one store; keys are namespaced by what they limit
+rate_limit_store = create_rate_limit_store()
+ip_rate_limiter = RateLimiter(RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW, rate_limit_store)
+key_rate_limiter = RateLimiter(RATE_LIMIT_KEY_REQUESTS, RATE_LIMIT_WINDOW, rate_limit_store)
+batch_rate_limiter = RateLimiter(RATE_LIMIT_BATCH_QUERIES, RATE_LIMIT_BATCH_WINDOW, rate_limit_store)
+# Checks the store could not answer in time, by what happened to the request
+rate_limit_store_failures = {"failed_open": 0, "failed_closed": 0}
+
+
+def check_rate_limit_blocking(client_ip: str, api_key: str, batch_queries: int = 0) -> tuple[str, float] | None:
+    """
+    Check the per-IP and per-API-key limits for one request and, for a batch,
+    the API key's batch quota for its queries; returns None if allowed, else
+    (the limit that was hit, seconds until retry)
+    """
+    allowed, retry_after = ip_rate_limiter.check(f"ip:{client_ip}")
+    if not allowed:
+        return "ip", retry_after
+    # Never keep the key itself in the limiter state
+    key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    allowed, retry_after = key_rate_limiter.check(f"key:{key_id}")
+    if not allowed:
+        return "api_key", retry_after
+    if batch_queries:
+        allowed, retry_after = batch_rate_limiter.check(f"batch:{key_id}", batch_queries)
+        if not allowed:
+            return "batch", retry_after
+    return None
+
+
+async def check_rate_limit(client_ip: str, api_key: str, batch_queries: int = 0) -> tuple[str, float] | None:
+    """
+    check_rate_limit_blocking without stalling the event loop: the SQLite store
+    runs on a thread. When other workers hold its lock past the busy timeout,
+    the request is rejected with 503 (or let through with RATE_LIMIT_FAIL_OPEN),
+    so contention never switches the limits off silently.
+    """
+    if RATE_LIMIT_BACKEND != "sqlite":
+        return check_rate_limit_blocking(client_ip, api_key, batch_queries)
+    try:
+        return await asyncio.to_thread(check_rate_limit_blocking, client_ip, api_key, batch_queries)
+    except sqlite3.OperationalError as e:
+        if RATE_LIMIT_FAIL_OPEN:
+            rate_limit_store_failures["failed_open"] += 1
+            logger.warning(f"Rate limit store unavailable ({e}); allowing request from IP {client_ip}")
+            return None
+        rate_limit_store_failures["failed_closed"] += 1
+        logger.warning(f"Rate limit store unavailable ({e}); rejecting request from IP {client_ip}")
+        raise HTTPException(
+            status_code=503, detail="Rate limiting is temporarily unavailable. Please try again shortly.",
+            headers={"Retry-After": "1"})
 
 # --- FastAPI App Initialization ---
 app = FastAPI(
@@ -66,27 +280,398 @@ app = FastAPI(
     version="0.1.0"
 )
 
+
+async def finish_after_body(body_iterator, finish):
+    """Pass a response body through and call finish() once it is sent, or the client went away"""
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        finish()
+
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """
+    Request metrics, a Server-Timing header with the stage spans, and opt-in
+    profiling. Latency, the in-flight gauge and the profile last until the
+    body is fully sent, so streamed answers (/query/stream, /query/batch) are
+    measured end to end; their Server-Timing header goes out before the body,
+    so it only has the stages up to the first byte.
+    """
+    profile = PROFILING_ENABLED and request.headers.get("X-Profile") == "1" and \
+        validate_api_key(request.headers.get("X-API-Key", ""))
+    HTTP_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    tracing = contextlib.ExitStack()
+    trace = tracing.enter_context(start_trace(profile=profile))
+    profile_name = f"{int(time.time())}-{uuid.uuid4().hex[:8]}" if trace.profile else None
+
+    def finish(status: int):
+        tracing.close()
+        HTTP_IN_FLIGHT.dec()
+        # Label by route template, not raw path, to keep the series bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_REQUESTS.labels(method=request.method, route=route, status=status).inc()
+        HTTP_REQUEST_SECONDS.labels(route=route).observe(time.perf_counter() - start)
+        if profile_name:
+            profile_path = trace.dump_profile(PROFILE_DIR, profile_name)
+            if profile_path:
+                logger.info(f"Request profile written to {profile_path}")
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        finish(500)
+        raise
+
+    if trace.stages:
+        response.headers["Server-Timing"] = trace.server_timing()
+    if profile_name:
+        response.headers["X-Profile-File"] = f"{profile_name}.prof"
+    response.body_iterator = finish_after_body(response.body_iterator, lambda: finish(response.status_code))
+    return response
+
 # --- Pydantic Models ---
 
 
 class QueryRequest(BaseModel):
     query_text: str
+    # Return referenced articles verbatim instead of an LLM answer (None = server default)
+    extractive: bool | None = None
+    # Conversation to continue; an expired one starts a new session
+    session_id: str | None = Field(None, max_length=64)
+    # Open a session for a question that has none; without either field nothing is stored
+    start_session: bool = False
+
+
+class BatchQueryRequest(BaseModel):
+    queries: list[str] = Field(..., min_length=1)
+    extractive: bool | None = None
 
 
 class QueryResponse(BaseModel):
     answer: str
     retrieved_sources: list[dict]  # To show what was used
+    cached: bool = False  # True when the answer came from the semantic answer cache
+    extractive: bool = False  # True when the answer quotes the referenced articles verbatim
+    session_id: str | None = None  # Send it back with the next question to continue the conversation
+    reused_sources: bool = False  # True when a follow-up reused the previous answer's articles
+    route: str | None = None  # Routing tier the question was answered with
+
+
+class IndexSwapRequest(BaseModel):
+    version: str | None = None  # None: the CURRENT version (e.g. after copying in a prebuilt artifact)
+
+
+class IndexRebuildRequest(BaseModel):
+    full: bool = False  # re-embed every document instead of only the changed ones
 
 
 # --- Global Clients (Initialize on startup) ---
-chroma_client = None
 openai_client = None
-db_collection = None
+serving = None  # ServingIndex new requests search; replaced as a whole on a swap, never modified
+retrieval_executor = None
+reranker = LinearReranker.from_file(RERANK_WEIGHTS_PATH) if RERANK_ENABLED else None
+routing_policy = RoutingPolicy.from_file(ROUTING_POLICY_PATH, {
+    "fast": LLM_FAST_MODEL_NAME,
+    "default": LLM_MODEL_NAME,
+    "strong": LLM_STRONG_MODEL_NAME
+}) if ROUTING_ENABLED else None
+answer_cache = SemanticAnswerCache(
+    similarity_threshold=ANSWER_CACHE_SIMILARITY,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES
+)
+
+
+def create_session_store():
+    if SESSION_BACKEND == "sqlite":
+        return SQLiteSessionStore(SESSION_DB_PATH)
+    return MemorySessionStore(max_sessions=SESSION_MAX_SESSIONS)
+
+
+conversation_memory = ConversationMemory(
+    create_session_store(),
+    ttl_seconds=SESSION_TTL_SECONDS,
+    recent_turns=SESSION_RECENT_TURNS,
+    history_token_budget=SESSION_HISTORY_TOKEN_BUDGET,
+    summary_token_budget=SESSION_SUMMARY_TOKEN_BUDGET
+) if SESSIONS_ENABLED else None
+query_flight = SingleFlight()
+stream_flight = StreamingSingleFlight(
+    cancelled_item=("error", {"detail": "The answer was cancelled. Please try again."}))
+
+# Search index readiness, reported by /readyz and /health.
+# state: starting | loading | building | ready | missing | failed
+index_status = {
+    "state": "starting",
+    "stage": None,  # ingestion stage while building: parsing, embedding, writing, syncing
+    "progress": {},
+    "version": None,
+    "documents": None,  # counted once when the index is attached, not on every probe
+    "error": None,
+    "started_at": time.time(),
+    "ready_at": None,
+    "swaps": 0,  # index versions swapped in while serving
+    "swapped_at": None,
+    "update": None  # the last /admin/index/rebuild: state, stage, progress, version or error
+}
+warm_up_task = None
+watch_task = None
+update_task = None
+metrics_task = None
+index_swap_lock = asyncio.Lock()
+
+
+@REGISTRY.on_collect
+def collect_component_metrics():
+    """Copy the counters the caches, rate limiters and index keep themselves into /metrics"""
+    active_index = serving
+    if active_index:
+        embedding_stats = active_index.query_embedder.cache.stats()
+        for result, stat in (("hit", "hits"), ("disk_hit", "disk_hits"), ("miss", "misses")):
+            REGISTRY.mirror(CACHE_LOOKUPS, embedding_stats[stat], cache="embedding", result=result)
+    answer_stats = answer_cache.stats()
+    REGISTRY.mirror(CACHE_LOOKUPS, answer_stats["hits"], cache="answer", result="hit")
+    REGISTRY.mirror(CACHE_LOOKUPS, answer_stats["misses"], cache="answer", result="miss")
+    for limiter_name, limiter in (("ip", ip_rate_limiter), ("api_key", key_rate_limiter),
+                                  ("batch", batch_rate_limiter)):
+        REGISTRY.mirror(RATE_LIMIT_DECISIONS, limiter.allowed, limiter=limiter_name, outcome="allowed")
+        REGISTRY.mirror(RATE_LIMIT_DECISIONS, limiter.rejected, limiter=limiter_name, outcome="rejected")
+    for outcome, count in rate_limit_store_failures.items():
+        REGISTRY.mirror(RATE_LIMIT_DECISIONS, count, limiter="store", outcome=outcome)
+    REGISTRY.mirror(COALESCED_REQUESTS, query_flight.joined, endpoint="/query")
+    REGISTRY.mirror(COALESCED_REQUESTS, stream_flight.joined, endpoint="/query/stream")
+    INDEX_DOCUMENTS.set(index_status["documents"] or 0)
+    INDEX_READY.set(1 if serving else 0)
+    REGISTRY.mirror(INDEX_SWAPS, index_status["swaps"])
+
+
+async def collect_metrics_periodically():
+    """In multiprocess mode, keep this worker's share of /metrics current whichever worker is scraped"""
+    while True:
+        REGISTRY.collect()
+        await asyncio.sleep(METRICS_COLLECT_INTERVAL_SECONDS)
+
+
+def update_index_status(state: str, **fields):
+    index_status["state"] = state
+    index_status.update(fields)
+
+
+def record_build_progress(stage: str, detail: dict):
+    """Progress callback for ingest_data.main(); called from the build thread"""
+    index_status["stage"] = stage
+    index_status["progress"] = detail
+
+
+def record_update_progress(stage: str, detail: dict):
+    """Progress callback for ingest_data.main() during a rebuild while serving"""
+    index_status["update"].update(stage=stage, progress=detail)
+
+
+def describe_index_status() -> str:
+    description = index_status["state"]
+    if index_status["state"] == "building" and index_status["stage"]:
+        description += f": {index_status['stage']}"
+        progress = index_status["progress"]
+        if "batches_total" in progress:
+            description += f" {progress['batches_done']}/{progress['batches_total']} batches"
+    if index_status["error"]:
+        description += f" ({index_status['error']})"
+    return description
+
+
+def load_index_artifact(version: str | None = None) -> IndexArtifact | None:
+    """The given (or the current) index version, None if it is missing or cannot be served"""
+    print(f"🔍 Loading index artifact {version or 'CURRENT'} from '{INDEX_PATH}'...")
+    try:
+        artifact = IndexArtifact.load(INDEX_PATH, version)
+    except FileNotFoundError:
+        return None
+    except IncompatibleArtifactError as e:
+        print(f"⚠️  {e}; it will be rebuilt")
+        return None
+    if not matches_configuration(artifact.embedding_provider, EMBEDDING_PROVIDER, EMBEDDING_MODEL_NAME):
+        print(f"⚠️  Index artifact {artifact.version} was embedded with '{artifact.embedding_provider}', "
+              f"not the configured {EMBEDDING_PROVIDER} provider; it will be rebuilt")
+        return None
+    print(f"✅ Memory-mapped index artifact {artifact.version} with {artifact.count()} documents")
+    return artifact
+
+
+def create_query_embedder(artifact: IndexArtifact) -> CachedQueryEmbedder:
+    """Embed queries into the artifact's vector space, through the query embedding cache"""
+    if EMBEDDING_PROVIDER == "local":
+        provider = LocalEmbeddingProvider.load(artifact.embedding_path)
+    else:
+        # Synchronous client: query embedding runs on the retrieval thread pool
+        provider = OpenAIEmbeddingProvider(
+            OpenAI(api_key=OPENAI_API_KEY, timeout=EMBEDDING_TIMEOUT_SECONDS, max_retries=1),
+            EMBEDDING_MODEL_NAME
+        )
+    if provider.identity != artifact.embedding_provider:
+        raise IncompatibleArtifactError(
+            f"Query embeddings from '{provider.identity}' cannot search index {artifact.version}, "
+            f"embedded with '{artifact.embedding_provider}'")
+
+    # A local embedding is cheaper than a SQLite lookup, so it only gets the in-memory tier
+    db_path = EMBEDDING_CACHE_DB_PATH if provider.name == "openai" else None
+    if db_path:
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    embedding_cache = EmbeddingCache(
+        model_name=provider.identity,
+        max_entries=EMBEDDING_CACHE_SIZE,
+        db_path=db_path or None
+    )
+    print(f"✅ Query embeddings from '{provider.identity}' "
+          f"({'persistent cache' if db_path else 'memory cache only'})")
+    return CachedQueryEmbedder(provider, embedding_cache)
+
+
+class ServingIndex:
+    """
+    Everything a request searches with, for one index version. A request takes
+    the current snapshot once (in enforce_access) and uses it to the end, so a
+    swap never mixes two versions within a request, and requests in flight
+    finish on the version they started on.
+    """
+
+    def __init__(self, artifact: IndexArtifact, retriever, lexical_index: BM25Index | None,
+                 query_embedder: CachedQueryEmbedder):
+        self.artifact = artifact
+        self.version = artifact.version
+        self.retriever = retriever
+        self.lexical_index = lexical_index
+        self.query_embedder = query_embedder
+        self.documents = retriever.count()
+
+
+def prepare_serving_index(artifact: IndexArtifact, previous: ServingIndex | None = None) -> ServingIndex:
+    """Open an artifact for serving (blocking); for Chroma, fill its version's collection first (no embedding calls)"""
+    # Cached query embeddings stay valid as long as queries are embedded the same way
+    if previous and previous.query_embedder.provider.identity == artifact.embedding_provider:
+        active_embedder = previous.query_embedder
+    else:
+        active_embedder = create_query_embedder(artifact)
+
+    if RETRIEVAL_BACKEND == "numpy":
+        active_retriever = NumpyRetriever(artifact.vector_index)
+    else:
+        import ingest_data
+        print(f"🗄️  Syncing ChromaDB collection '{ingest_data.chroma_collection_name(artifact.version)}' "
+              f"from the index artifact...")
+        # Chroma's persistent store is not safe to write from several workers at once
+        with build_lock(INDEX_PATH):
+            collection = ingest_data.open_chroma_collection(artifact)
+            ingest_data.sync_chroma_collection(collection, artifact)
+        active_retriever = ChromaRetriever(collection)
+
+    # The reranker's term coverage features read the BM25 postings in every mode
+    active_lexical_index = artifact.lexical_index if RETRIEVAL_MODE in ("hybrid", "lexical") or reranker else None
+    return ServingIndex(artifact, active_retriever, active_lexical_index, active_embedder)
+
+
+def activate_index(prepared: ServingIndex):
+    """Route new requests to a prepared snapshot; a single reference assignment, so nothing waits"""
+    global serving
+
+    previous, serving = serving, prepared
+    answer_cache.ensure_version(prepared.version)
+    update_index_status(
+        "ready", stage=None, progress={}, error=None, version=prepared.version,
+        documents=prepared.documents, ready_at=index_status["ready_at"] or time.time())
+    if previous is not None:
+        index_status["swaps"] += 1
+        index_status["swapped_at"] = time.time()
+        if previous.query_embedder is not prepared.query_embedder:
+            # Only drops the SQLite tier: requests still on the old snapshot keep the memory tier
+            previous.query_embedder.cache.close()
+        print(f"🔄 Swapped index {previous.version} -> {prepared.version}")
+    print(f"✅ Serving index {prepared.version} via {prepared.retriever.name} ({RETRIEVAL_MODE} retrieval)")
+
+
+async def swap_index(artifact: IndexArtifact) -> bool:
+    """Serve an artifact from now on, preparing it off the event loop; False if it is already served"""
+    async with index_swap_lock:
+        if serving is not None and serving.version == artifact.version:
+            return False
+        prepared = await asyncio.to_thread(prepare_serving_index, artifact, serving)
+        activate_index(prepared)
+        return True
+
+
+async def warm_up_index():
+    """Load the index artifact, building it first if there is none, without blocking startup"""
+    try:
+        update_index_status("loading")
+        artifact = await asyncio.to_thread(load_index_artifact)
+        if artifact is None:
+            if not INDEX_BUILD_ON_STARTUP:
+                print(f"❌ No index artifact under '{INDEX_PATH}' and INDEX_BUILD_ON_STARTUP is off")
+                update_index_status("missing", error="run ingest_data.py or mount a prebuilt index")
+                return
+            print("📦 Index artifact not found. Building it in the background...")
+            print("⏳ This may take 1-2 minutes for data ingestion and OpenAI embeddings...")
+            update_index_status("building")
+            import ingest_data
+            artifact = await asyncio.to_thread(ingest_data.main, False, record_build_progress)
+            if artifact is None:
+                raise RuntimeError("Ingestion produced no documents")
+        await swap_index(artifact)
+    except Exception as e:
+        logger.error(f"Index warm-up failed: {e}")
+        update_index_status("failed", error=str(e))
+
+
+async def watch_index_versions():
+    """
+    Swap to the CURRENT index version whenever it changes: after a CLI
+    ingestion, or a rebuild or swap on another worker. A version that cannot
+    be served is logged once and skipped until CURRENT moves on.
+    """
+    rejected = set()
+    while True:
+        await asyncio.sleep(INDEX_WATCH_INTERVAL_SECONDS)
+        if warm_up_task and not warm_up_task.done():
+            continue  # the warm-up attaches whatever is current when it is done
+        version = current_version(INDEX_PATH)
+        if not version or version in rejected or (serving and serving.version == version):
+            continue
+        try:
+            artifact = await asyncio.to_thread(load_index_artifact, version)
+            if artifact is None:
+                rejected.add(version)
+                continue
+            await swap_index(artifact)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Swapping to index {version} failed, still serving "
+                         f"{serving.version if serving else 'no index'}: {e}")
+            rejected.add(version)
+
+
+async def rebuild_index(full_rebuild: bool):
+    """Build a new index version next to the one being served, then swap to it"""
+    update = index_status["update"]
+    try:
+        import ingest_data
+        artifact = await asyncio.to_thread(ingest_data.main, full_rebuild, record_update_progress)
+        if artifact is None:
+            raise RuntimeError("Ingestion produced no documents")
+        update.update(stage="swapping", progress={})
+        swapped = await swap_index(artifact)
+        update.update(state="done", stage=None, version=artifact.version, swapped=swapped, finished_at=time.time())
+    except Exception as e:
+        logger.error(f"Index rebuild failed, still serving {serving.version if serving else 'no index'}: {e}")
+        update.update(state="failed", stage=None, error=str(e), finished_at=time.time())
 
 
 @app.on_event("startup")
 async def startup_event():
-    global chroma_client, openai_client, db_collection
+    global openai_client, retrieval_executor, warm_up_task, watch_task, metrics_task
 
     print("🚀 Starting RAG application startup...")
     
@@ -102,168 +687,521 @@ async def startup_event():
             "API_SECRET_KEY not found. Please set it in your .env file for security.")
     print("✅ API secret key loaded")
 
-    print("🗄️  Initializing ChromaDB client...")
-    chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-    print("✅ ChromaDB client initialized")
+    print(f"🧵 Starting retrieval thread pool with {RETRIEVAL_MAX_WORKERS} workers...")
+    retrieval_executor = ThreadPoolExecutor(
+        max_workers=RETRIEVAL_MAX_WORKERS,
+        thread_name_prefix="retrieval"
+    )
+
+    print("🤖 Initializing async OpenAI client for LLM...")
+    openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=LLM_TIMEOUT_SECONDS)
+
+    if RETRIEVAL_BACKEND == "numpy":
+        # Attaching an existing artifact only memory-maps it, so do it before serving
+        artifact = load_index_artifact()
+        if artifact is not None:
+            activate_index(prepare_serving_index(artifact))
+    if INDEX_WATCH_INTERVAL_SECONDS > 0:
+        watch_task = asyncio.create_task(watch_index_versions())
+        print(f"👀 Watching '{INDEX_PATH}' for new index versions every {INDEX_WATCH_INTERVAL_SECONDS:g}s")
+    if MULTIPROCESS:
+        metrics_task = asyncio.create_task(collect_metrics_periodically())
+    if index_status["state"] != "ready":
+        # Opening Chroma or building the index can take a while; serve /livez and
+        # /readyz meanwhile
+        warm_up_task = asyncio.create_task(warm_up_index())
+        print("🎉 Initialization complete! Index is warming up in the background (see /readyz).")
+    else:
+        print("🎉 Initialization complete! Application ready to serve requests.")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    global openai_client, retrieval_executor, serving, warm_up_task, watch_task, update_task, metrics_task
+
+    for task in (warm_up_task, watch_task, update_task, metrics_task):
+        if task and not task.done():
+            task.cancel()
+    warm_up_task = watch_task = update_task = metrics_task = None
+    if serving:
+        serving.query_embedder.cache.close()
+        serving = None
+    if openai_client:
+        await openai_client.close()
+        openai_client = None
+    if retrieval_executor:
+        retrieval_executor.shutdown(wait=False, cancel_futures=True)
+        retrieval_executor = None
+    rate_limit_store.close()
+    if conversation_memory:
+        conversation_memory.store.close()
+    REGISTRY.mark_process_dead()
 
-    print("🔗 Setting up OpenAI embedding function...")
-    from chromadb.utils import embedding_functions
-    openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-        api_key=OPENAI_API_KEY,
-        model_name=EMBEDDING_MODEL_NAME
+
+def default_top_k() -> int:
+    """Sources retrieved per question; with routing, enough for its largest tier"""
+    if routing_policy:
+        return routing_policy.max_top_k
+    return RERANK_TOP_K if reranker else TOP_K_RESULTS
+
+
+def retrieve_documents_batch(active_index: ServingIndex, user_queries: list[str],
+                             top_k: int | None = None) -> list[tuple[list[dict], list[float] | None]]:
+    """
+    Blocking retrieval for several queries at once: one embedding request for
+    all cache misses and one batched vector search. Returns (documents, query
+    embedding) per query; the embedding is None when only the lexical path ran.
+    """
+    # Embed through the cache so repeated questions skip the embedding API round trip
+    return retrieve_batch(
+        active_index.retriever, active_index.lexical_index, active_index.query_embedder.embed_many, user_queries,
+        top_k=top_k or default_top_k(), mode=RETRIEVAL_MODE,
+        candidates=HYBRID_CANDIDATES, rrf_k=RRF_K, collapse=COLLAPSE_CHUNKS, chunk_overfetch=CHUNK_OVERFETCH,
+        reranker=reranker, rerank_candidates=RERANK_CANDIDATES, min_rerank_score=RERANK_MIN_SCORE
     )
-    print("✅ OpenAI embedding function ready")
 
-    print(f"🔍 Looking for existing ChromaDB collection: '{CHROMA_COLLECTION_NAME}'...")
-    try:
-        db_collection = chroma_client.get_collection(
-            name=CHROMA_COLLECTION_NAME,
-            embedding_function=openai_ef  # Provide EF for query embedding consistency
-        )
-        print(f"✅ Found existing collection with {db_collection.count()} items")
-    except Exception as e:
-        print(f"📦 Collection not found. Creating new collection...")
-        print("⏳ This may take 1-2 minutes for data ingestion and OpenAI embeddings...")
-        try:
-            # Import and run ingest_data to create the collection
-            import ingest_data
-            ingest_data.main()
-            # Try to get the collection again
-            db_collection = chroma_client.get_collection(
-                name=CHROMA_COLLECTION_NAME,
-                embedding_function=openai_ef
-            )
-            print(f"✅ Successfully created collection with {db_collection.count()} items")
-        except Exception as ingest_error:
-            print(f"❌ Failed to create collection: {ingest_error}")
-            raise RuntimeError(
-                f"Could not create ChromaDB collection '{CHROMA_COLLECTION_NAME}'. Error: {ingest_error}")
-
-    print("🤖 Initializing OpenAI client for LLM...")
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
-    print("🎉 Initialization complete! Application ready to serve requests.")
-
-
-def construct_llm_prompt(query: str, retrieved_chunks: list[dict]) -> str:
-    if not retrieved_chunks:
-        return f"""Sen Türk Borçlar Kanunu'nun Konut ve Çatılı İşyeri Kiraları bölümü hakkında uzman bir hukuk asistanısın.
-Görevin, kullanıcının sorusunu yanıtlamaktır. Ancak, bu soruyla ilgili spesifik bir metin bulunamadı.
-Lütfen genel bilginle veya soruyu yanıtlayamayacağını belirterek cevap ver.
 
-SORU:
-{query}
+def retrieve_documents(active_index: ServingIndex, user_query: str,
+                       top_k: int | None = None) -> tuple[list[dict], list[float] | None]:
+    """Blocking retrieval for one query; call it through run_retrieval"""
+    return retrieve_documents_batch(active_index, [user_query], top_k)[0]
+
+
+async def run_blocking(func, *args):
+    """
+    Run a blocking retrieval call on the bounded executor with a stage timeout,
+    inside the request's trace
+    """
+    loop = asyncio.get_running_loop()
+    # On timeout the worker thread still finishes its call, but the pool size
+    # caps how many of those can pile up.
+    return await asyncio.wait_for(
+        loop.run_in_executor(retrieval_executor, bind_context(func, *args)),
+        timeout=RETRIEVAL_TIMEOUT_SECONDS
+    )
+
+
+async def run_retrieval(active_index: ServingIndex, user_query: str) -> tuple[list[dict], list[float] | None]:
+    """Run retrieval on the bounded executor with a stage timeout"""
+    return await run_blocking(retrieve_documents, active_index, user_query)
+
+
+def lookup_articles(active_retriever, article_numbers: list[str]) -> list[dict]:
+    """Fetch referenced articles by article number, with their chunks merged back together"""
+    with span("lookup"):
+        docs = active_retriever.get_articles(article_numbers)
+        return collapse_chunks(docs, len(docs))
+
+
+async def gather_sources(active_index: ServingIndex, user_query: str) -> tuple[list[dict], list[float] | None, bool]:
+    """
+    Find the documents for a query: a direct ID lookup when the query names
+    articles that exist, otherwise regular retrieval. Returns (documents,
+    query embedding or None, whether the direct lookup was used).
+    """
+    article_numbers = extract_article_references(user_query) if ARTICLE_LOOKUP_ENABLED else []
+    if article_numbers:
+        referenced_docs = await run_blocking(lookup_articles, active_index.retriever, article_numbers)
+        if referenced_docs:
+            return referenced_docs, None, True
+    retrieved_docs, query_embedding = await run_retrieval(active_index, user_query)
+    return retrieved_docs, query_embedding, False
+
+
+async def gather_conversation_sources(active_index: ServingIndex, user_query: str,
+                                      session_state: dict | None) -> tuple[list[dict], list[float] | None, bool, bool]:
+    """
+    gather_sources for a turn of a conversation: a follow-up question that names
+    no article fetches the articles of the previous answer by ID (no embedding,
+    no search). Returns gather_sources' tuple plus whether sources were reused.
+    """
+    reusable = conversation_memory.reusable_articles(session_state, user_query) \
+        if session_state and SESSION_REUSE_SOURCES else []
+    if reusable and not (ARTICLE_LOOKUP_ENABLED and extract_article_references(user_query)):
+        reused_docs = await run_blocking(lookup_articles, active_index.retriever, reusable)
+        if reused_docs:
+            return reused_docs, None, False, True
+    return (*await gather_sources(active_index, user_query), False)
+
+
+def gather_sources_blocking(active_index: ServingIndex,
+                            user_queries: list[str]) -> list[tuple[list[dict], list[float] | None, bool]]:
+    """
+    Blocking gather_sources for a batch: direct lookups for queries that name
+    articles, one batched retrieval for all the others.
+    """
+    results = [None] * len(user_queries)
+    remaining = []
+    for position, user_query in enumerate(user_queries):
+        article_numbers = extract_article_references(user_query) if ARTICLE_LOOKUP_ENABLED else []
+        referenced_docs = lookup_articles(active_index.retriever, article_numbers) if article_numbers else []
+        if referenced_docs:
+            results[position] = (referenced_docs, None, True)
+        else:
+            remaining.append(position)
+
+    if remaining:
+        retrieved = retrieve_documents_batch(active_index, [user_queries[position] for position in remaining])
+        for position, (retrieved_docs, query_embedding) in zip(remaining, retrieved):
+            results[position] = (retrieved_docs, query_embedding, False)
+    return results
+
+
+async def gather_sources_batch(active_index: ServingIndex,
+                               user_queries: list[str]) -> list[tuple[list[dict], list[float] | None, bool]]:
+    return await run_blocking(gather_sources_blocking, active_index, user_queries)
+
+
+def wants_extractive(request: QueryRequest | BatchQueryRequest) -> bool:
+    return ARTICLE_LOOKUP_EXTRACTIVE if request.extractive is None else request.extractive
+
+
+async def call_session_store(func, *args):
+    """Run a ConversationMemory call, on a thread when the store is SQLite"""
+    if SESSION_BACKEND == "sqlite":
+        return await asyncio.to_thread(bind_context(func, *args))
+    return func(*args)
+
+
+async def open_session(request: QueryRequest) -> tuple[str | None, dict | None]:
+    """
+    (session id, session state) for a request; (None, None) when sessions are
+    disabled or the client neither sent a session id nor asked for one
+    """
+    if not conversation_memory or not (request.session_id or request.start_session):
+        return None, None
+    return await call_session_store(conversation_memory.load, request.session_id)
+
+
+def session_history(session_state: dict | None) -> str:
+    return conversation_memory.history(session_state) if session_state else ""
+
+
+async def record_session_turn(session_id: str | None, user_query: str, answer: str, retrieved_docs: list[dict]):
+    if conversation_memory and session_id and answer:
+        article_numbers = list(dict.fromkeys(
+            doc['metadata']['article_number'] for doc in retrieved_docs if doc['metadata'].get('article_number')))
+        await call_session_store(conversation_memory.record_turn, session_id, user_query, answer, article_numbers)
+
+
+def coalescing_key(active_index: ServingIndex, user_query: str, extractive: bool,
+                   session_state: dict | None) -> str | None:
+    """Key under which identical in-flight requests share their work; None when the answer is per-session"""
+    if not COALESCE_ENABLED or session_history(session_state):
+        return None
+    return f"{active_index.version}|{extractive}|{normalize_query(user_query)}"
+
+
+def route_query(user_query: str, retrieved_docs: list[dict], retrieved: bool,
+                client_ip: str) -> tuple[list[dict], dict | None]:
+    """
+    Routing decision for a question (None when routing is off). Sources found
+    by retrieval are cut to the tier's top-k; articles the question named or
+    a follow-up reused are all kept.
+    """
+    if not routing_policy:
+        return retrieved_docs, None
+    route = routing_policy.route(user_query, retrieved_docs)
+    ROUTE_DECISIONS.labels(tier=route["tier"]).inc()
+    logger.info(f"Routing decision for IP {client_ip}: {json.dumps(route, ensure_ascii=False)}")
+    return (retrieved_docs[:route["top_k"]] if retrieved else retrieved_docs), route
+
+
+def completion_options(route: dict | None) -> dict:
+    """Model and answer length for a chat completion"""
+    if not route:
+        return {"model": LLM_MODEL_NAME}
+    return {"model": route["model"], "max_tokens": route["max_tokens"]}
 
-CEVAP:
-"""
 
-    context_str = ""
-    for i, chunk_info in enumerate(retrieved_chunks):
-        article_num = chunk_info['metadata'].get(
-            'article_number', 'Bilinmeyen Madde')
-        article_header = chunk_info['metadata'].get(
-            'article_header', 'Başlık Yok')
-        text = chunk_info['document']
+def build_llm_messages(prompt: str) -> list[dict]:
+    return [
+        {"role": "system", "content": "You are a helpful legal assistant specialized in Turkish Rental Law for residential and roofed workplaces."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def source_article_ids(retrieved_docs: list[dict]) -> list[str]:
+    return [doc['id'] for doc in retrieved_docs]
+
+
+def answer_variant(route: dict | None) -> tuple:
+    """How an answer was generated: a routing tier's answer is only reused for the same tier, model and length"""
+    options = completion_options(route)
+    return route["tier"] if route else None, options["model"], options.get("max_tokens")
+
+
+def lookup_cached_answer(query_embedding: list[float] | None, retrieved_docs: list[dict],
+                         index_version: str, route: dict | None = None) -> str | None:
+    # The cache holds answers of the served version only (it is cleared on a swap)
+    if not ANSWER_CACHE_ENABLED or not retrieved_docs or query_embedding is None \
+            or index_version != answer_cache.index_version:
+        return None
+    return answer_cache.lookup(query_embedding, source_article_ids(retrieved_docs), answer_variant(route))
+
+
+def store_cached_answer(query_embedding: list[float] | None, retrieved_docs: list[dict], answer: str,
+                        index_version: str, history: str = "", route: dict | None = None):
+    # An answer shaped by an earlier conversation is not one to hand to other users, and
+    # one finished on a swapped-out version would outlive the clear
+    if ANSWER_CACHE_ENABLED and retrieved_docs and answer and query_embedding is not None and not history \
+            and index_version == answer_cache.index_version:
+        answer_cache.store(query_embedding, source_article_ids(retrieved_docs), answer, answer_variant(route))
 
-        context_str += f"METİN {i+1} ({article_num} - Başlık: {article_header}):\n"
-        context_str += f"{text}\n---\n"
 
-    prompt_template = f"""Sen Türk Borçlar Kanunu'nun Konut ve Çatılı İşyeri Kiraları bölümü hakkında uzman bir hukuk asistanısın.
+def record_llm_usage(usage):
+    if usage:
+        LLM_TOKENS.labels(kind="prompt").inc(usage.prompt_tokens or 0)
+        LLM_TOKENS.labels(kind="completion").inc(usage.completion_tokens or 0)
+
+
+async def generate_answer(prompt: str, route: dict | None = None) -> str:
+    """Call the LLM without blocking the event loop, bounded by the LLM stage timeout"""
+    with span("llm"):
+        chat_completion = await asyncio.wait_for(
+            openai_client.chat.completions.create(
+                **completion_options(route),
+                messages=build_llm_messages(prompt),
+                temperature=0.3  # Adjust for more factual/creative responses
+            ),
+            timeout=LLM_TIMEOUT_SECONDS
+        )
+    record_llm_usage(chat_completion.usage)
+    return chat_completion.choices[0].message.content.strip()
+
+
+# Instructions precede everything that varies per request and never change, so the
+# system message plus this prefix are byte-identical across calls and can be served
+# from the provider's prompt cache
+PROMPT_INSTRUCTIONS = """Sen Türk Borçlar Kanunu'nun Konut ve Çatılı İşyeri Kiraları bölümü hakkında uzman bir hukuk asistanısın.
 Görevin, kullanıcının sorusunu SADECE aşağıda sağlanan METİNLERİ kullanarak yanıtlamaktır.
 Cevabını oluştururken, bilgiyi hangi maddeden (MADDE numarası) ve metinden (METİN Numarası) aldığını belirt. Örneğin: "(Kaynak: METİN 1, MADDE 339)".
 Eğer sağlanan metinlerde sorunun cevabı yoksa, "Sağlanan bilgiler arasında bu soruya kesin bir cevap bulamadım." şeklinde yanıt ver.
 Cevabın açık, anlaşılır ve Türkçe olmalıdır. Yorum yapma veya metinlerin dışında bilgi ekleme.
 
 METİNLER:
-{context_str}
-SORU:
-{query}
+"""
+
+# Conversation so far (sessions only); it goes after the texts, so the cacheable prefix is unchanged
+HISTORY_PROMPT_HEADER = "ÖNCEKİ KONUŞMA (yalnızca soruyu anlamak için; cevabı yine sağlanan METİNLERE dayandır):\n"
+
+NO_CONTEXT_PROMPT_INSTRUCTIONS = """Sen Türk Borçlar Kanunu'nun Konut ve Çatılı İşyeri Kiraları bölümü hakkında uzman bir hukuk asistanısın.
+Görevin, kullanıcının sorusunu yanıtlamaktır. Ancak, bu soruyla ilgili spesifik bir metin bulunamadı.
+Lütfen genel bilginle veya soruyu yanıtlayamayacağını belirterek cevap ver.
 
-CEVAP:
 """
-    return prompt_template
+
+
+def format_context_header(position: int, chunk_info: dict) -> str:
+    article_num = chunk_info['metadata'].get('article_number', 'Bilinmeyen Madde')
+    article_header = chunk_info['metadata'].get('article_header', 'Başlık Yok')
+    return f"METİN {position + 1} ({article_num} - Başlık: {article_header}):\n"
+
+
+def construct_llm_prompt(query: str, retrieved_chunks: list[dict], history: str = "") -> str:
+    history_block = f"{HISTORY_PROMPT_HEADER}{history}\n\n" if history else ""
+    if not retrieved_chunks:
+        return f"{NO_CONTEXT_PROMPT_INSTRUCTIONS}{history_block}SORU:\n{query}\n\nCEVAP:\n"
+
+    # METİN numbers follow the order of the returned sources, even when a duplicate is skipped
+    with span("prompt"):
+        packed = pack_context(retrieved_chunks, CONTEXT_TOKEN_BUDGET, format_context_header)
+    logger.debug(f"Packed {len(packed)} of {len(retrieved_chunks)} documents into the prompt")
+    parts = [PROMPT_INSTRUCTIONS]
+    for position, chunk_info in packed:
+        parts.append(format_context_header(position, chunk_info))
+        parts.append(f"{chunk_info['document']}\n---\n")
+    if history_block:
+        parts.append(f"\n{history_block}")
+    parts.append(f"\nSORU:\n{query}\n\nCEVAP:\n")
+    return "".join(parts)
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format a single server-sent event frame"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_answer_tokens(prompt: str, route: dict | None = None):
+    """Yield answer tokens from a streaming chat completion as they arrive"""
+    start = time.perf_counter()
+    with span("llm"):
+        stream = await asyncio.wait_for(
+            openai_client.chat.completions.create(
+                **completion_options(route),
+                messages=build_llm_messages(prompt),
+                temperature=0.3,
+                stream=True,
+                # The final chunk then carries the token usage
+                stream_options={"include_usage": True}
+            ),
+            timeout=LLM_TIMEOUT_SECONDS
+        )
+        first_token = True
+        async for chunk in stream:
+            record_llm_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token:
+                    STAGE_SECONDS.labels(stage="llm_first_token").observe(time.perf_counter() - start)
+                    first_token = False
+                yield chunk.choices[0].delta.content
+
 
 # --- API Endpoints ---
 
 
-@app.post("/query", response_model=QueryResponse)
-async def handle_query(
-    request: QueryRequest,
-    fastapi_request: Request,
-    x_api_key: str = Header(..., alias="X-API-Key")
-):
-    global db_collection, openai_client
-    
-    # Get client IP for rate limiting and logging
-    client_ip = fastapi_request.client.host
-    
+async def enforce_access(x_api_key: str, client_ip: str, batch_queries: int = 0) -> ServingIndex:
+    """
+    Shared auth, rate limit and availability checks for the query endpoints;
+    `batch_queries` is the size of a /query/batch request, charged to the
+    batch quota. Returns the index snapshot the request is served from
+    """
     # Security checks
-    if not validate_api_key(x_api_key):
+    with span("auth"):
+        valid_key = validate_api_key(x_api_key)
+    if not valid_key:
         logger.warning(f"Invalid API key attempt from IP: {client_ip}")
         raise HTTPException(
             status_code=401, 
             detail="Invalid API key"
         )
     
-    if not check_rate_limit(client_ip):
-        logger.warning(f"Rate limit exceeded for IP: {client_ip}")
+    max_batch_queries = min(BATCH_MAX_QUERIES, RATE_LIMIT_BATCH_QUERIES)
+    if batch_queries > max_batch_queries:
+        raise HTTPException(
+            status_code=413, detail=f"Too many queries in one batch. Maximum {max_batch_queries} allowed.")
+
+    with span("rate_limit"):
+        exceeded = await check_rate_limit(client_ip, x_api_key, batch_queries)
+    if exceeded is not None:
+        limit_name, retry_after = exceeded
+        logger.warning(f"Rate limit ({limit_name}) exceeded for IP: {client_ip}")
+        if limit_name == "batch":
+            detail = (f"Batch quota exceeded. Maximum {RATE_LIMIT_BATCH_QUERIES} batch queries per "
+                      f"{RATE_LIMIT_BATCH_WINDOW} seconds allowed per API key.")
+        else:
+            detail = f"Rate limit exceeded. Maximum {RATE_LIMIT_REQUESTS} requests per {RATE_LIMIT_WINDOW} seconds allowed."
         raise HTTPException(
             status_code=429, 
-            detail=f"Rate limit exceeded. Maximum {RATE_LIMIT_REQUESTS} requests per minute allowed."
+            detail=detail,
+            headers={"Retry-After": str(max(1, round(retry_after)))}
         )
     
     # Service availability checks
-    if not db_collection:
+    active_index = serving
+    if not active_index:
         raise HTTPException(
-            status_code=503, detail="ChromaDB collection not available. Server may be initializing or encountered an error.")
+            status_code=503,
+            detail=f"Search index not ready ({describe_index_status()}). Please try again shortly.",
+            headers={"Retry-After": "5"})
     if not openai_client:
         raise HTTPException(
             status_code=503, detail="OpenAI client not available.")
+    return active_index
 
-    user_query = request.query_text
-    logger.info(f"Received query from IP {client_ip}: {user_query[:100]}...")
 
-    try:
-        # 1. Retrieve relevant documents from ChromaDB
-        # The collection's embedding function will handle embedding the query_text
-        results = db_collection.query(
-            query_texts=[user_query],
-            n_results=TOP_K_RESULTS,
-            include=['documents', 'metadatas']  # Ensure metadatas are included
+async def answer_from_sources(user_query: str, retrieved_docs: list[dict], query_embedding: list[float] | None,
+                              direct_lookup: bool, extractive: bool, client_ip: str,
+                              index_version: str, llm_semaphore: asyncio.Semaphore | None = None,
+                              history: str = "", route: dict | None = None) -> QueryResponse:
+    """Answer from already-retrieved sources: verbatim articles, a cached answer or an LLM call"""
+    if direct_lookup and extractive:
+        return QueryResponse(
+            answer=format_extractive_answer(retrieved_docs),
+            retrieved_sources=retrieved_docs,
+            extractive=True
         )
+    if not retrieved_docs:
+        logger.warning(f"No relevant documents found for query from IP {client_ip}")
+        # Fallback or inform user, here we'll let the LLM handle it via prompt
 
-        retrieved_docs = []
-        if results and results.get('documents') and results.get('metadatas'):
-            for i in range(len(results['documents'][0])):
-                retrieved_docs.append({
-                    "document": results['documents'][0][i],
-                    "metadata": results['metadatas'][0][i]
-                })
-
-        logger.info(f"Retrieved {len(retrieved_docs)} documents from ChromaDB for IP {client_ip}")
-        if not retrieved_docs:
-            logger.warning(f"No relevant documents found in ChromaDB for query from IP {client_ip}")
-            # Fallback or inform user, here we'll let the LLM handle it via prompt
-
-        # 2. Construct prompt for LLM
-        prompt = construct_llm_prompt(user_query, retrieved_docs)
-        # logger.debug(f"Constructed LLM Prompt:\n{prompt}\n") # For debugging
-
-        # 3. Call LLM
-        logger.info(f"Sending prompt to LLM model: {LLM_MODEL_NAME} for IP {client_ip}")
-        chat_completion = openai_client.chat.completions.create(
-            model=LLM_MODEL_NAME,
-            messages=[
-                {"role": "system", "content": "You are a helpful legal assistant specialized in Turkish Rental Law for residential and roofed workplaces."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3  # Adjust for more factual/creative responses
-        )
+    # A paraphrase of an earlier question with the same sources can reuse its answer
+    cached_answer = lookup_cached_answer(query_embedding, retrieved_docs, index_version, route)
+    if cached_answer is not None:
+        logger.info(f"Answer cache hit for IP {client_ip}, skipping LLM call")
+        return QueryResponse(answer=cached_answer, retrieved_sources=retrieved_docs, cached=True)
+
+    prompt = construct_llm_prompt(user_query, retrieved_docs, history)
+    # logger.debug(f"Constructed LLM Prompt:\n{prompt}\n") # For debugging
+
+    async with llm_semaphore or contextlib.nullcontext():
+        logger.info(f"Sending prompt to LLM model: {completion_options(route)['model']} for IP {client_ip}")
+        answer = await generate_answer(prompt, route)
+
+    logger.info(f"Successfully processed query for IP {client_ip}, response length: {len(answer)}")
+    store_cached_answer(query_embedding, retrieved_docs, answer, index_version, history, route)
+    return QueryResponse(answer=answer, retrieved_sources=retrieved_docs)
+
+
+async def compute_query_response(active_index: ServingIndex, user_query: str, extractive: bool,
+                                 session_state: dict | None, client_ip: str) -> QueryResponse:
+    """Retrieval and answer for /query; shared by identical in-flight requests when coalesced"""
+    # 1. Retrieve relevant documents (off the event loop), or reuse the previous turn's
+    try:
+        retrieved_docs, query_embedding, direct_lookup, reused_sources = \
+            await gather_conversation_sources(active_index, user_query, session_state)
+    except asyncio.TimeoutError:
+        logger.error(f"Retrieval timed out after {RETRIEVAL_TIMEOUT_SECONDS}s for IP {client_ip}")
+        raise HTTPException(
+            status_code=504, detail="Document retrieval timed out. Please try again.")
+
+    if direct_lookup:
+        logger.info(f"Direct article lookup returned {[doc['id'] for doc in retrieved_docs]} for IP {client_ip}")
+    elif reused_sources:
+        logger.info(f"Follow-up question reused {[doc['id'] for doc in retrieved_docs]} for IP {client_ip}")
+    else:
+        logger.info(f"Retrieved {len(retrieved_docs)} documents via {active_index.retriever.name} for IP {client_ip}")
+    retrieved_docs, route = route_query(
+        user_query, retrieved_docs, not (direct_lookup or reused_sources), client_ip)
+
+    # 2-3. Construct the prompt and call the LLM (unless the answer is extractive or cached)
+    try:
+        response = await answer_from_sources(
+            user_query, retrieved_docs, query_embedding, direct_lookup, extractive, client_ip,
+            active_index.version, history=session_history(session_state), route=route)
+    except asyncio.TimeoutError:
+        logger.error(f"LLM call timed out after {LLM_TIMEOUT_SECONDS}s for IP {client_ip}")
+        raise HTTPException(
+            status_code=504, detail="The language model did not respond in time. Please try again.")
+    response.reused_sources = reused_sources
+    response.route = route["tier"] if route else None
+    return response
+
+
+@app.post("/query", response_model=QueryResponse)
+async def handle_query(
+    request: QueryRequest,
+    fastapi_request: Request,
+    x_api_key: str = Header(..., alias="X-API-Key")
+):
+    # Get client IP for rate limiting and logging
+    client_ip = fastapi_request.client.host
+    active_index = await enforce_access(x_api_key, client_ip)
+
+    user_query = request.query_text
+    logger.info(f"Received query from IP {client_ip}: {user_query[:100]}...")
+    session_id, session_state = await open_session(request)
+    extractive = wants_extractive(request)
 
-        answer = chat_completion.choices[0].message.content.strip()
-        logger.info(f"Successfully processed query for IP {client_ip}, response length: {len(answer)}")
+    try:
+        key = coalescing_key(active_index, user_query, extractive, session_state)
+        if key is None:
+            response = await compute_query_response(active_index, user_query, extractive, session_state, client_ip)
+        else:
+            response, shared = await query_flight.run(
+                key, lambda: compute_query_response(active_index, user_query, extractive, session_state, client_ip))
+            if shared:
+                logger.info(f"Answered IP {client_ip} from an identical in-flight query")
+        # The response object may be shared with coalesced requests
+        response = response.model_copy(update={"session_id": session_id})
+        await record_session_turn(session_id, user_query, response.answer, response.retrieved_sources)
 
-        return QueryResponse(answer=answer, retrieved_sources=retrieved_docs)
+        # 4. Serialize here rather than in FastAPI, so the time shows up as its own stage
+        with span("serialize"):
+            return JSONResponse(content=jsonable_encoder(response))
 
+    except HTTPException:
+        raise
     except RuntimeError as e:  # Catch specific runtime errors like API key issues
         logger.error(f"Runtime error during query processing for IP {client_ip}: {e}")
         raise HTTPException(
@@ -277,26 +1215,342 @@ async def handle_query(
             status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 
+async def answer_events(active_index: ServingIndex, user_query: str, extractive: bool,
+                        session_state: dict | None, client_ip: str):
+    """
+    (event, data) pairs of a streamed answer, without anything specific to the
+    requesting client, so identical in-flight streams can share them. Never
+    raises: failures become an `error` event.
+    """
+    try:
+        try:
+            retrieved_docs, query_embedding, direct_lookup, reused_sources = \
+                await gather_conversation_sources(active_index, user_query, session_state)
+        except asyncio.TimeoutError:
+            logger.error(f"Retrieval timed out after {RETRIEVAL_TIMEOUT_SECONDS}s for IP {client_ip}")
+            yield "error", {"detail": "Document retrieval timed out. Please try again."}
+            return
+        source_name = 'direct lookup' if direct_lookup else 'previous turn' if reused_sources \
+            else active_index.retriever.name
+        logger.info(f"Retrieved {len(retrieved_docs)} documents via {source_name} for IP {client_ip}")
+        retrieved_docs, route = route_query(
+            user_query, retrieved_docs, not (direct_lookup or reused_sources), client_ip)
+        yield "sources", {"retrieved_sources": retrieved_docs, "reused_sources": reused_sources,
+                          "route": route["tier"] if route else None}
+
+        if direct_lookup and extractive:
+            yield "token", {"text": format_extractive_answer(retrieved_docs)}
+            yield "done", {"cached": False, "extractive": True}
+            return
+
+        cached_answer = lookup_cached_answer(query_embedding, retrieved_docs, active_index.version, route)
+        if cached_answer is not None:
+            logger.info(f"Answer cache hit for IP {client_ip}, skipping LLM call")
+            yield "token", {"text": cached_answer}
+            yield "done", {"cached": True}
+            return
+
+        history = session_history(session_state)
+        prompt = construct_llm_prompt(user_query, retrieved_docs, history)
+        logger.info(f"Streaming prompt to LLM model: {completion_options(route)['model']} for IP {client_ip}")
+        answer_parts = []
+        try:
+            async for token in stream_answer_tokens(prompt, route):
+                answer_parts.append(token)
+                yield "token", {"text": token}
+        except asyncio.TimeoutError:
+            logger.error(f"LLM stream timed out after {LLM_TIMEOUT_SECONDS}s for IP {client_ip}")
+            yield "error", {"detail": "The language model did not respond in time. Please try again."}
+            return
+
+        answer = "".join(answer_parts).strip()
+        logger.info(f"Successfully streamed answer for IP {client_ip}, response length: {len(answer)}")
+        store_cached_answer(query_embedding, retrieved_docs, answer, active_index.version, history, route)
+        yield "done", {"cached": False}
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error during streaming query for IP {client_ip}: {e}")
+        yield "error", {"detail": f"An unexpected error occurred: {str(e)}"}
+
+
+@app.post("/query/stream")
+async def handle_query_stream(
+    request: QueryRequest,
+    fastapi_request: Request,
+    x_api_key: str = Header(..., alias="X-API-Key")
+):
+    """
+    Server-sent events variant of /query. Emits one `sources` event with the
+    retrieved documents (and the session id to send with the next question),
+    then `token` events as the LLM produces text, and finally `done` (or
+    `error` if a stage fails after the stream has started). Identical
+    in-flight questions subscribe to one stream.
+    """
+    client_ip = fastapi_request.client.host
+    active_index = await enforce_access(x_api_key, client_ip)
+
+    user_query = request.query_text
+    logger.info(f"Received streaming query from IP {client_ip}: {user_query[:100]}...")
+    session_id, session_state = await open_session(request)
+    extractive = wants_extractive(request)
+
+    async def event_stream():
+        key = coalescing_key(active_index, user_query, extractive, session_state)
+        if key is None:
+            events = answer_events(active_index, user_query, extractive, session_state, client_ip)
+        else:
+            events = stream_flight.subscribe(
+                key, lambda: answer_events(active_index, user_query, extractive, session_state, client_ip))
+        retrieved_docs, answer_parts = [], []
+        async for event_name, data in events:
+            if event_name == "sources":
+                retrieved_docs = data["retrieved_sources"]
+                data = {**data, "session_id": session_id}
+            elif event_name == "token":
+                answer_parts.append(data["text"])
+            elif event_name == "done":
+                await record_session_turn(session_id, user_query, "".join(answer_parts).strip(), retrieved_docs)
+            yield sse_event(event_name, data)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/query/batch")
+async def handle_query_batch(
+    request: BatchQueryRequest,
+    fastapi_request: Request,
+    x_api_key: str = Header(..., alias="X-API-Key")
+):
+    """
+    Answer many queries in one call, for offline jobs. Retrieval runs once for
+    the whole batch (one embedding request, one batched vector search), then
+    up to BATCH_LLM_CONCURRENCY completions run at a time. Results stream back
+    as NDJSON, one line per query as soon as it is answered, so lines carry
+    the query's `index` in the request and may arrive out of order.
+    """
+    client_ip = fastapi_request.client.host
+    # Every query gets its own LLM answer, so each one spends the key's batch quota
+    active_index = await enforce_access(x_api_key, client_ip, batch_queries=len(request.queries))
+
+    logger.info(f"Received batch of {len(request.queries)} queries from IP {client_ip}")
+    try:
+        sources = await gather_sources_batch(active_index, request.queries)
+    except asyncio.TimeoutError:
+        logger.error(f"Batch retrieval timed out after {RETRIEVAL_TIMEOUT_SECONDS}s for IP {client_ip}")
+        raise HTTPException(
+            status_code=504, detail="Document retrieval timed out. Please try again.")
+    logger.info(f"Retrieved sources for {len(sources)} queries via {active_index.retriever.name} for IP {client_ip}")
+
+    extractive = wants_extractive(request)
+    llm_semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def answer_one(index: int, user_query: str, retrieved_docs, query_embedding, direct_lookup) -> dict:
+        result = {"index": index, "query_text": user_query}
+        try:
+            retrieved_docs, route = route_query(user_query, retrieved_docs, not direct_lookup, client_ip)
+            response = await answer_from_sources(
+                user_query, retrieved_docs, query_embedding, direct_lookup, extractive, client_ip,
+                active_index.version, llm_semaphore, route=route)
+            response.route = route["tier"] if route else None
+            result.update(response.model_dump())
+        except asyncio.TimeoutError:
+            logger.error(f"LLM call timed out after {LLM_TIMEOUT_SECONDS}s for batch query {index} from IP {client_ip}")
+            result["error"] = "The language model did not respond in time."
+        except Exception as e:
+            logger.error(f"Unexpected error for batch query {index} from IP {client_ip}: {e}")
+            result["error"] = f"An unexpected error occurred: {str(e)}"
+        return result
+
+    async def result_stream():
+        tasks = [
+            asyncio.create_task(answer_one(index, user_query, *query_sources))
+            for index, (user_query, query_sources) in enumerate(zip(request.queries, sources))
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield json.dumps(await next_result, ensure_ascii=False) + "\n"
+        finally:
+            # The client disconnected or the stream finished; stop any remaining completions
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, x_api_key: str = Header(..., alias="X-API-Key")):
+    """Forget a conversation (e.g. when the user clears the chat)"""
+    if not validate_api_key(x_api_key):
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    if conversation_memory:
+        await call_session_store(conversation_memory.delete, session_id)
+    return Response(status_code=204)
+
+
+def require_admin(x_admin_key: str | None):
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_key != ADMIN_API_KEY:
+        logger.warning("Invalid admin key attempt")
+        raise HTTPException(status_code=401, detail="Invalid admin key")
+
+
+@app.get("/admin/index/versions")
+async def list_index_versions(x_admin_key: str | None = Header(None, alias="X-Admin-Key")):
+    """Index versions on disk (newest first), the CURRENT one and the one this worker serves"""
+    require_admin(x_admin_key)
+    return {
+        "current": current_version(INDEX_PATH),
+        "serving": serving.version if serving else None,
+        "versions": await asyncio.to_thread(list_versions, INDEX_PATH),
+        "last_rebuild": index_status["update"]
+    }
+
+
+@app.post("/admin/index/swap")
+async def swap_index_version(request: IndexSwapRequest, x_admin_key: str | None = Header(None, alias="X-Admin-Key")):
+    """
+    Serve another index version already on disk, e.g. to roll back. This
+    worker swaps before responding and makes the version CURRENT; the other
+    workers follow within INDEX_WATCH_INTERVAL_SECONDS.
+    """
+    require_admin(x_admin_key)
+    version = request.version or current_version(INDEX_PATH)
+    known_versions = {manifest["version"] for manifest in await asyncio.to_thread(list_versions, INDEX_PATH)}
+    if version not in known_versions:
+        raise HTTPException(status_code=404, detail=f"No index version '{version}'")
+    try:
+        artifact = await asyncio.to_thread(IndexArtifact.load, INDEX_PATH, version)
+    except IncompatibleArtifactError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not matches_configuration(artifact.embedding_provider, EMBEDDING_PROVIDER, EMBEDDING_MODEL_NAME):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Index version {version} was embedded with '{artifact.embedding_provider}', "
+                   f"not the configured {EMBEDDING_PROVIDER} provider")
+
+    previous = serving.version if serving else None
+    try:
+        swapped = await swap_index(artifact)
+    except Exception as e:
+        logger.error(f"Swapping to index {version} failed, still serving {previous}: {e}")
+        raise HTTPException(status_code=500, detail=f"Swap failed, still serving {previous}: {e}")
+    if request.version:
+        await asyncio.to_thread(set_current_version, INDEX_PATH, version)
+    logger.info(f"Admin swap from index {previous} to {version}")
+    return {"previous": previous, "serving": version, "swapped": swapped}
+
+
+@app.post("/admin/index/rebuild", status_code=202)
+async def rebuild_index_version(request: IndexRebuildRequest, x_admin_key: str | None = Header(None, alias="X-Admin-Key")):
+    """
+    Re-ingest the sources into a new index version in the background, while
+    the current one keeps serving, and swap to it when it is ready. Progress
+    is reported under "last_rebuild" by /admin/index/versions.
+    """
+    global update_task
+
+    require_admin(x_admin_key)
+    if (update_task and not update_task.done()) or (warm_up_task and not warm_up_task.done()):
+        raise HTTPException(status_code=409, detail="An index build is already running")
+    index_status["update"] = {
+        "state": "building", "stage": None, "progress": {}, "full": request.full,
+        "started_at": time.time(), "finished_at": None, "version": None, "error": None
+    }
+    update_task = asyncio.create_task(rebuild_index(request.full))
+    logger.info(f"Admin index rebuild started (full={request.full})")
+    return {"status": "accepted", "update": index_status["update"]}
+
+
+@app.get("/metrics")
+async def metrics_endpoint(
+    authorization: str | None = Header(None),
+    x_api_key: str | None = Header(None, alias="X-API-Key")
+):
+    """Prometheus metrics, of all workers in multiprocess mode (METRICS_TOKEN as a bearer token, or the API key)"""
+    bearer_ok = bool(METRICS_TOKEN) and authorization == f"Bearer {METRICS_TOKEN}"
+    if not bearer_ok and not (x_api_key and validate_api_key(x_api_key)):
+        raise HTTPException(status_code=401, detail="Metrics require a bearer token or API key")
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/livez")
+async def liveness_check():
+    """Liveness probe: the process is up and serving, whatever the index state"""
+    return {"status": "alive", "timestamp": time.time()}
+
+
+@app.get("/readyz")
+async def readiness_check():
+    """Readiness probe: 200 once the index is attached, 503 with warm-up progress before that"""
+    ready = serving is not None and openai_client is not None
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "index": index_status, "timestamp": time.time()}
+    )
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint for monitoring"""
     try:
         # Check if services are available
-        if not db_collection:
-            return {"status": "unhealthy", "reason": "ChromaDB not available"}
+        active_index = serving
+        if not active_index:
+            return {"status": "unhealthy", "reason": f"Search index not ready ({describe_index_status()})"}
         if not openai_client:
             return {"status": "unhealthy", "reason": "OpenAI client not available"}
-        
-        # Check ChromaDB collection count
-        collection_count = db_collection.count()
-        
+
         return {
             "status": "healthy",
             "services": {
-                "chromadb": "connected",
+                "retrieval_backend": active_index.retriever.name,
+                "retrieval_mode": RETRIEVAL_MODE,
                 "openai": "connected"
             },
-            "collection_documents": collection_count,
+            "index_version": active_index.version,
+            "collection_documents": active_index.documents,
+            "index_updates": {
+                "watch_interval_seconds": INDEX_WATCH_INTERVAL_SECONDS,
+                "swaps": index_status["swaps"],
+                "swapped_at": index_status["swapped_at"],
+                "last_rebuild": index_status["update"]
+            },
+            "embedding_provider": active_index.query_embedder.provider.identity,
+            "embedding_cache": active_index.query_embedder.cache.stats(),
+            "answer_cache": answer_cache.stats(),
+            "rerank": {
+                "enabled": reranker is not None,
+                "candidates": RERANK_CANDIDATES,
+                "top_k": RERANK_TOP_K,
+                "min_score": RERANK_MIN_SCORE
+            },
+            "routing": {
+                "enabled": routing_policy is not None,
+                "tiers": routing_policy.tiers if routing_policy else None
+            },
+            "sessions": await call_session_store(conversation_memory.stats) if conversation_memory else None,
+            "coalescing": {
+                "enabled": COALESCE_ENABLED,
+                "query": query_flight.stats(),
+                "stream": stream_flight.stats()
+            },
+            "context": {
+                "token_budget": CONTEXT_TOKEN_BUDGET,
+                "token_counter": token_counter_name()
+            },
+            "rate_limits": {
+                "backend": RATE_LIMIT_BACKEND,
+                "per_ip": ip_rate_limiter.stats(),
+                "per_api_key": key_rate_limiter.stats(),
+                "batch_per_api_key": batch_rate_limiter.stats(),
+                "store_unavailable": dict(rate_limit_store_failures, fail_open=RATE_LIMIT_FAIL_OPEN)
+            },
             "timestamp": time.time()
         }
     except Exception as e:
@@ -0,0 +1,79 @@
+import os
+import threading
+
+import prometheus_client
+from prometheus_client import CONTENT_TYPE_LATEST as CONTENT_TYPE
+from prometheus_client import CollectorRegistry, Counter, Gauge, generate_latest, multiprocess
+
+
+# Seconds; spans from a cache hit (sub-millisecond) to a slow LLM completion
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# With several uvicorn workers, point PROMETHEUS_MULTIPROC_DIR at a directory that is
+# emptied before the server starts: every worker writes its metrics there and any
+# worker answering a scrape reports the sum over all of them (prometheus_client's
+# multiprocess mode). Without it, metrics are those of the worker that answers.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# Keep the exposition to the series dashboards use (no *_created timestamps)
+prometheus_client.disable_created_metrics()
+
+__all__ = ["CONTENT_TYPE", "DEFAULT_BUCKETS", "MULTIPROCESS", "REGISTRY", "Counter", "Gauge", "Histogram"]
+
+
+class Histogram(prometheus_client.Histogram):
+    """prometheus_client's histogram with buckets suited to request stages"""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(name, documentation, labelnames, buckets=buckets, **kwargs)
+
+
+class Registry:
+    """
+    Renders /metrics. Collect hooks copy values that other components already
+    count (cache stats, limiter stats) into metrics; they run before each
+    render and, in multiprocess mode, periodically in every worker (`collect`),
+    so workers that do not answer the scrape are up to date too.
+    """
+
+    def __init__(self):
+        self._collect_hooks = []
+        self._mirrored = {}  # (counter, label values) -> total last copied into it
+        self._lock = threading.Lock()
+
+    def on_collect(self, hook):
+        with self._lock:
+            self._collect_hooks.append(hook)
+        return hook
+
+    def collect(self):
+        with self._lock:
+            hooks = list(self._collect_hooks)
+        for hook in hooks:
+            hook()
+
+    def mirror(self, counter: Counter, total: float, **labels):
+        """Bring `counter` up to a total counted elsewhere, as an increment (a component reset counts from 0)"""
+        key = (counter, tuple(sorted(labels.items())))
+        with self._lock:
+            last = self._mirrored.get(key, 0)
+            self._mirrored[key] = total
+        increment = total - last if total >= last else total
+        if increment:
+            (counter.labels(**labels) if labels else counter).inc(increment)
+
+    def render(self) -> bytes:
+        self.collect()
+        if not MULTIPROCESS:
+            return generate_latest()
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+
+    @staticmethod
+    def mark_process_dead(pid: int | None = None):
+        """Drop a stopped worker's live gauges (in-flight requests, index state) in multiprocess mode"""
+        if MULTIPROCESS:
+            multiprocess.mark_process_dead(pid or os.getpid())
+
+
+REGISTRY = Registry()
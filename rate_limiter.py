@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def gcra_step(tat: float | None, now: float, interval: float, capacity: float) -> tuple[bool, float, float]:
+    """
+    One step of the generic cell rate algorithm. `tat` is the key's theoretical
+    arrival time (None for a new key), `interval` the time one request costs and
+    `capacity` the burst window. Returns (allowed, new tat, seconds until retry).
+    """
+    new_tat = max(tat or now, now) + interval
+    if new_tat - now > capacity:
+        return False, tat, new_tat - capacity - now
+    return True, new_tat, 0.0
+
+
+class MemoryRateLimitStore:
+    """
+    Per-process GCRA state: one float per key. Keys are kept in update order,
+    so keys that went idle (their tat is in the past, i.e. a full bucket) are
+    dropped from the front in amortized O(1); `max_keys` bounds memory outright.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._tats = OrderedDict()  # key -> theoretical arrival time, least recently updated first
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, now: float, interval: float, capacity: float) -> tuple[bool, float]:
+        with self._lock:
+            allowed, tat, retry_after = gcra_step(self._tats.get(key), now, interval, capacity)
+            if allowed:
+                self._tats[key] = tat
+                self._tats.move_to_end(key)
+                self._evict(now)
+            return allowed, retry_after
+
+    def _evict(self, now: float):
+        while self._tats:
+            oldest_key, oldest_tat = next(iter(self._tats.items()))
+            if oldest_tat > now and len(self._tats) <= self.max_keys:
+                break
+            del self._tats[oldest_key]
+
+    def size(self) -> int:
+        return len(self._tats)
+
+    def close(self):
+        pass
+
+
+class SQLiteRateLimitStore:
+    """
+    GCRA state in a SQLite table, shared by every worker process on the host.
+    Each check is one short IMMEDIATE transaction, so concurrent workers
+    serialize on the row instead of double-spending a bucket. A check waits at
+    most `busy_timeout` seconds for the write lock and then raises
+    sqlite3.OperationalError, so callers decide how to fail instead of stalling.
+    Idle keys are deleted every `evict_every` checks.
+    """
+
+    def __init__(self, db_path: str, evict_every: int = 1000, busy_timeout: float = 1.0):
+        self.db_path = db_path
+        self.evict_every = evict_every
+        self._checks = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # Setup may wait for other workers creating the same file; checks must not
+        self._conn = sqlite3.connect(db_path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat REAL NOT NULL)")
+        self._conn.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+
+    def acquire(self, key: str, now: float, interval: float, capacity: float) -> tuple[bool, float]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tat FROM rate_limits WHERE key = ?", (key,)).fetchone()
+                allowed, tat, retry_after = gcra_step(row[0] if row else None, now, interval, capacity)
+                if allowed:
+                    self._conn.execute(
+                        "INSERT INTO rate_limits (key, tat) VALUES (?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET tat = excluded.tat",
+                        (key, tat)
+                    )
+                self._checks += 1
+                if self._checks % self.evict_every == 0:
+                    self._conn.execute("DELETE FROM rate_limits WHERE tat <= ?", (now,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return allowed, retry_after
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RateLimiter:
+    """
+    GCRA rate limiter (equivalent to a token bucket holding `limit` tokens that
+    refill evenly over `window` seconds). O(1) per check, and the only state per
+    key is its theoretical arrival time, kept in a pluggable store.
+    """
+
+    def __init__(self, limit: int, window: float, store):
+        self.limit = limit
+        self.window = window
+        self.store = store
+        self._interval = window / limit
+        self.allowed = 0
+        self.rejected = 0
+
+    def check(self, key: str, cost: int = 1) -> tuple[bool, float]:
+        """
+        Consume `cost` requests for `key` at once (all or nothing); returns
+        (allowed, seconds until they would be allowed). A cost above `limit`
+        is never allowed.
+        """
+        allowed, retry_after = self.store.acquire(key, time.time(), self._interval * cost, self.window)
+        if allowed:
+            self.allowed += 1
+        else:
+            self.rejected += 1
+        return allowed, retry_after
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "window_seconds": self.window,
+            "tracked_keys": self.store.size(),
+            "allowed": self.allowed,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,132 @@
+import json
+import math
+from functools import lru_cache
+
+import numpy as np
+
+from article_lookup import extract_article_references
+from lexical_index import tokenize
+
+
+# Features of a (query, candidate) pair, in weight order
+FEATURES = (
+    "vector_rank",    # 1 / (1 + rank) in the vector results, 0 if the vector side missed it
+    "lexical_rank",   # 1 / (1 + rank) in the BM25 results, 0 if the lexical side missed it
+    "coverage",       # IDF-weighted share of the query terms found in the document
+    "header_match",   # IDF-weighted share of the query terms found in the article header
+    "article_match",  # 1 if the query names the document's article number
+)
+
+# Learned on benchmarks/retrieval_gold.jsonl by benchmarks/train_reranker.py
+# (hash embeddings, paragraph chunks, 20 candidates)
+DEFAULT_WEIGHTS = {
+    "weights": [2.056, 2.807, 3.195, 7.56, 7.79],
+    "bias": -4.465
+}
+
+
+@lru_cache(maxsize=4096)
+def header_terms(header: str) -> frozenset:
+    # Headers repeat across the chunks of an article, so each is tokenized once
+    return frozenset(tokenize(header))
+
+
+class LinearReranker:
+    """
+    Reorders first-stage candidates by a logistic model over cheap features,
+    so only the best one or two need to go into the prompt.
+
+    Every feature comes from data the candidate stage already produced (ranks)
+    or from the BM25 postings (term coverage), so reranking 20 candidates is a
+    few small NumPy operations with no model inference.
+    """
+
+    def __init__(self, weights: list[float], bias: float):
+        if len(weights) != len(FEATURES):
+            raise ValueError(f"Expected {len(FEATURES)} reranker weights, got {len(weights)}")
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+
+    @classmethod
+    def from_file(cls, path: str | None = None):
+        """Weights saved by benchmarks/train_reranker.py, or the built-in ones"""
+        if not path:
+            return cls(DEFAULT_WEIGHTS["weights"], DEFAULT_WEIGHTS["bias"])
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("features") and list(data["features"]) != list(FEATURES):
+            raise ValueError(f"Reranker weights in '{path}' are for features {data['features']}")
+        return cls(data["weights"], data["bias"])
+
+    def to_dict(self) -> dict:
+        return {"features": list(FEATURES), "weights": self.weights.round(4).tolist(), "bias": round(self.bias, 4)}
+
+    @staticmethod
+    def features(query_text: str, docs: list[dict], lexical_index) -> np.ndarray:
+        """One row of FEATURES per candidate"""
+        matrix = np.zeros((len(docs), len(FEATURES)), dtype=np.float64)
+        if not docs:
+            return matrix
+        for row, doc in enumerate(docs):
+            if doc.get("vector_rank") is not None:
+                matrix[row, 0] = 1.0 / (1 + doc["vector_rank"])
+            if doc.get("lexical_rank") is not None:
+                matrix[row, 1] = 1.0 / (1 + doc["lexical_rank"])
+
+        terms = list(dict.fromkeys(tokenize(query_text)))
+        if terms and lexical_index is not None:
+            idf = np.array([lexical_index.idf(term) for term in terms])
+            total = idf.sum()
+            matches = lexical_index.term_matches(terms, [doc["id"] for doc in docs])
+            matrix[:, 2] = matches @ idf / total
+            for row, doc in enumerate(docs):
+                in_header = header_terms(doc["metadata"].get("article_header", ""))
+                matrix[row, 3] = sum(weight for term, weight in zip(terms, idf) if term in in_header) / total
+
+        references = extract_article_references(query_text)
+        if references:
+            for row, doc in enumerate(docs):
+                matrix[row, 4] = 1.0 if doc["metadata"].get("article_number") in references else 0.0
+        return matrix
+
+    def scores(self, feature_matrix: np.ndarray) -> np.ndarray:
+        """Probability that each candidate is relevant"""
+        return 1.0 / (1.0 + np.exp(-(feature_matrix @ self.weights + self.bias)))
+
+    def rerank(self, query_text: str, docs: list[dict], lexical_index) -> list[dict]:
+        """Candidates sorted by reranker score (stable, so ties keep their first-stage order)"""
+        if not docs:
+            return docs
+        probabilities = self.scores(self.features(query_text, docs, lexical_index))
+        reranked = []
+        for position in np.argsort(-probabilities, kind="stable"):
+            doc = dict(docs[position])
+            doc["rerank_score"] = round(float(probabilities[position]), 4)
+            reranked.append(doc)
+        return reranked
+
+
+def select_documents(docs: list[dict], max_documents: int, min_score: float) -> list[dict]:
+    """The best document, plus the next ones while they score at least min_score"""
+    return [
+        doc for position, doc in enumerate(docs[:max_documents])
+        if position == 0 or doc.get("rerank_score", 1.0) >= min_score
+    ]
+
+
+def fit_logistic(feature_matrix: np.ndarray, labels: np.ndarray, l2: float = 0.01,
+                 iterations: int = 50) -> tuple[np.ndarray, float]:
+    """Weights and bias of an L2-regularized logistic regression, by Newton's method"""
+    x = np.hstack([feature_matrix, np.ones((len(feature_matrix), 1))])
+    theta = np.zeros(x.shape[1])
+    penalty = np.full(x.shape[1], l2)
+    penalty[-1] = 0.0  # the bias is not regularized
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-(x @ theta)))
+        gradient = x.T @ (p - labels) + penalty * theta
+        hessian = (x.T * (p * (1 - p))) @ x + np.diag(penalty) + 1e-9 * np.eye(x.shape[1])
+        step = np.linalg.solve(hessian, gradient)
+        theta -= step
+        if math.sqrt(float(step @ step)) < 1e-8:
+            break
+    return theta[:-1], float(theta[-1])
@@ -0,0 +1,269 @@
+import logging
+
+from context_packing import TRIM_MARKER, count_tokens
+from lexical_index import reciprocal_rank_fusion
+from reranker import select_documents
+from tracing import span
+from vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+
+class ChromaRetriever:
+    """Vector search through a Chroma collection"""
+
+    name = "chroma"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def search(self, query_embeddings: list[list[float]], top_k: int) -> list[list[dict]]:
+        results = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=top_k,
+            include=['documents', 'metadatas', 'distances']  # Ensure metadatas are included
+        )
+
+        batches = []
+        for q in range(len(query_embeddings)):
+            retrieved_docs = []
+            if results and results.get('documents') and results.get('metadatas'):
+                for i in range(len(results['documents'][q])):
+                    retrieved_docs.append({
+                        "id": results['ids'][q][i],
+                        "document": results['documents'][q][i],
+                        "metadata": results['metadatas'][q][i],
+                        # Collections use squared L2 distance; for unit vectors cosine = 1 - d/2
+                        "score": 1.0 - results['distances'][q][i] / 2.0
+                    })
+            batches.append(retrieved_docs)
+        return batches
+
+    def get(self, ids: list[str]) -> list[dict]:
+        results = self.collection.get(ids=ids, include=['documents', 'metadatas'])
+        by_id = {
+            doc_id: {"id": doc_id, "document": document, "metadata": metadata}
+            for doc_id, document, metadata in zip(results['ids'], results['documents'], results['metadatas'])
+        }
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+    def get_articles(self, article_numbers: list[str]) -> list[dict]:
+        """Every stored chunk of the given articles, in article then chunk order"""
+        results = self.collection.get(
+            where={"article_number": {"$in": article_numbers}},
+            include=['documents', 'metadatas']
+        )
+        docs = [
+            {"id": doc_id, "document": document, "metadata": metadata}
+            for doc_id, document, metadata in zip(results['ids'], results['documents'], results['metadatas'])
+        ]
+        return sort_by_article(docs, article_numbers)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+
+class NumpyRetriever:
+    """Exact vector search over an in-process VectorIndex (no Chroma involved)"""
+
+    name = "numpy"
+
+    def __init__(self, index: VectorIndex):
+        self.index = index
+        # Built on first use: it decodes every metadata record, which attaching should not wait for
+        self._article_positions = None
+
+    def article_positions(self) -> dict:
+        if self._article_positions is None:
+            article_positions = {}
+            for position, metadata in enumerate(self.index.metadatas):
+                article_positions.setdefault(metadata.get("article_number"), []).append(position)
+            self._article_positions = article_positions
+        return self._article_positions
+
+    def search(self, query_embeddings: list[list[float]], top_k: int) -> list[list[dict]]:
+        return self.index.search(query_embeddings, top_k)
+
+    def get(self, ids: list[str]) -> list[dict]:
+        return self.index.get(ids)
+
+    def get_articles(self, article_numbers: list[str]) -> list[dict]:
+        docs = [
+            self.index.record(position)
+            for article_number in article_numbers
+            for position in self.article_positions().get(article_number, ())
+        ]
+        return sort_by_article(docs, article_numbers)
+
+    def count(self) -> int:
+        return self.index.count()
+
+
+def sort_by_article(docs: list[dict], article_numbers: list[str]) -> list[dict]:
+    order = {article_number: i for i, article_number in enumerate(article_numbers)}
+    return sorted(docs, key=lambda doc: (
+        order.get(doc['metadata'].get('article_number'), len(order)),
+        doc['metadata'].get('source', ''),
+        doc['metadata'].get('chunk_index', 0)
+    ))
+
+
+def collapse_chunks(docs: list[dict], top_k: int) -> list[dict]:
+    """
+    Merge chunks of the same article into one document ranked by its best
+    chunk, keeping at most top_k articles. Chunks are joined in their original
+    order, with "[...]" marking paragraphs that were not retrieved.
+    """
+    groups = {}
+    for doc in docs:
+        metadata = doc['metadata']
+        key = (metadata.get('source', ''), metadata.get('article_number', doc['id']))
+        groups.setdefault(key, []).append(doc)
+
+    collapsed = []
+    for (source, article_number), chunks in list(groups.items())[:top_k]:
+        best = chunks[0]
+        if 'chunk_index' not in best['metadata']:
+            # Whole-article documents need no merging
+            collapsed.append(best)
+            continue
+
+        ordered = sorted(chunks, key=lambda doc: doc['metadata']['chunk_index'])
+        parts = []
+        chunk_tokens = []
+        previous_index = None
+        for chunk in ordered:
+            chunk_index = chunk['metadata']['chunk_index']
+            if chunk_index == previous_index:
+                continue
+            if (previous_index is None and chunk_index > 0) or \
+                    (previous_index is not None and chunk_index != previous_index + 1):
+                parts.append(TRIM_MARKER)
+            parts.append(chunk['document'])
+            chunk_tokens.append(chunk['metadata'].get('token_count'))
+            previous_index = chunk_index
+        if previous_index is not None and previous_index < best['metadata'].get('chunk_count', 1) - 1:
+            parts.append(TRIM_MARKER)
+
+        metadata = {
+            key: value for key, value in best['metadata'].items()
+            if key not in ('chunk_index', 'char_start', 'char_end', 'token_count')
+        }
+        metadata['chunk_indices'] = [chunk['metadata']['chunk_index'] for chunk in ordered]
+        if None not in chunk_tokens:
+            # Precomputed chunk counts plus the gap markers (one newline token per join)
+            metadata['token_count'] = sum(chunk_tokens) + \
+                parts.count(TRIM_MARKER) * count_tokens(TRIM_MARKER) + len(parts) - 1
+        article_doc = dict(best)
+        article_doc['id'] = f"{source}:{article_number}" if source else article_number
+        article_doc['document'] = "\n".join(parts)
+        article_doc['metadata'] = metadata
+        collapsed.append(article_doc)
+    return collapsed
+
+
+def fuse_results(vector_hits: list[dict], lexical_hits: list[tuple[str, float]], top_k: int,
+                 fetch, rrf_k: int = 60) -> list[dict]:
+    """
+    Combine vector hits (documents, best first) and lexical hits ((id, score)
+    pairs, best first) with reciprocal rank fusion. `fetch(ids)` loads the
+    documents that only the lexical side found.
+    """
+    fused = reciprocal_rank_fusion(
+        [[doc["id"] for doc in vector_hits], [doc_id for doc_id, _ in lexical_hits]],
+        k=rrf_k
+    )[:top_k]
+
+    documents = {doc["id"]: doc for doc in vector_hits}
+    missing = [doc_id for doc_id, _ in fused if doc_id not in documents]
+    if missing:
+        documents.update((doc["id"], doc) for doc in fetch(missing))
+
+    lexical_scores = dict(lexical_hits)
+    # Ranks in each input list, as features for the reranker
+    vector_ranks = {doc["id"]: rank for rank, doc in enumerate(vector_hits)}
+    lexical_ranks = {doc_id: rank for rank, (doc_id, _) in enumerate(lexical_hits)}
+    results = []
+    for doc_id, fusion_score in fused:
+        if doc_id not in documents:
+            continue
+        doc = dict(documents[doc_id])
+        doc["fusion_score"] = fusion_score
+        if doc_id in vector_ranks:
+            doc["vector_rank"] = vector_ranks[doc_id]
+        if doc_id in lexical_scores:
+            doc["lexical_score"] = lexical_scores[doc_id]
+            doc["lexical_rank"] = lexical_ranks[doc_id]
+        results.append(doc)
+    return results
+
+
+def retrieve_batch(active_retriever, lexical_index, embed_many, user_queries: list[str], top_k: int,
+                   mode: str = "hybrid", candidates: int = 10, rrf_k: int = 60,
+                   collapse: bool = True, chunk_overfetch: int = 3, reranker=None,
+                   rerank_candidates: int = 20, min_rerank_score: float = 0.0
+                   ) -> list[tuple[list[dict], list[float] | None]]:
+    """
+    Retrieve the top_k documents for each query. `mode` is "hybrid" (BM25 and
+    vector results fused with RRF, `candidates` deep each), "vector" or
+    "lexical". `embed_many` embeds a list of queries; in hybrid mode a failure
+    there falls back to the lexical results. With `collapse`, chunk_overfetch
+    times as many chunks are ranked and merged into top_k articles.
+
+    With a `reranker`, rerank_candidates chunks are fetched and reordered by
+    it before collapsing, and documents after the first are kept only if
+    they score at least min_rerank_score.
+
+    Returns (documents, query embedding) per query; the embedding is None when
+    only the lexical path ran.
+    """
+    depth = top_k * chunk_overfetch if collapse else top_k
+    if reranker:
+        depth = max(depth, rerank_candidates)
+    candidates = max(candidates, depth)
+
+    def finish(user_query: str, docs: list[dict]) -> list[dict]:
+        if reranker:
+            with span("rerank"):
+                docs = reranker.rerank(user_query, docs, lexical_index)
+        docs = collapse_chunks(docs, top_k) if collapse else docs[:top_k]
+        return select_documents(docs, top_k, min_rerank_score) if reranker else docs
+
+    lexical_hits = [[] for _ in user_queries]
+    if mode in ("hybrid", "lexical"):
+        with span("lexical"):
+            lexical_hits = [lexical_index.search(user_query, candidates) for user_query in user_queries]
+
+    def lexical_results():
+        return [
+            (finish(user_query, fuse_results([], hits, depth, active_retriever.get, rrf_k)), None)
+            for user_query, hits in zip(user_queries, lexical_hits)
+        ]
+
+    if mode == "lexical":
+        with span("retrieve"):
+            return lexical_results()
+
+    try:
+        with span("embed"):
+            query_embeddings = embed_many(user_queries)
+    except Exception as e:
+        if mode != "hybrid":
+            raise
+        logger.warning(f"Query embedding failed ({e}); falling back to lexical retrieval")
+        with span("retrieve"):
+            return lexical_results()
+
+    with span("retrieve"):
+        if mode != "hybrid":
+            vector_batches = active_retriever.search(query_embeddings, depth)
+            return [
+                (finish(user_query, [dict(doc, vector_rank=rank) for rank, doc in enumerate(docs)]), embedding)
+                for user_query, docs, embedding in zip(user_queries, vector_batches, query_embeddings)
+            ]
+        vector_batches = active_retriever.search(query_embeddings, candidates)
+        return [
+            (finish(user_query, fuse_results(vector_hits, hits, depth, active_retriever.get, rrf_k)), embedding)
+            for user_query, vector_hits, hits, embedding in zip(user_queries, vector_batches, lexical_hits,
+                                                                query_embeddings)
+        ]
@@ -0,0 +1,126 @@
+import json
+
+from article_lookup import extract_article_references
+from context_packing import count_tokens
+
+
+# Tiers are tried in order and the first whose conditions all hold is used; the
+# last one must have none. Conditions (all optional):
+#   max_query_tokens  the question is at most this long
+#   min_score_gap     the best source beats every other by at least this share of its score
+#                     (rerank, vector or BM25 score; see comparable_scores for hybrid results)
+#   max_articles      at most this many articles score within half of the best one
+#   max_references    the question names at most this many articles ("madde 344")
+# and each tier sets the sources it keeps (top_k), the answer length (max_tokens)
+# and the model: a model name, or "fast", "default" or "strong" for the configured ones.
+DEFAULT_POLICY = [
+    {"name": "simple", "max_query_tokens": 25, "min_score_gap": 0.3, "max_articles": 1, "max_references": 1,
+     "top_k": 1, "max_tokens": 400, "model": "fast"},
+    {"name": "standard", "max_query_tokens": 80, "max_articles": 2, "max_references": 2,
+     "top_k": 2, "max_tokens": 700, "model": "default"},
+    {"name": "complex", "top_k": 4, "max_tokens": 1200, "model": "strong"},
+]
+CONDITIONS = ("max_query_tokens", "min_score_gap", "max_articles", "max_references")
+# An article counts towards max_articles when it scores at least this share of the best one
+COMPETING_SCORE_SHARE = 0.5
+
+
+def relevance(doc: dict) -> float | None:
+    """The most informative score retrieval left on a document (reranker, vector or BM25)"""
+    for key in ("rerank_score", "score", "lexical_score"):
+        if doc.get(key) is not None:
+            return float(doc[key])
+    return None
+
+
+def is_fused(docs: list[dict]) -> bool:
+    return any("fusion_score" in doc and "rerank_score" not in doc for doc in docs)
+
+
+def comparable_scores(docs: list[dict]) -> list[float | None]:
+    """
+    Scores whose ratios mean something, one per document. Reciprocal rank
+    fusion scores do not (they sit within a few hundredths of each other), so
+    fused results are compared on their BM25 scores, 0 for documents only the
+    vector search found, or on their vector scores when BM25 matched none.
+    """
+    if is_fused(docs) and any(doc.get("lexical_score") for doc in docs):
+        return [float(doc.get("lexical_score") or 0.0) for doc in docs]
+    return [relevance(doc) for doc in docs]
+
+
+def query_signals(query_text: str, docs: list[dict]) -> dict:
+    """Cheap complexity signals of a question and its sources, most relevant first"""
+    scores = comparable_scores(docs)
+    if docs and None not in scores and scores[0] > 0:
+        best = scores[0]
+        score_gap = max(0.0, (best - max(scores[1:])) / best) if len(scores) > 1 else 1.0
+        if is_fused(docs) and any("vector_rank" in doc for doc in docs) and docs[0].get("vector_rank") != 0:
+            # The vector search put another source first: the best one does not stand out
+            score_gap = 0.0
+        competing = [doc for doc, score in zip(docs, scores) if score >= COMPETING_SCORE_SHARE * best]
+    else:
+        # Articles fetched by reference carry no scores: all of them are in play
+        score_gap = 1.0 if len(docs) <= 1 else 0.0
+        competing = docs
+    return {
+        "query_tokens": count_tokens(query_text),
+        "score_gap": round(score_gap, 4),
+        "articles": len({doc["metadata"].get("article_number", doc["id"]) for doc in competing}),
+        "references": len(extract_article_references(query_text))
+    }
+
+
+class RoutingPolicy:
+    """
+    Picks how much context, answer length and which model a question gets,
+    from a small table of tiers, so short definitional questions with one
+    clearly relevant article stop paying for the setup a multi-article
+    dispute needs.
+    """
+
+    def __init__(self, tiers: list[dict], models: dict[str, str]):
+        if not tiers:
+            raise ValueError("A routing policy needs at least one tier")
+        if any(condition in tiers[-1] for condition in CONDITIONS):
+            raise ValueError(f"The last routing tier ('{tiers[-1].get('name')}') must not have conditions")
+        for tier in tiers:
+            missing = [field for field in ("name", "top_k", "max_tokens", "model") if field not in tier]
+            if missing:
+                raise ValueError(f"Routing tier {tier.get('name', tier)} is missing {missing}")
+        self.tiers = tiers
+        self.models = models
+
+    @classmethod
+    def from_file(cls, path: str | None, models: dict[str, str]):
+        """Tiers from a JSON file (a list like DEFAULT_POLICY), or the built-in ones"""
+        if not path:
+            return cls(DEFAULT_POLICY, models)
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), models)
+
+    @property
+    def max_top_k(self) -> int:
+        """Sources to retrieve so that any tier can be served"""
+        return max(tier["top_k"] for tier in self.tiers)
+
+    @staticmethod
+    def matches(tier: dict, signals: dict) -> bool:
+        return (
+            signals["query_tokens"] <= tier.get("max_query_tokens", signals["query_tokens"])
+            and signals["score_gap"] >= tier.get("min_score_gap", 0.0)
+            and signals["articles"] <= tier.get("max_articles", signals["articles"])
+            and signals["references"] <= tier.get("max_references", signals["references"])
+        )
+
+    def route(self, query_text: str, docs: list[dict]) -> dict:
+        """The routing decision for a question and its sources (most relevant first)"""
+        signals = query_signals(query_text, docs)
+        tier = next(tier for tier in self.tiers if self.matches(tier, signals))
+        return {
+            "tier": tier["name"],
+            "top_k": tier["top_k"],
+            "max_tokens": tier["max_tokens"],
+            "model": self.models.get(tier["model"], tier["model"]),
+            "signals": signals
+        }
@@ -0,0 +1,235 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from context_packing import count_tokens, trim_to_budget
+from embedding_cache import turkish_casefold
+
+
+# Questions that lean on the previous turn ("peki işyeri için de geçerli mi?",
+# "bunun süresi ne kadar?") start with one of these words or contain one of the phrases
+FOLLOWUP_LEADING_WORDS = frozenset("""
+peki ya bu bunu bunun buna bunda bundan bunlar bunların şu şunu şunun o onu onun ona onda ondan
+aynı öyleyse ayrıca yani
+""".split())
+FOLLOWUP_PHRASES = ("de geçerli", "da geçerli", "bu durumda", "o durumda", "o zaman", "aynı durum", "yukarıdaki")
+# Tokens each folded turn may take in the rolling summary
+SUMMARY_LINE_TOKENS = 60
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def is_followup(query_text: str) -> bool:
+    """True when a question refers back to the conversation instead of standing on its own"""
+    text = " ".join(turkish_casefold(query_text).replace("?", " ").replace(",", " ").split())
+    if not text:
+        return False
+    return text.split(" ", 1)[0] in FOLLOWUP_LEADING_WORDS or any(phrase in text for phrase in FOLLOWUP_PHRASES)
+
+
+class MemorySessionStore:
+    """
+    Per-process session state, kept in last-use order: sessions idle for longer
+    than the TTL are dropped from the front in amortized O(1), and `max_sessions`
+    bounds memory outright.
+    """
+
+    def __init__(self, max_sessions: int = 10_000):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session id -> (state, last used), least recently used first
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str, now: float, ttl_seconds: float) -> dict | None:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if now - entry[1] > ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            return entry[0]
+
+    def save(self, session_id: str, state: dict, now: float, ttl_seconds: float):
+        with self._lock:
+            self._sessions[session_id] = (state, now)
+            self._sessions.move_to_end(session_id)
+            while self._sessions:
+                _, last_used = next(iter(self._sessions.values()))
+                if now - last_used <= ttl_seconds and len(self._sessions) <= self.max_sessions:
+                    break
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def size(self) -> int:
+        return len(self._sessions)
+
+    def close(self):
+        pass
+
+
+class SQLiteSessionStore:
+    """
+    Session state as JSON rows in SQLite, shared by every worker process on the
+    host, so a follow-up question may land on any worker. Expired sessions are
+    deleted every `evict_every` saves.
+    """
+
+    def __init__(self, db_path: str, evict_every: int = 500):
+        self.db_path = db_path
+        self.evict_every = evict_every
+        self._saves = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)")
+
+    def load(self, session_id: str, now: float, ttl_seconds: float) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM sessions WHERE id = ? AND updated_at >= ?", (session_id, now - ttl_seconds)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id: str, state: dict, now: float, ttl_seconds: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (id, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (session_id, json.dumps(state, ensure_ascii=False), now)
+            )
+            self._saves += 1
+            if self._saves % self.evict_every == 0:
+                self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - ttl_seconds,))
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ConversationMemory:
+    """
+    Bounded conversation history per session.
+
+    The last `recent_turns` turns are kept nearly verbatim (each trimmed to an
+    equal share of the budget the summary leaves); older turns are folded into
+    a rolling summary of one short line per turn, oldest lines dropped first.
+    History in a prompt therefore never exceeds `history_token_budget` tokens,
+    however long the conversation gets. Compaction is extractive (no LLM call),
+    and token counts are computed once when a turn is recorded.
+
+    A session also remembers the articles its last answer was built from, so
+    a follow-up question can reuse them instead of being retrieved again.
+    """
+
+    def __init__(self, store, ttl_seconds: float = 1800, recent_turns: int = 3,
+                 history_token_budget: int = 600, summary_token_budget: int = 200):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.recent_turns = max(1, recent_turns)
+        self.history_token_budget = history_token_budget
+        self.summary_token_budget = min(summary_token_budget, history_token_budget)
+        # A few tokens are kept back for the "Özet:" label and the separators
+        self.turn_token_budget = max(1, (history_token_budget - self.summary_token_budget - 10) // self.recent_turns)
+        self.created = 0
+        self.resumed = 0
+        self.expired = 0
+
+    @staticmethod
+    def empty_state() -> dict:
+        return {"summary": [], "turns": [], "articles": []}
+
+    def load(self, session_id: str | None) -> tuple[str, dict]:
+        """The session's state; an unknown or expired session id starts a new session"""
+        if session_id:
+            state = self.store.load(session_id, time.time(), self.ttl_seconds)
+            if state is not None:
+                self.resumed += 1
+                return session_id, state
+            self.expired += 1
+        self.created += 1
+        return new_session_id(), self.empty_state()
+
+    def record_turn(self, session_id: str, question: str, answer: str, article_numbers: list[str]):
+        """Append a turn and compact; re-reads the session so concurrent turns are not lost"""
+        now = time.time()
+        state = self.store.load(session_id, now, self.ttl_seconds) or self.empty_state()
+        state["turns"].append(self._compact_turn(question, answer, article_numbers))
+        while len(state["turns"]) > self.recent_turns:
+            state["summary"].append(self._summary_line(state["turns"].pop(0)))
+        while state["summary"] and sum(tokens for _, tokens in state["summary"]) > self.summary_token_budget:
+            state["summary"].pop(0)
+        if article_numbers:
+            state["articles"] = list(article_numbers)
+        self.store.save(session_id, state, now, self.ttl_seconds)
+
+    def _compact_turn(self, question: str, answer: str, article_numbers: list[str]) -> dict:
+        question = " ".join(question.split())
+        if count_tokens(question) > self.turn_token_budget // 2:
+            question = trim_to_budget(question, self.turn_token_budget // 2)
+        text = f"Kullanıcı: {question}\nAsistan: {' '.join(answer.split())}"
+        tokens = count_tokens(text)
+        if tokens > self.turn_token_budget:
+            text = trim_to_budget(text, self.turn_token_budget)
+            tokens = count_tokens(text)
+        return {"question": question, "text": text, "tokens": tokens, "articles": list(article_numbers)}
+
+    @staticmethod
+    def _summary_line(turn: dict) -> tuple[str, int]:
+        question = turn["question"]
+        if count_tokens(question) > SUMMARY_LINE_TOKENS // 2:
+            question = trim_to_budget(question, SUMMARY_LINE_TOKENS // 2)
+        answer = turn["text"].split("\nAsistan: ", 1)[-1]
+        sources = f" [{', '.join(turn['articles'])}]" if turn["articles"] else ""
+        line = f"- {question}{sources} → {answer}"
+        tokens = count_tokens(line)
+        if tokens > SUMMARY_LINE_TOKENS:
+            line = trim_to_budget(line, SUMMARY_LINE_TOKENS)
+            tokens = count_tokens(line)
+        return line, tokens
+
+    def history(self, state: dict) -> str:
+        """Summary and recent turns as prompt text, "" for a new session"""
+        parts = []
+        if state["summary"]:
+            parts.append("Özet:\n" + "\n".join(line for line, _ in state["summary"]))
+        if state["turns"]:
+            parts.append("\n\n".join(turn["text"] for turn in state["turns"]))
+        return "\n\n".join(parts)
+
+    def reusable_articles(self, state: dict, query_text: str) -> list[str]:
+        """Articles of the previous answer when the question is a follow-up to it"""
+        return state["articles"] if state["articles"] and is_followup(query_text) else []
+
+    def delete(self, session_id: str):
+        self.store.delete(session_id)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": self.store.size(),
+            "ttl_seconds": self.ttl_seconds,
+            "recent_turns": self.recent_turns,
+            "history_token_budget": self.history_token_budget,
+            "created": self.created,
+            "resumed": self.resumed,
+            "expired": self.expired
+        }
@@ -0,0 +1,133 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one in-progress computation: the
+    first caller starts it, later ones await the same task, and the key is
+    released as soon as it finishes (results are not cached here).
+
+    The shared task is shielded, so one caller going away does not cancel the
+    work the others are waiting for. Only touched from the event loop.
+    """
+
+    def __init__(self):
+        self._in_flight = {}  # key -> asyncio.Task
+        self.started = 0
+        self.joined = 0
+
+    async def run(self, key, compute) -> tuple[object, bool]:
+        """Result of `compute()` (a coroutine function), and whether it was shared with an earlier caller"""
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.joined += 1
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(compute())
+        self._in_flight[key] = task
+        self.started += 1
+        task.add_done_callback(lambda _: self._release(key, task))
+        return await asyncio.shield(task), False
+
+    def _release(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._in_flight), "started": self.started, "joined": self.joined}
+
+
+class _Broadcast:
+    """Items produced once, replayed to every subscriber from the start"""
+
+    def __init__(self):
+        self.items = []
+        self.finished = False
+        self.subscribers = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def publish(self, item):
+        self.items.append(item)
+        self._notify()
+
+    def finish(self):
+        self.finished = True
+        self._notify()
+
+    def _notify(self):
+        # Waiters hold the old event; a fresh one is armed for the next change
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self):
+        position = 0
+        while True:
+            while position < len(self.items):
+                yield self.items[position]
+                position += 1
+            if self.finished:
+                return
+            await self._changed.wait()
+
+
+class StreamingSingleFlight:
+    """
+    Single-flight for async generators: concurrent subscribers with the same
+    key share one producer, and each receives every item it yields, including
+    the ones produced before it subscribed.
+
+    The producer runs in its own task, so it keeps going when the subscriber
+    that started it disconnects; it is cancelled only when every subscriber
+    has gone. Its key is released at that moment, so a subscriber arriving
+    while the cancellation unwinds starts a fresh producer instead of joining
+    the dying one. A producer must not raise: report failures as items. If it
+    is cancelled anyway, `cancelled_item` (when given) is published last, so
+    any subscriber still reading ends on it instead of a truncated stream.
+    """
+
+    def __init__(self, cancelled_item=None):
+        self.cancelled_item = cancelled_item
+        self._in_flight = {}  # key -> _Broadcast
+        self.started = 0
+        self.joined = 0
+
+    async def subscribe(self, key, produce):
+        """Items of `produce()` (an async generator function), shared with identical in-flight subscriptions"""
+        broadcast = self._in_flight.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._in_flight[key] = broadcast
+            broadcast.task = asyncio.ensure_future(self._produce(key, broadcast, produce))
+            self.started += 1
+        else:
+            self.joined += 1
+
+        broadcast.subscribers += 1
+        try:
+            async for item in broadcast.subscribe():
+                yield item
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.finished:
+                self._release(key, broadcast)
+                broadcast.task.cancel()
+
+    async def _produce(self, key, broadcast: _Broadcast, produce):
+        try:
+            async for item in produce():
+                broadcast.publish(item)
+        except asyncio.CancelledError:
+            if self.cancelled_item is not None:
+                broadcast.publish(self.cancelled_item)
+            raise
+        finally:
+            self._release(key, broadcast)
+            broadcast.finish()
+
+    def _release(self, key, broadcast: _Broadcast):
+        if self._in_flight.get(key) is broadcast:
+            del self._in_flight[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._in_flight), "started": self.started, "joined": self.joined}
@@ -0,0 +1,38 @@
+from answer_cache import SemanticAnswerCache
+
+
+def test_similar_question_with_same_sources_hits():
+    cache = SemanticAnswerCache(similarity_threshold=0.95)
+    cache.store([1.0, 0.0], ["m344"], "cevap")
+    assert cache.lookup([0.99, 0.05], ["m344"]) == "cevap"
+
+
+def test_different_sources_or_dissimilar_question_miss():
+    cache = SemanticAnswerCache(similarity_threshold=0.95)
+    cache.store([1.0, 0.0], ["m344"], "cevap")
+    assert cache.lookup([1.0, 0.0], ["m344", "m347"]) is None
+    assert cache.lookup([0.0, 1.0], ["m344"]) is None
+
+
+def test_answers_are_not_shared_between_variants():
+    cache = SemanticAnswerCache()
+    cache.store([1.0, 0.0], ["m344"], "kısa", variant=("simple", "fast", 400))
+    assert cache.lookup([1.0, 0.0], ["m344"], ("complex", "strong", 1200)) is None
+    assert cache.lookup([1.0, 0.0], ["m344"], ("simple", "fast", 400)) == "kısa"
+
+
+def test_version_change_clears_entries():
+    cache = SemanticAnswerCache()
+    cache.ensure_version("v1")
+    cache.store([1.0, 0.0], ["m344"], "cevap")
+    cache.ensure_version("v2")
+    assert cache.lookup([1.0, 0.0], ["m344"]) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_oldest_entries_are_evicted():
+    cache = SemanticAnswerCache(max_entries=2)
+    for i in range(3):
+        cache.store([1.0, 0.0], [f"m{i}"], str(i))
+    assert cache.lookup([1.0, 0.0], ["m0"]) is None
+    assert cache.lookup([1.0, 0.0], ["m2"]) == "2"
@@ -0,0 +1,32 @@
+import pytest
+
+from article_lookup import extract_article_references, format_extractive_answer
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Madde 344 ne diyor?", ["MADDE 344"]),
+    ("TBK m. 347 ve md. 350", ["MADDE 347", "MADDE 350"]),
+    ("344. madde nedir", ["MADDE 344"]),
+    ("344 üncü maddesi", ["MADDE 344"]),
+    ("344'üncü madde", ["MADDE 344"]),
+    ("TBK 344 ve 344. madde", ["MADDE 344"]),
+])
+def test_references_are_extracted_in_order(query, expected):
+    assert extract_article_references(query) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "Kira sözleşmesinde 3 madde var mı?",
+    "Kaç madde var?",
+    "10 maddede düzenlenmiş mi?",
+    "Depozito en fazla kaç aylık olabilir?",
+])
+def test_counts_and_plain_questions_are_not_references(query):
+    assert extract_article_references(query) == []
+
+
+def test_extractive_answer_quotes_articles_with_headers():
+    answer = format_extractive_answer([
+        {"document": "Metin", "metadata": {"article_number": "MADDE 344", "article_header": "Kira bedeli"}}
+    ])
+    assert answer == "**MADDE 344 - Kira bedeli**\n\nMetin"
@@ -0,0 +1,82 @@
+from context_packing import TRIM_MARKER
+from legal_parser import chunk_article
+from retrieval import collapse_chunks
+
+FIRST = "Tarafların yenilenen kira dönemlerinde uygulanacak kira bedeline ilişkin anlaşmaları,\n" \
+        "tüketici fiyat endeksindeki değişim oranını geçmemek koşuluyla geçerlidir."
+SECOND = "Taraflarca bu konuda bir anlaşma yapılmamışsa, kira bedeli hâkim tarafından,\n" \
+         "kiralananın durumu göz önüne alınarak hakkaniyete göre belirlenir."
+THIRD = "Beş yıldan uzun süreli kira sözleşmelerinde kira bedeli, emsal kira bedelleri\n" \
+        "göz önünde tutularak hâkim tarafından belirlenir."
+ARTICLE = "\n".join([FIRST, SECOND, THIRD])
+
+
+def test_each_fikra_becomes_a_chunk_with_its_offsets():
+    chunks = chunk_article(ARTICLE, min_chunk_chars=50)
+    assert [chunk["text"] for chunk in chunks] == [FIRST, SECOND, THIRD]
+    for chunk in chunks:
+        assert ARTICLE[chunk["char_start"]:chunk["char_end"]].strip() == chunk["text"]
+
+
+def test_enumerated_items_start_a_new_chunk():
+    text = "Kiracı şu hâllerde sözleşmeyi feshedebilir:\na) Kiralanan teslim edilmezse.\nb) Ayıp giderilmezse."
+    chunks = chunk_article(text, min_chunk_chars=1)
+    assert [chunk["text"] for chunk in chunks] == [
+        "Kiracı şu hâllerde sözleşmeyi feshedebilir:", "a) Kiralanan teslim edilmezse.", "b) Ayıp giderilmezse."]
+
+
+def test_an_article_without_paragraph_breaks_is_one_chunk():
+    # A line ending mid-sentence ("kira\nbedeli") is not a fıkra break
+    text = "Kiracı kira\nbedelini her ay ödemekle yükümlüdür"
+    assert chunk_article(text) == [{"text": text, "char_start": 0, "char_end": len(text)}]
+
+
+def test_short_paragraphs_are_merged_into_their_neighbours():
+    # The first fıkra is long enough on its own; the second is short, so the third joins it
+    chunks = chunk_article(ARTICLE, min_chunk_chars=150)
+    assert [chunk["text"] for chunk in chunks] == [FIRST, f"{SECOND}\n{THIRD}"]
+    assert chunks[-1]["char_end"] == len(ARTICLE)
+
+
+def test_a_short_last_paragraph_joins_the_previous_chunk():
+    chunks = chunk_article(ARTICLE, min_chunk_chars=170)
+    assert [chunk["text"] for chunk in chunks] == [ARTICLE]
+
+
+def chunk_documents(article_number: str, texts: list[str]) -> list[dict]:
+    return [{
+        "id": f"kanun:{article_number}#{index}",
+        "document": text,
+        "metadata": {"source": "kanun", "article_number": article_number, "article_header": "Kira bedeli",
+                     "chunk_index": index, "chunk_count": len(texts), "char_start": 0, "char_end": len(text),
+                     "token_count": 10},
+        "score": 1.0 - index / 10
+    } for index, text in enumerate(texts)]
+
+
+def test_collapsing_every_chunk_restores_the_article():
+    chunks = chunk_documents("MADDE 344", [chunk["text"] for chunk in chunk_article(ARTICLE, min_chunk_chars=50)])
+    [article] = collapse_chunks(list(reversed(chunks)), top_k=3)
+    assert article["id"] == "kanun:MADDE 344"
+    assert article["document"] == "\n".join([FIRST, SECOND, THIRD])
+    assert article["metadata"]["chunk_indices"] == [0, 1, 2]
+    assert "chunk_index" not in article["metadata"]
+    assert article["score"] == chunks[2]["score"]  # ranked by its best (first retrieved) chunk
+
+
+def test_missing_paragraphs_are_marked():
+    chunks = chunk_documents("MADDE 344", [FIRST, SECOND, THIRD])
+    [article] = collapse_chunks([chunks[2], chunks[0]], top_k=3)
+    assert article["document"] == "\n".join([FIRST, TRIM_MARKER, THIRD])
+    [article] = collapse_chunks([chunks[1]], top_k=3)
+    assert article["document"] == "\n".join([TRIM_MARKER, SECOND, TRIM_MARKER])
+
+
+def test_articles_keep_the_order_of_their_best_chunk_and_top_k():
+    first = chunk_documents("MADDE 344", [FIRST, SECOND])
+    second = chunk_documents("MADDE 345", [THIRD])
+    whole = {"id": "MADDE 350", "document": "Bütün madde.", "metadata": {"article_number": "MADDE 350"}}
+    collapsed = collapse_chunks([second[0], first[1], whole, first[0]], top_k=3)
+    assert [doc["id"] for doc in collapsed] == ["kanun:MADDE 345", "kanun:MADDE 344", "MADDE 350"]
+    assert collapsed[2] is whole
+    assert len(collapse_chunks([second[0], first[1], whole], top_k=2)) == 2
@@ -0,0 +1,64 @@
+from context_packing import TRIM_MARKER, count_tokens, pack_context, trim_to_budget
+
+SENTENCES = "Kiracı kira bedelini ödemekle yükümlüdür. Kiraya veren kiralananı teslim eder. " \
+            "Güvence bedeli üç aylık kirayı aşamaz. Kira artışı tüketici fiyat endeksini geçemez."
+
+
+def header(position: int, doc: dict) -> str:
+    return f"[{position + 1}] {doc['id']}:\n"
+
+
+def doc(doc_id: str, text: str, **metadata) -> dict:
+    return {"id": doc_id, "document": text, "metadata": {"article_number": doc_id, **metadata}}
+
+
+def test_trim_cuts_at_a_sentence_boundary_within_the_budget():
+    budget = count_tokens(SENTENCES) // 2
+    trimmed = trim_to_budget(SENTENCES, budget)
+    assert trimmed.endswith(f". {TRIM_MARKER}")
+    assert SENTENCES.startswith(trimmed[:-len(TRIM_MARKER) - 1])
+    assert count_tokens(trimmed) <= budget
+
+
+def test_trim_falls_back_to_words_for_a_single_long_sentence():
+    sentence = " ".join(["kiralanan"] * 50)
+    trimmed = trim_to_budget(sentence, 20)
+    assert trimmed.endswith(f"kiralanan {TRIM_MARKER}")
+    assert count_tokens(trimmed) <= 20
+
+
+def test_trim_returns_nothing_when_not_even_the_marker_fits():
+    assert trim_to_budget(SENTENCES, 1) == ""
+
+
+def test_documents_are_packed_in_order_until_the_budget_is_spent():
+    docs = [doc("344", SENTENCES), doc("345", SENTENCES.upper()), doc("347", SENTENCES.lower())]
+    one_document = count_tokens(header(0, docs[0])) + count_tokens(SENTENCES)
+    packed = pack_context(docs, one_document * 2, header, min_trim_tokens=1000)
+    assert [position for position, _ in packed] == [0, 1]
+
+
+def test_the_first_document_that_does_not_fit_is_trimmed():
+    docs = [doc("344", SENTENCES), doc("345", SENTENCES.upper())]
+    budget = count_tokens(header(0, docs[0])) + count_tokens(SENTENCES) + count_tokens(SENTENCES) // 2
+    packed = pack_context(docs, budget, header, min_trim_tokens=5)
+    assert [position for position, _ in packed] == [0, 1]
+    assert packed[1][1]["document"].endswith(TRIM_MARKER)
+    assert docs[1]["document"] == SENTENCES.upper()  # the caller's document is not modified
+
+
+def test_the_most_relevant_document_is_always_sent():
+    packed = pack_context([doc("344", SENTENCES)], 5, header, min_trim_tokens=20)
+    assert len(packed) == 1
+    assert packed[0][1]["document"].endswith(TRIM_MARKER)
+
+
+def test_chunks_and_texts_already_included_are_skipped():
+    docs = [
+        doc("344", SENTENCES, chunk_indices=[0, 1]),
+        doc("344", "Ayrı bir parça.", chunk_index=1),
+        doc("345", SENTENCES),
+        doc("347", "Başka bir madde.")
+    ]
+    packed = pack_context(docs, 10_000, header)
+    assert [position for position, _ in packed] == [0, 3]
@@ -0,0 +1,35 @@
+from embedding_cache import CachedQueryEmbedder, EmbeddingCache, normalize_query, turkish_casefold
+
+
+class RecordingProvider:
+    def __init__(self):
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_turkish_casefold_handles_dotted_and_dotless_i():
+    assert turkish_casefold("KIRA İADESİ") == "kıra iadesi"
+
+
+def test_normalize_query_drops_punctuation_case_and_spacing():
+    assert normalize_query("  Kira   ARTIŞI? ") == normalize_query("kira artışı")
+
+
+def test_provider_receives_original_text_not_the_cache_key():
+    provider = RecordingProvider()
+    embedder = CachedQueryEmbedder(provider, EmbeddingCache("test"))
+    embedder.embed_many(["Kira ARTIŞI nasıl hesaplanır?"])
+    assert provider.calls == [["Kira ARTIŞI nasıl hesaplanır?"]]
+
+
+def test_variants_sharing_a_key_are_embedded_once():
+    provider = RecordingProvider()
+    embedder = CachedQueryEmbedder(provider, EmbeddingCache("test"))
+    first, second = embedder.embed_many(["Kira artışı?", "kira ARTIŞI"])
+    assert first == second
+    assert provider.calls == [["Kira artışı?"]]
+    embedder("KİRA artışı!")
+    assert len(provider.calls) == 1
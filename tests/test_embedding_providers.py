@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from embedding_providers import EmbeddingProvider, LocalEmbeddingProvider, matches_configuration
+
+CORPUS = [
+    "Kiracı kira bedelini her ay ödemekle yükümlüdür.",
+    "Kiraya veren güvence olarak en fazla üç aylık kira bedeli isteyebilir.",
+    "Konut kiralarında kira artışı tüketici fiyat endeksini aşamaz.",
+    "Kiracı, kiralananı özenle kullanmak zorundadır.",
+]
+
+
+def test_incomplete_provider_fails_when_created():
+    class NoEmbed(EmbeddingProvider):
+        identity = "incomplete"
+
+    with pytest.raises(TypeError):
+        NoEmbed()
+
+
+def test_local_provider_gives_unit_vectors_and_a_stable_identity(tmp_path):
+    provider = LocalEmbeddingProvider.fit(CORPUS, dimension=3)
+    vectors = np.array(provider.embed(["kira artışı", "güvence bedeli"]))
+    assert vectors.shape == (2, 3)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+
+    provider.save(str(tmp_path))
+    reloaded = LocalEmbeddingProvider.load(str(tmp_path))
+    assert reloaded.identity == provider.identity
+    assert np.allclose(reloaded.embed(["kira artışı"]), provider.embed(["kira artışı"]), atol=1e-6)
+
+
+def test_configuration_match_distinguishes_providers():
+    provider = LocalEmbeddingProvider.fit(CORPUS, dimension=3)
+    assert matches_configuration(provider.identity, "local", "text-embedding-ada-002")
+    assert not matches_configuration(provider.identity, "openai", "text-embedding-ada-002")
+    assert matches_configuration("text-embedding-ada-002", "openai", "text-embedding-ada-002")
@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+
+from index_artifact import (MANIFEST_FILE, artifact_version, current_version, list_versions, prune_versions,
+                            set_current_version)
+
+
+def write_version(root, version: str, created_at: float):
+    os.makedirs(root / version)
+    with open(root / version / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "created_at": created_at, "documents": {"344": "hash"}}, f)
+
+
+@pytest.fixture
+def root(tmp_path):
+    for age, version in enumerate(["v4", "v3", "v2", "v1"]):
+        write_version(tmp_path, version, created_at=100.0 - age)
+    os.makedirs(tmp_path / "scratch")  # a build without a manifest yet
+    return tmp_path
+
+
+def test_versions_are_listed_newest_first_without_document_hashes(root):
+    versions = list_versions(str(root))
+    assert [manifest["version"] for manifest in versions] == ["v4", "v3", "v2", "v1"]
+    assert all("documents" not in manifest for manifest in versions)
+
+
+def test_current_is_replaced_atomically_and_only_with_a_complete_version(root):
+    assert current_version(str(root)) is None
+    set_current_version(str(root), "v3")
+    assert current_version(str(root)) == "v3"
+    with pytest.raises(FileNotFoundError):
+        set_current_version(str(root), "scratch")
+    assert current_version(str(root)) == "v3"
+    assert not os.path.exists(root / "CURRENT.tmp")
+
+
+def test_pruning_keeps_the_newest_the_current_and_protected_versions(root):
+    set_current_version(str(root), "v1")
+    removed = prune_versions(str(root), keep=3, protect=["v3"])
+    assert sorted(removed) == ["v2"]
+    assert [manifest["version"] for manifest in list_versions(str(root))] == ["v4", "v3", "v1"]
+    assert os.path.isdir(root / "scratch")
+
+
+def test_pruning_never_removes_the_current_version(root):
+    set_current_version(str(root), "v2")
+    prune_versions(str(root), keep=1)
+    assert [manifest["version"] for manifest in list_versions(str(root))] == ["v2"]
+
+
+def test_versions_are_deterministic():
+    assert artifact_version({"a": "1", "b": "2"}, "openai:ada") == artifact_version({"b": "2", "a": "1"}, "openai:ada")
+    assert artifact_version({"a": "1"}, "openai:ada") != artifact_version({"a": "1"}, "local:256")
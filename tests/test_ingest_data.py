@@ -0,0 +1,108 @@
+import numpy as np
+
+import ingest_data
+from embedding_providers import EmbeddingProvider
+from index_artifact import current_version, list_versions
+from ingest_data import build_index_artifact, content_hash, plan_changes
+
+
+def digests(**texts) -> dict:
+    return {doc_id: content_hash(doc_id, text, {"article_number": doc_id}, "openai:ada") for doc_id, text in texts.items()}
+
+
+def test_nothing_to_do_for_an_unchanged_corpus():
+    hashes = digests(a="A", b="B")
+    assert plan_changes(hashes, dict(hashes), {"a", "b"}) == ([], [])
+
+
+def test_added_documents_are_embedded():
+    manifest = digests(a="A")
+    hashes = digests(a="A", b="B")
+    assert plan_changes(hashes, manifest, {"a"}) == (["b"], [])
+
+
+def test_changed_documents_are_embedded_again():
+    manifest = digests(a="A", b="B")
+    hashes = digests(a="A", b="B, amended")
+    assert plan_changes(hashes, manifest, {"a", "b"}) == (["b"], [])
+
+
+def test_removed_documents_are_deleted_in_order():
+    manifest = digests(a="A", b="B", c="C")
+    hashes = digests(b="B")
+    assert plan_changes(hashes, manifest, {"a", "b", "c"}) == ([], ["a", "c"])
+
+
+def test_documents_missing_from_the_index_are_embedded_even_if_hashed():
+    # e.g. an interrupted build recorded the hash but never stored the vector
+    hashes = digests(a="A", b="B")
+    assert plan_changes(hashes, dict(hashes), {"a"}) == (["b"], [])
+
+
+def test_everything_is_embedded_without_a_previous_index():
+    hashes = digests(a="A", b="B")
+    assert plan_changes(hashes, {}, set()) == (["a", "b"], [])
+
+
+def test_the_hash_covers_header_and_embedding_provider():
+    base = content_hash("a", "A", {"article_number": "1", "article_header": "Kira"}, "openai:ada")
+    assert base != content_hash("a", "A", {"article_number": "1", "article_header": "Kira bedeli"}, "openai:ada")
+    assert base != content_hash("a", "A", {"article_number": "1", "article_header": "Kira"}, "local:256")
+    assert base == content_hash("a", "A", {"article_number": "1", "article_header": "Kira", "chunk_count": 3},
+                                "openai:ada")
+
+
+class CountingProvider(EmbeddingProvider):
+    """Deterministic two-dimensional embeddings that count how many texts were embedded"""
+
+    model_name = "counting"
+
+    def __init__(self, offset: float = 0.0):
+        self.offset = offset
+        self.embedded = 0
+
+    @property
+    def identity(self) -> str:
+        return "counting"
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        self.embedded += len(texts)
+        return [[len(text) + self.offset, 1.0] for text in texts]
+
+
+def build(provider, full_rebuild=False, texts=("Kira bedeli.", "Tahliye taahhüdü yazılı olmalıdır.")):
+    ids = [f"kanun:MADDE {number}#0" for number in range(len(texts))]
+    metadatas = [{"article_number": f"MADDE {number}"} for number in range(len(texts))]
+    hashes = {doc_id: content_hash(doc_id, text, metadata, provider.identity)
+              for doc_id, text, metadata in zip(ids, texts, metadatas)}
+    return build_index_artifact(list(texts), metadatas, ids, hashes, provider, full_rebuild=full_rebuild)
+
+
+def test_an_unchanged_corpus_is_not_embedded_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_data, "INDEX_PATH", str(tmp_path))
+    first, _ = build(CountingProvider())
+    provider = CountingProvider()
+    artifact, written = build(provider)
+    assert (artifact.version, written, provider.embedded) == (first.version, False, 0)
+
+
+def test_a_full_rebuild_writes_and_serves_the_new_vectors(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_data, "INDEX_PATH", str(tmp_path))
+    first, _ = build(CountingProvider())
+    provider = CountingProvider(offset=5.0)  # e.g. the remote model changed behind the same name
+    rebuilt, written = build(provider, full_rebuild=True)
+    assert written and provider.embedded == 2
+    assert rebuilt.version != first.version
+    assert current_version(str(tmp_path)) == rebuilt.version
+    assert len(list_versions(str(tmp_path))) == 2
+    on_disk = np.load(tmp_path / rebuilt.version / "embeddings.npy")
+    assert not np.allclose(on_disk, np.asarray(first.vector_index.embeddings))
+    np.testing.assert_allclose(on_disk[0] / np.linalg.norm(on_disk[0]), on_disk[0], rtol=1e-6)
+
+
+def test_every_full_rebuild_gets_its_own_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_data, "INDEX_PATH", str(tmp_path))
+    first, _ = build(CountingProvider(), full_rebuild=True)
+    second, written = build(CountingProvider(), full_rebuild=True)
+    assert written and second.version != first.version
+    assert second.manifest["build_id"] != first.manifest["build_id"]
@@ -0,0 +1,49 @@
+import pytest
+
+from benchmarks.bench_legal_parser import SOURCE_FILE, build_corpus, legacy_parse_legal_text
+from legal_parser import iter_legal_articles, parse_legal_text
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    """The bundled source repeated with renumbered articles, a little over 1 MB"""
+    path = tmp_path_factory.mktemp("corpus") / "corpus.txt"
+    build_corpus(str(path), 1)
+    return str(path)
+
+
+def test_the_bundled_source_parses_like_the_legacy_parser():
+    articles = parse_legal_text(SOURCE_FILE)
+    assert articles
+    assert articles == legacy_parse_legal_text(SOURCE_FILE)
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+@pytest.mark.parametrize("block_size", [7, 4096, 1 << 20])
+def test_streaming_matches_the_legacy_parser_at_any_block_size(corpus, use_mmap, block_size):
+    # Small blocks split MADDE lines, headers and multi-byte characters across reads
+    streamed = list(iter_legal_articles(corpus, use_mmap=use_mmap, include_offsets=False, block_size=block_size))
+    assert streamed == legacy_parse_legal_text(corpus)
+
+
+def test_windows_line_endings_parse_the_same(tmp_path):
+    with open(SOURCE_FILE, "r", encoding="utf-8") as f:
+        text = f.read()
+    path = tmp_path / "crlf.txt"
+    path.write_bytes(text.replace("\n", "\r\n").encode("utf-8"))
+    expected = legacy_parse_legal_text(SOURCE_FILE)
+    assert list(iter_legal_articles(str(path), use_mmap=True, include_offsets=False, block_size=64)) == expected
+    assert parse_legal_text(str(path)) == expected
+
+
+def test_offsets_point_at_each_article_in_the_source():
+    with open(SOURCE_FILE, "r", encoding="utf-8") as f:
+        text = f.read()
+    for article in iter_legal_articles(SOURCE_FILE, block_size=256):
+        span = text[article["char_start"]:article["char_end"]]
+        assert span.startswith(article["article_number"])
+        assert span.endswith(article["text"][-20:])
+
+
+def test_a_missing_file_parses_to_nothing(tmp_path):
+    assert parse_legal_text(str(tmp_path / "missing.txt")) == []
@@ -0,0 +1,91 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from lexical_index import BM25Index, reciprocal_rank_fusion, stem, tokenize
+from retrieval import fuse_results
+
+TEXTS = [
+    "Kiracı kira bedelini her ay ödemekle yükümlüdür.",
+    "Kiraya veren kiralananı kiracıya teslim etmekle yükümlüdür.",
+    "Kiracının ödeyeceği güvence bedeli üç aylık kira bedelini aşamaz.",
+    "Konut kiralarında kira bedeli artışı tüketici fiyat endeksini geçemez.",
+    "Tahliye taahhüdü yazılı olmalıdır.",
+]
+IDS = [f"MADDE {number}" for number in (313, 301, 342, 344, 352)]
+
+
+def reference_bm25(query_text: str, k1: float = 1.5, b: float = 0.75) -> dict[str, float]:
+    """Okapi BM25 term by term, straight from the formula"""
+    documents = [Counter(tokenize(text)) for text in TEXTS]
+    lengths = [sum(counts.values()) for counts in documents]
+    average_length = sum(lengths) / len(lengths)
+    scores = {}
+    for doc_id, counts, length in zip(IDS, documents, lengths):
+        score = 0.0
+        for term in set(tokenize(query_text)):
+            tf = counts[term]
+            if not tf:
+                continue
+            df = sum(1 for other in documents if term in other)
+            idf = math.log(1 + (len(documents) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average_length))
+        if score > 0:
+            scores[doc_id] = score
+    return scores
+
+
+@pytest.mark.parametrize("query", ["kira bedeli", "kiracının yükümlülüğü", "tahliye taahhüdü", "güvence bedeli artışı"])
+def test_scores_match_the_bm25_formula(query):
+    results = BM25Index.build(IDS, TEXTS).search(query, top_k=10)
+    expected = reference_bm25(query)
+    assert dict(results) == pytest.approx(expected, rel=1e-5)
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+
+def test_search_returns_at_most_top_k_matching_documents():
+    index = BM25Index.build(IDS, TEXTS)
+    assert len(index.search("kira", top_k=2)) == 2
+    assert index.search("sözcük bulunmuyor", top_k=5) == []
+
+
+def test_inflected_forms_share_a_stem():
+    assert stem("kiracının") == stem("kiracıya") == stem("kiracı")
+    assert "ve" not in tokenize("kiracı ve kiraya veren")
+
+
+def test_postings_round_trip_through_memory_mapped_files(tmp_path):
+    index = BM25Index.build(IDS, TEXTS)
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert isinstance(loaded.weights, np.memmap)
+    assert loaded.search("kira bedeli", 5) == index.search("kira bedeli", 5)
+    matches = loaded.term_matches([stem("tahliye"), "yok"], ["MADDE 352", "MADDE 313", "unknown"])
+    assert matches.tolist() == [[True, False], [False, False], [False, False]]
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["b", "a", "d", "c"]
+    assert dict(fused)["b"] == pytest.approx(1 / 62 + 1 / 61)
+
+
+def test_fused_results_are_deduplicated_and_fetch_lexical_only_documents():
+    vector_hits = [{"id": "a", "document": "A", "metadata": {}, "score": 0.9},
+                   {"id": "b", "document": "B", "metadata": {}, "score": 0.8}]
+    lexical_hits = [("b", 7.0), ("c", 3.0)]
+    fetched = []
+
+    def fetch(ids):
+        fetched.extend(ids)
+        return [{"id": doc_id, "document": doc_id.upper(), "metadata": {}} for doc_id in ids]
+
+    results = fuse_results(vector_hits, lexical_hits, top_k=10, fetch=fetch)
+    assert [doc["id"] for doc in results] == ["b", "a", "c"]
+    assert fetched == ["c"]
+    assert results[0]["vector_rank"] == 1 and results[0]["lexical_rank"] == 0
+    assert results[0]["lexical_score"] == 7.0
+    assert "vector_rank" not in results[2]
+    assert "fusion_score" not in vector_hits[1]  # the inputs are not modified
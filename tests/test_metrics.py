@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from metrics import REGISTRY, Counter, Histogram, Registry
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+WORKER = """
+import sys
+from metrics import REGISTRY, Counter, Gauge
+served = Counter("test_served_total", "Requests served", ["route"])
+in_flight = Gauge("test_in_flight", "Requests in flight", multiprocess_mode="livesum")
+REGISTRY.mirror(served, int(sys.argv[1]), route="/query")
+in_flight.set(1)
+"""
+
+SCRAPE = """
+import sys
+from metrics import REGISTRY, Counter, Gauge
+Counter("test_served_total", "Requests served", ["route"])
+Gauge("test_in_flight", "Requests in flight", multiprocess_mode="livesum")
+REGISTRY.mark_process_dead(int(sys.argv[1]))
+sys.stdout.write(REGISTRY.render().decode())
+"""
+
+
+def sample(text: str, name: str) -> float:
+    return next(float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith(name))
+
+
+def test_mirrored_totals_become_increments():
+    registry = Registry()
+    lookups = Counter("test_mirror_lookups_total", "Lookups", ["result"])
+    registry.mirror(lookups, 5, result="hit")
+    registry.mirror(lookups, 8, result="hit")
+    assert lookups.labels(result="hit")._value.get() == 8
+    registry.mirror(lookups, 2, result="hit")  # the component was reset and counted 2 since
+    assert lookups.labels(result="hit")._value.get() == 10
+
+
+def test_render_runs_the_collect_hooks():
+    swaps = Counter("test_render_swaps_total", "Index swaps")
+    stage = Histogram("test_render_stage_seconds", "Stage latency", ["stage"])
+    stage.labels(stage="embed").observe(0.02)
+    REGISTRY.on_collect(lambda: REGISTRY.mirror(swaps, 3))
+    text = REGISTRY.render().decode()
+    assert "test_render_swaps_total 3.0" in text
+    assert 'test_render_stage_seconds_bucket{le="0.025",stage="embed"} 1.0' in text
+
+
+def test_workers_are_summed_in_multiprocess_mode(tmp_path):
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path), "PYTHONPATH": str(REPO_ROOT)}
+    workers = [subprocess.Popen([sys.executable, "-c", WORKER, str(served)], env=env) for served in (4, 7)]
+    for worker in workers:
+        assert worker.wait(timeout=30) == 0
+    scrape = subprocess.run([sys.executable, "-c", SCRAPE, str(workers[0].pid)],
+                            env=env, capture_output=True, text=True, check=True, timeout=30)
+    assert sample(scrape.stdout, 'test_served_total{route="/query"}') == 11
+    # The first worker is marked dead, so only the second one's in-flight request is left
+    assert sample(scrape.stdout, "test_in_flight") == 1
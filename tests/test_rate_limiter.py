@@ -0,0 +1,67 @@
+import sqlite3
+
+import pytest
+
+from rate_limiter import MemoryRateLimitStore, RateLimiter, SQLiteRateLimitStore, gcra_step
+
+
+def test_gcra_allows_a_burst_up_to_capacity_then_rejects():
+    tat, now = None, 100.0
+    for _ in range(3):
+        allowed, tat, _ = gcra_step(tat, now, interval=1.0, capacity=3.0)
+        assert allowed
+    allowed, rejected_tat, retry_after = gcra_step(tat, now, interval=1.0, capacity=3.0)
+    assert not allowed
+    assert rejected_tat == tat  # a rejection spends nothing
+    assert retry_after == pytest.approx(1.0)
+
+
+def test_gcra_refills_evenly():
+    _, tat, _ = gcra_step(None, 0.0, interval=1.0, capacity=2.0)
+    _, tat, _ = gcra_step(tat, 0.0, interval=1.0, capacity=2.0)
+    assert not gcra_step(tat, 0.5, interval=1.0, capacity=2.0)[0]
+    assert gcra_step(tat, 1.0, interval=1.0, capacity=2.0)[0]
+
+
+def test_idle_keys_are_evicted_from_the_memory_store():
+    store = MemoryRateLimitStore()
+    store.acquire("a", 0.0, 1.0, 10.0)
+    store.acquire("b", 5.0, 1.0, 10.0)
+    assert store.size() == 1  # "a" refilled completely by t=5 and was dropped
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_limiter_rejects_past_the_limit(tmp_path, backend):
+    store = MemoryRateLimitStore() if backend == "memory" else SQLiteRateLimitStore(str(tmp_path / "rl.sqlite3"))
+    limiter = RateLimiter(limit=2, window=60, store=store)
+    assert limiter.check("ip:1")[0]
+    assert limiter.check("ip:1")[0]
+    allowed, retry_after = limiter.check("ip:1")
+    assert not allowed and retry_after > 0
+    assert limiter.check("ip:2")[0]
+    assert limiter.stats()["rejected"] == 1
+    store.close()
+
+
+def test_sqlite_store_gives_up_quickly_when_locked(tmp_path):
+    path = str(tmp_path / "rl.sqlite3")
+    store = SQLiteRateLimitStore(path, busy_timeout=0.01)
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            store.acquire("ip:1", 0.0, 1.0, 10.0)
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+    assert store.acquire("ip:1", 0.0, 1.0, 10.0)[0]
+    store.close()
+
+
+def test_cost_spends_several_requests_at_once():
+    limiter = RateLimiter(limit=10, window=60, store=MemoryRateLimitStore())
+    assert limiter.check("key:a", cost=8)[0]
+    allowed, retry_after = limiter.check("key:a", cost=3)
+    assert not allowed and retry_after == pytest.approx(6.0, abs=0.1)
+    assert limiter.check("key:a", cost=2)[0]
+    assert not limiter.check("key:b", cost=11)[0]
@@ -0,0 +1,31 @@
+import numpy as np
+
+from reranker import fit_logistic, select_documents
+
+
+def scored(*scores: float) -> list[dict]:
+    return [{"id": str(position), "rerank_score": score} for position, score in enumerate(scores)]
+
+
+def test_the_best_document_is_kept_whatever_its_score():
+    assert [doc["id"] for doc in select_documents(scored(0.05, 0.01), 2, min_score=0.2)] == ["0"]
+
+
+def test_later_documents_need_the_minimum_score():
+    assert [doc["id"] for doc in select_documents(scored(0.9, 0.1, 0.5), 3, min_score=0.2)] == ["0", "2"]
+
+
+def test_at_most_max_documents_are_selected():
+    assert len(select_documents(scored(0.9, 0.8, 0.7), 2, min_score=0.0)) == 2
+
+
+def test_unscored_documents_are_kept():
+    docs = [{"id": "0"}, {"id": "1"}]
+    assert select_documents(docs, 2, min_score=0.5) == docs
+
+
+def test_fit_logistic_separates_the_labels():
+    features = np.array([[0.0], [0.2], [0.8], [1.0]])
+    weights, bias = fit_logistic(features, np.array([0.0, 0.0, 1.0, 1.0]))
+    probabilities = 1.0 / (1.0 + np.exp(-(features @ weights + bias)))
+    assert list(probabilities > 0.5) == [False, False, True, True]
@@ -0,0 +1,79 @@
+import pytest
+
+from routing import DEFAULT_POLICY, RoutingPolicy, query_signals
+
+MODELS = {"fast": "fast-model", "default": "default-model", "strong": "strong-model"}
+
+
+def fused(article: str, vector_rank: int | None, lexical_score: float | None, fusion_score: float) -> dict:
+    """A hybrid result as fuse_results leaves it (reranker off)"""
+    doc = {"id": article, "metadata": {"article_number": article}, "fusion_score": fusion_score}
+    if vector_rank is not None:
+        doc["vector_rank"] = vector_rank
+    if lexical_score is not None:
+        doc["lexical_score"] = lexical_score
+    return doc
+
+
+def reranked(article: str, rerank_score: float) -> dict:
+    return {"id": article, "metadata": {"article_number": article}, "rerank_score": rerank_score}
+
+
+@pytest.fixture
+def policy():
+    return RoutingPolicy(DEFAULT_POLICY, MODELS)
+
+
+def test_fused_scores_are_compared_on_their_bm25_scores():
+    # RRF scores of the two sources are 0.016 apart; their BM25 scores are not
+    docs = [fused("342", 0, 10.0, 0.0328), fused("344", 1, 2.0, 0.0323)]
+    assert query_signals("Güvence bedeli bankaya nasıl yatırılır?", docs)["score_gap"] == 0.8
+
+
+def test_no_gap_when_the_searches_disagree_on_the_best_source():
+    docs = [fused("345", 2, 8.0, 0.0328), fused("347", 0, 1.0, 0.0323)]
+    assert query_signals("Kira artışı ne kadar olabilir?", docs)["score_gap"] == 0.0
+
+
+def test_vector_scores_are_used_when_bm25_matched_nothing():
+    docs = [fused("352", 0, None, 0.0164), fused("355", 1, None, 0.0161)]
+    docs[0]["score"], docs[1]["score"] = 0.9, 0.3
+    signals = query_signals("Tahliye taahhüdü nedir?", docs)
+    assert (signals["score_gap"], signals["articles"]) == (pytest.approx(0.6667), 1)
+
+
+@pytest.mark.parametrize("query, docs, tier", [
+    ("Güvence bedeli bankaya nasıl yatırılır?",
+     [fused("342", 0, 10.0, 0.0328), fused("344", 1, 2.0, 0.0323), fused("347", 3, 1.0, 0.0315)],
+     "simple"),
+    ("Kiracı kiralananı başkasına kiralayabilir mi?",
+     [fused("355", 0, 5.0, 0.0328), fused("352", 1, 2.8, 0.0323)],
+     "standard"),
+    ("Kira artışı ne kadar olabilir?",
+     [fused("345", 0, 3.0, 0.0328), fused("347", 1, 2.9, 0.0323), fused("352", 2, 2.5, 0.0318),
+      fused("346", 3, 2.0, 0.0313)],
+     "complex"),
+])
+def test_every_tier_is_reachable_with_hybrid_scores(policy, query, docs, tier):
+    assert policy.route(query, docs)["tier"] == tier
+
+
+@pytest.mark.parametrize("query, docs, tier", [
+    ("Güvence bedeli bankaya nasıl yatırılır?", [reranked("342", 0.9), reranked("344", 0.2)], "simple"),
+    ("Kiracı kiralananı başkasına kiralayabilir mi?", [reranked("355", 0.8), reranked("352", 0.7)], "standard"),
+    ("Madde 344, 345 ve 347 birlikte nasıl uygulanır?",
+     [reranked("344", 0.6), reranked("345", 0.6), reranked("347", 0.5)], "complex"),
+])
+def test_every_tier_is_reachable_with_rerank_scores(policy, query, docs, tier):
+    assert policy.route(query, docs)["tier"] == tier
+
+
+def test_a_route_names_the_configured_model_and_limits(policy):
+    route = policy.route("Güvence bedeli bankaya nasıl yatırılır?", [reranked("342", 0.9)])
+    assert (route["model"], route["top_k"], route["max_tokens"]) == ("fast-model", 1, 400)
+
+
+def test_the_last_tier_must_be_unconditional():
+    with pytest.raises(ValueError):
+        RoutingPolicy([{"name": "only", "max_query_tokens": 5, "top_k": 1, "max_tokens": 100, "model": "fast"}],
+                      MODELS)
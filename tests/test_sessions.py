@@ -0,0 +1,49 @@
+import pytest
+
+from sessions import ConversationMemory, MemorySessionStore, SQLiteSessionStore, is_followup
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = MemorySessionStore() if request.param == "memory" else SQLiteSessionStore(str(tmp_path / "s.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_a_recorded_turn_is_resumed(store):
+    memory = ConversationMemory(store)
+    session_id, state = memory.load(None)
+    assert state == ConversationMemory.empty_state()
+    assert store.size() == 0  # opening a session writes nothing until a turn is recorded
+    memory.record_turn(session_id, "Kira artışı ne kadar olabilir?", "TÜFE oranında.", ["344"])
+    resumed_id, state = memory.load(session_id)
+    assert resumed_id == session_id
+    assert state["articles"] == ["344"]
+    assert "TÜFE" in memory.history(state)
+
+
+def test_an_expired_session_starts_a_new_one(store):
+    memory = ConversationMemory(store, ttl_seconds=-1)
+    session_id, _ = memory.load(None)
+    memory.record_turn(session_id, "Soru", "Cevap", [])
+    new_id, state = memory.load(session_id)
+    assert new_id != session_id
+    assert state == ConversationMemory.empty_state()
+    assert memory.expired == 1
+
+
+def test_old_turns_fold_into_a_bounded_summary(store):
+    memory = ConversationMemory(store, recent_turns=2, history_token_budget=300, summary_token_budget=100)
+    session_id, _ = memory.load(None)
+    for turn in range(10):
+        memory.record_turn(session_id, f"Soru {turn} " + "kira " * 30, "Cevap " + "madde " * 80, [str(300 + turn)])
+    _, state = memory.load(session_id)
+    assert len(state["turns"]) == 2
+    assert state["summary"]
+    assert sum(tokens for _, tokens in state["summary"]) <= 100
+
+
+def test_followups_are_detected():
+    assert is_followup("Peki işyeri için de geçerli mi?")
+    assert is_followup("Bunun süresi ne kadar?")
+    assert not is_followup("Kira artışı ne kadar olabilir?")
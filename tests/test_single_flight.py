@@ -0,0 +1,110 @@
+import asyncio
+
+from single_flight import SingleFlight, StreamingSingleFlight
+
+
+def test_concurrent_calls_share_one_computation():
+    async def scenario():
+        flight, calls = SingleFlight(), []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.run("k", compute) for _ in range(3)))
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ["answer"] * 3
+    assert sorted(shared for _, shared in results) == [False, True, True]
+    assert flight.stats() == {"in_flight": 0, "started": 1, "joined": 2}
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_work():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return "answer"
+
+        first = asyncio.ensure_future(flight.run("k", compute))
+        second = asyncio.ensure_future(flight.run("k", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        return await second
+
+    assert asyncio.run(scenario()) == ("answer", True)
+
+
+async def collect(stream):
+    return [item async for item in stream]
+
+
+def test_late_subscribers_replay_earlier_items():
+    async def scenario():
+        flight = StreamingSingleFlight()
+        step = asyncio.Event()
+
+        async def produce():
+            yield 1
+            await step.wait()
+            yield 2
+
+        first = asyncio.ensure_future(collect(flight.subscribe("k", produce)))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(collect(flight.subscribe("k", produce)))
+        await asyncio.sleep(0)
+        step.set()
+        return flight, await first, await second
+
+    flight, first, second = asyncio.run(scenario())
+    assert first == second == [1, 2]
+    assert flight.stats() == {"in_flight": 0, "started": 1, "joined": 1}
+
+
+def test_the_key_is_released_as_soon_as_the_last_subscriber_leaves():
+    async def scenario():
+        flight = StreamingSingleFlight()
+        producers = []
+
+        async def produce():
+            producers.append(1)
+            yield len(producers)
+            await asyncio.sleep(0)  # the last subscriber leaves while the producer is here
+            yield "late"
+
+        stream = flight.subscribe("k", produce)
+        assert await stream.__anext__() == 1
+        await stream.aclose()
+        # The cancelled producer has not unwound yet; a new subscriber must not join it
+        return await collect(flight.subscribe("k", produce)), producers
+
+    items, producers = asyncio.run(scenario())
+    assert items == [2, "late"]
+    assert len(producers) == 2
+
+
+def test_a_cancelled_producer_ends_its_subscribers_with_the_cancelled_item():
+    async def scenario():
+        flight = StreamingSingleFlight(cancelled_item="cancelled")
+        started = asyncio.Event()
+
+        async def produce():
+            yield "first"
+            started.set()
+            await asyncio.Event().wait()
+            yield "never"
+
+        reader = asyncio.ensure_future(collect(flight.subscribe("k", produce)))
+        await started.wait()
+        next(iter(flight._in_flight.values())).task.cancel()  # e.g. shutdown
+        return flight, await asyncio.wait_for(reader, timeout=1)
+
+    flight, items = asyncio.run(scenario())
+    assert items == ["first", "cancelled"]
+    assert flight.stats()["in_flight"] == 0
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from vector_index import StringTable, VectorIndex, normalize_rows
+
+
+def build_index(embeddings) -> VectorIndex:
+    count = len(embeddings)
+    return VectorIndex.build(
+        embeddings,
+        [f"doc-{i}" for i in range(count)],
+        [f"Madde {i} metni, ğüşıöç" for i in range(count)],
+        [{"article_number": str(300 + i)} for i in range(count)]
+    )
+
+
+def brute_force(embeddings, queries, k: int):
+    scores = normalize_rows(queries) @ normalize_rows(embeddings).T
+    return np.sort(scores, axis=1)[:, ::-1][:, :k], scores
+
+
+def test_top_k_matches_a_brute_force_ranking():
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(50, 16))
+    queries = rng.normal(size=(7, 16))
+    positions, scores = build_index(embeddings).top_k(queries, 5)
+    expected_scores, all_scores = brute_force(embeddings, queries, 5)
+    assert positions.shape == scores.shape == (7, 5)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+    np.testing.assert_array_equal(positions, np.argsort(-all_scores, axis=1)[:, :5])
+
+
+def test_a_single_query_vector_is_a_batch_of_one():
+    embeddings = np.eye(4)
+    positions, scores = build_index(embeddings).top_k([0.0, 0.0, 2.0, 0.0], 1)
+    assert positions.tolist() == [[2]]
+    assert scores[0, 0] == pytest.approx(1.0)
+
+
+def test_tied_scores_return_the_tied_documents():
+    embeddings = np.array([[1.0, 0.0], [1.0, 0.0], [1.0, 0.0], [0.0, 1.0]])
+    positions, scores = build_index(embeddings).top_k([[1.0, 0.0]], 2)
+    assert set(positions[0].tolist()) <= {0, 1, 2}
+    np.testing.assert_allclose(scores[0], [1.0, 1.0], rtol=1e-6)
+
+
+def test_k_larger_than_the_corpus_returns_every_document_in_order():
+    embeddings = np.array([[1.0, 0.0], [0.6, 0.8], [0.0, 1.0]])
+    positions, scores = build_index(embeddings).top_k([[1.0, 0.0]], 10)
+    assert positions.tolist() == [[0, 1, 2]]
+    assert list(scores[0]) == sorted(scores[0], reverse=True)
+
+
+def test_k_of_zero_and_wrong_dimensions():
+    index = build_index(np.eye(3))
+    positions, scores = index.top_k([[1.0, 0.0, 0.0]], 0)
+    assert positions.shape == scores.shape == (1, 0)
+    with pytest.raises(ValueError):
+        index.top_k([[1.0, 0.0]], 1)
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_round_trip_through_the_files(tmp_path, mmap):
+    rng = np.random.default_rng(1)
+    embeddings = rng.normal(size=(20, 8))
+    index = build_index(embeddings)
+    index.save(str(tmp_path))
+    loaded = VectorIndex.load(str(tmp_path), mmap=mmap)
+    assert isinstance(loaded.embeddings, np.memmap) == mmap
+    np.testing.assert_array_equal(np.asarray(loaded.embeddings), index.embeddings)
+    assert loaded.ids == index.ids
+    assert list(loaded.documents) == list(index.documents)
+    assert list(loaded.metadatas) == list(index.metadatas)
+    queries = rng.normal(size=(3, 8))
+    assert loaded.search(queries, 4) == index.search(queries, 4)
+    assert loaded.get(["doc-3", "missing"]) == [index.record(3)]
+
+
+def test_an_empty_string_table_round_trips(tmp_path):
+    StringTable.save(str(tmp_path), "empty", ["", ""])
+    table = StringTable.load(str(tmp_path), "empty")
+    assert list(table) == ["", ""]
+    with pytest.raises(IndexError):
+        table[2]
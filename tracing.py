@@ -0,0 +1,123 @@
+import contextvars
+import cProfile
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from metrics import Histogram
+
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds", "Time spent in each stage of answering a query", ["stage"])
+
+_current_trace = contextvars.ContextVar("request_trace", default=None)
+# cProfile hooks the whole thread, so only one request on the event loop is profiled at a time
+_profile_lock = threading.Lock()
+
+
+class RequestTrace:
+    """
+    Stage timings of one request (for its Server-Timing header) and, when
+    profiling was asked for, cProfile data from every thread that worked on it.
+    """
+
+    def __init__(self, profile: bool = False):
+        self.stages = {}  # stage -> seconds, in the order the stages first ran
+        self.profile = profile
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        with self._lock:
+            return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items())
+
+    @contextmanager
+    def profiled(self):
+        """Profile the calling thread for the duration of the block, if this trace is profiled"""
+        if not self.profile:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                self.profiles.append(profiler)
+
+    def dump_profile(self, directory: str, name: str) -> str | None:
+        """
+        Merge the collected profiles into one pstats file (readable by pstats,
+        snakeviz, or flameprof/gprof2dot for a flame graph); returns its path
+        """
+        with self._lock:
+            profiles = list(self.profiles)
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profiler in profiles[1:]:
+            stats.add(profiler)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}.prof")
+        stats.dump_stats(path)
+        return path
+
+
+@contextmanager
+def start_trace(profile: bool = False):
+    """Trace the current request; spans and threads started through bind_context report to it"""
+    # Profiling needs the event loop thread to itself; a concurrent profiled request is only timed
+    profiling = profile and _profile_lock.acquire(blocking=False)
+    trace = RequestTrace(profile=profiling)
+    token = _current_trace.set(trace)
+    try:
+        with trace.profiled():
+            yield trace
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            pass  # ended from another context (a streamed body closed late), where it was never set
+        if profiling:
+            _profile_lock.release()
+
+
+def current_trace() -> RequestTrace | None:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage: str):
+    """Time a stage: observed in the stage histogram and added to the current request's trace"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=stage).observe(elapsed)
+        trace = _current_trace.get()
+        if trace:
+            trace.add(stage, elapsed)
+
+
+def bind_context(func, *args):
+    """
+    Wrap func(*args) to run in another thread (e.g. an executor) inside the
+    current context, so its spans join this request's trace and it is
+    profiled along with the request.
+    """
+    context = contextvars.copy_context()
+
+    def call():
+        trace = context.get(_current_trace)
+        with trace.profiled() if trace else nullcontext():
+            return context.run(func, *args)
+
+    return call
@@ -0,0 +1,162 @@
+import json
+import mmap
+import os
+from collections.abc import Sequence
+
+import numpy as np
+
+
+EMBEDDINGS_FILE = "embeddings.npy"
+IDS_FILE = "ids.json"
+# Each string table is <name>.bin (UTF-8 blob) plus <name>.offsets.npy
+DOCUMENTS_TABLE = "documents"
+METADATAS_TABLE = "metadatas"
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length so a dot product is the cosine similarity"""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class StringTable(Sequence):
+    """
+    Read-only sequence of strings stored as one UTF-8 blob plus an offsets
+    array, both memory-mapped. Items are decoded only when accessed, so the
+    text stays in the shared page cache instead of each process's heap.
+    """
+
+    def __init__(self, blob, offsets: np.ndarray, decode=None):
+        self._blob = blob
+        self._offsets = offsets
+        self._decode = decode
+
+    @staticmethod
+    def save(path: str, name: str, items, encode=None):
+        offsets = [0]
+        with open(os.path.join(path, f"{name}.bin"), "wb") as f:
+            for item in items:
+                data = (encode(item) if encode else item).encode("utf-8")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        np.save(os.path.join(path, f"{name}.offsets.npy"), np.asarray(offsets, dtype=np.int64))
+
+    @classmethod
+    def load(cls, path: str, name: str, decode=None):
+        offsets = np.load(os.path.join(path, f"{name}.offsets.npy"), mmap_mode="r")
+        with open(os.path.join(path, f"{name}.bin"), "rb") as f:
+            # Zero-length files cannot be mapped; the mapping outlives the file handle
+            blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if offsets[-1] else b""
+        return cls(blob, offsets, decode)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("string table index out of range")
+        text = self._blob[self._offsets[position]:self._offsets[position + 1]].decode("utf-8")
+        return self._decode(text) if self._decode else text
+
+
+class VectorIndex:
+    """
+    Exact in-process cosine search over a small corpus.
+
+    All article embeddings live in one contiguous float32 matrix with unit
+    rows, so top-k for a batch of queries is a single matrix product followed
+    by argpartition. The matrix, documents and metadata can be memory-mapped
+    straight from disk, so processes serving the same files share one copy.
+    """
+
+    def __init__(self, embeddings: np.ndarray, ids: list[str], documents: Sequence[str],
+                 metadatas: Sequence[dict]):
+        if len(ids) != embeddings.shape[0]:
+            raise ValueError(
+                f"Index has {embeddings.shape[0]} embeddings but {len(ids)} records")
+        self.embeddings = embeddings
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self._positions = {doc_id: i for i, doc_id in enumerate(ids)}
+
+    @classmethod
+    def build(cls, embeddings, ids: list[str], documents: list[str], metadatas: list[dict]):
+        return cls(normalize_rows(np.asarray(embeddings, dtype=np.float32)), ids, documents, metadatas)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r" if mmap else None)
+        with open(os.path.join(path, IDS_FILE), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        documents = StringTable.load(path, DOCUMENTS_TABLE)
+        metadatas = StringTable.load(path, METADATAS_TABLE, decode=json.loads)
+        if not mmap:
+            documents, metadatas = list(documents), list(metadatas)
+        return cls(embeddings, ids, documents, metadatas)
+
+    def save(self, path: str):
+        """Write the index files into `path`; callers make the directory visible atomically"""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, EMBEDDINGS_FILE), np.ascontiguousarray(self.embeddings))
+        with open(os.path.join(path, IDS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.ids, f, ensure_ascii=False)
+        StringTable.save(path, DOCUMENTS_TABLE, self.documents)
+        StringTable.save(path, METADATAS_TABLE, self.metadatas,
+                         encode=lambda metadata: json.dumps(metadata, ensure_ascii=False))
+
+    @property
+    def dimension(self) -> int:
+        return self.embeddings.shape[1]
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def top_k(self, query_embeddings, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return (positions, scores), each of shape (n_queries, k'), best first,
+        where k' = min(k, corpus size). Accepts one query vector or a batch.
+        """
+        queries = normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        if queries.shape[1] != self.dimension:
+            raise ValueError(
+                f"Query embedding has dimension {queries.shape[1]}, index expects {self.dimension}")
+        scores = queries @ self.embeddings.T
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            empty = np.empty((scores.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        if k < scores.shape[1]:
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        return (np.take_along_axis(candidates, order, axis=1),
+                np.take_along_axis(candidate_scores, order, axis=1))
+
+    def record(self, position: int, score: float | None = None) -> dict:
+        result = {
+            "id": self.ids[position],
+            "document": self.documents[position],
+            "metadata": self.metadatas[position]
+        }
+        if score is not None:
+            result["score"] = float(score)
+        return result
+
+    def search(self, query_embeddings, k: int) -> list[list[dict]]:
+        positions, scores = self.top_k(query_embeddings, k)
+        return [
+            [self.record(int(p), s) for p, s in zip(row_positions, row_scores)]
+            for row_positions, row_scores in zip(positions, scores)
+        ]
+
+    def get(self, ids: list[str]) -> list[dict]:
+        return [self.record(self._positions[doc_id]) for doc_id in ids if doc_id in self._positions]